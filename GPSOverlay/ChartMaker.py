@@ -9,6 +9,7 @@ from moviepy.editor import vfx
 from imageio import imread
 
 from .DefaultConfig import DefaultConfig
+from .simplify import lttb, index_map
 
 class ChartMaker(object):
 #TODO: This should actually create VideoClip or DataVideoClip and instead of
@@ -16,15 +17,20 @@ class ChartMaker(object):
 
 
     def __init__(self, gpx_data, wanted_value, figure_size, opacity=0.8,
-            transparent=True, dpi=96, y_lim=None):
+            transparent=True, dpi=96, y_lim=None, max_points=None):
         self.circle, self.radius = DefaultConfig._make_circle(6, (255,0,0))
         #self.circle = self.circle.set_opacity(opacity)
         self.width, self.height = figure_size
         self.opacity = opacity
         self.transparent = transparent
         #elevations = [getattr(gps_point, wanted_value) for gps_point in gpx_data]
-        idx = gpx_data.index_for[wanted_value]
-        elevations = [point[idx] for point in gpx_data.gpx]
+        elevations = gpx_data.track[gpx_data.column_for[wanted_value]]
+#Only max_points points (by default 2 per pixel) selected with LTTB are
+#plotted. Their x is still index of GPX point
+        if max_points is None:
+            max_points = 2*self.width
+        self.kept = lttb(np.arange(len(elevations)), elevations, max_points)
+        self.simplified_index = index_map(self.kept, len(elevations))
         self.fig, ax = plt.subplots()
         plt.axis("off")
         plt.subplots_adjust(top = 1, bottom = 0, right = 1, left = 0,
@@ -32,12 +38,13 @@ class ChartMaker(object):
         plt.margins(0, 0)
         if y_lim is not None:
             ax.set_ylim(*y_lim)
-        ax.fill_between(range(0,len(elevations)), 0, elevations,
+        ax.fill_between(self.kept, 0, elevations[self.kept],
                 color="#163c6277")
         #dpi = self.fig.get_dpi()
         self.fig.set_size_inches(self.width/dpi, self.height/dpi)
         self.fig.set_dpi(dpi)
-        self.p = ax.plot(elevations, '-g', alpha=self.opacity,
+        self.p = ax.plot(self.kept, elevations[self.kept], '-g',
+                alpha=self.opacity,
                 color="#3ca5c5AA")
 
         png_file = io.BytesIO()
@@ -68,10 +75,23 @@ class ChartMaker(object):
         self.xpix = xpix
         self.ele = elevations
 
+    def _pixel_at(self, index):
+        """Pixel of GPX point index on simplified line"""
+        index = index % len(self.simplified_index)
+        segment = self.simplified_index[index]
+        if segment == len(self.kept)-1:
+            return self.xpix[segment], self.ypix[segment]
+        start, end = self.kept[segment], self.kept[segment+1]
+        weight = (index-start)/(end-start)
+        return (self.xpix[segment]+(self.xpix[segment+1]-self.xpix[segment])*
+                weight, self.ypix[segment]+(self.ypix[segment+1]-
+                    self.ypix[segment])*weight)
+
     def make_chart_at(self, index):
         #self.p[0].set_markevery([index])
-        xcor = int(self.xpix[index])
-        ycor = int(self.ypix[index])+4
+        xpix, ypix = self._pixel_at(index)
+        xcor = int(xpix)
+        ycor = int(ypix)+4
         #print (self.ele[index], xcor, ycor)
 
         #print ("PREV:", self.im_mask[xcor:(self.radius+xcor),
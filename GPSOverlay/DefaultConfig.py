@@ -143,6 +143,18 @@ class DefaultConfig(object):
         default_value"""
         return default_value if input_value is None else input_value
 
+    @staticmethod
+    def _default_memo_key(func, memo_key):
+        """memo_key of default overlay func (None if custom func is used, so
+        exact input value is the key)"""
+        return memo_key if func is None else None
+
+    @staticmethod
+    def _rounded_args(args, digits):
+        """Arguments dict as sorted tuple with floats rounded to digits"""
+        return tuple(sorted((key, round(value, digits) if isinstance(value,
+            float) else value) for key, value in args.items()))
+
     def make_datetime_config(self, func=None, position=None, stroke_color=None,
             width=None, strftime="%d.%m.%Y %H:%M:%S"):
         how_many_configs = len(self.config.keys())
@@ -154,7 +166,9 @@ class DefaultConfig(object):
                     stroke_color=stroke_color)),
                 position=self._if_set(position,
                     self.default_position(how_many_configs, width)),
-                sample_value=datetime.datetime.now()
+                sample_value=datetime.datetime.now(),
+                memo_key=self._default_memo_key(func,
+                    lambda dt: dt.strftime(strftime))
                 ))
 
     def make_elevation_config(self, func=None, position=None,
@@ -167,7 +181,9 @@ class DefaultConfig(object):
                 position=self._if_set(position,
                     self.default_position(how_many_configs, width)),
                 config = config,
-                sample_value=42.24
+                sample_value=42.24,
+                memo_key=self._default_memo_key(func,
+                    lambda alt: text % (alt,))
                 ))
     def make_heart_config(self, func=None, position=None,
             config=None, stroke_color=None, width=None):
@@ -179,7 +195,9 @@ class DefaultConfig(object):
                 position=self._if_set(position,
                     self.default_position(how_many_configs, width)),
                 config=config,
-                sample_value=133
+                sample_value=133,
+                memo_key=self._default_memo_key(func,
+                    lambda heart: "%d BPM" % (heart,))
                 ))
     def make_bearing_config(self, func=None, position=None,
             config=None, stroke_color=None, width=None):
@@ -191,7 +209,9 @@ class DefaultConfig(object):
                 position = self._if_set(position,
                     self.default_position(how_many_configs, width)),
                 config=config,
-                sample_value=260
+                sample_value=260,
+                memo_key=self._default_memo_key(func,
+                    lambda bearing: "%3.1f °" % (bearing,))
                 ))
     def make_speed_config(self, func=None, position=None,
             config=None, stroke_color=None, width=None):
@@ -201,7 +221,8 @@ class DefaultConfig(object):
                 position = self._if_set(position,
                     self.default_position(how_many_configs, width)),
                 config=config,
-                sample_value=15.6
+                sample_value=15.6,
+                memo_key=self._default_memo_key(func, self.speed_text)
                 ))
     def make_slope_config(self, func=None, position=None,
             config=None, stroke_color=None, width=None):
@@ -213,14 +234,69 @@ class DefaultConfig(object):
                 position = self._if_set(position,
                     self.default_position(how_many_configs, width)),
                 config=config,
-                sample_value=-4.3
+                sample_value=-4.3,
+                memo_key=self._default_memo_key(func,
+                    lambda slope: "%d %%" % (slope,))
+                ))
+
+    def make_distance_config(self, func=None, position=None,
+            config=None, stroke_color=None, text="%.2f km", width=None):
+        how_many_configs = len(self.config.keys())
+        self.config["distance"].append( ConfigItem(
+                func = self._if_set(func, lambda distance: TextClipPIL(text %
+                    (distance/1000,), fontsize=self.normal_font_size,
+                    font=self.default_font, color='white',
+                    stroke_color=stroke_color)),
+                position = self._if_set(position,
+                    self.default_position(how_many_configs, width)),
+                config=config,
+                sample_value=12345.6,
+                memo_key=self._default_memo_key(func,
+                    lambda distance: text % (distance/1000,))
+                ))
+    def make_ascent_config(self, func=None, position=None,
+            config=None, stroke_color=None, text="%d m climbed", width=None):
+        how_many_configs = len(self.config.keys())
+        self.config["ascent"].append( ConfigItem(
+                func = self._if_set(func, lambda ascent: TextClipPIL(text %
+                    (ascent,), fontsize=self.normal_font_size,
+                    font=self.default_font, color='white',
+                    stroke_color=stroke_color)),
+                position = self._if_set(position,
+                    self.default_position(how_many_configs, width)),
+                config=config,
+                sample_value=864,
+                memo_key=self._default_memo_key(func,
+                    lambda ascent: text % (ascent,))
+                ))
+    def make_channel_config(self, key, func=None, position=None,
+            config=None, stroke_color=None, text="%.1f", width=None,
+            sample_value=90):
+        """Text overlay of GPX extension channel (cad, atemp, power...)
+
+        key is the name of the channel (see GPXData.channels)"""
+        how_many_configs = len(self.config.keys())
+        self.config[key].append( ConfigItem(
+                func = self._if_set(func, lambda value: TextClipPIL(text %
+                    (value,), fontsize=self.normal_font_size,
+                    font=self.default_font, color='white',
+                    stroke_color=stroke_color)),
+                position = self._if_set(position,
+                    self.default_position(how_many_configs, width)),
+                config=config,
+                sample_value=sample_value,
+                memo_key=self._default_memo_key(func,
+                    lambda value: text % (value,))
                 ))
 
     def make_map_config(self, map_width=250, map_height=250,
             map_zoom=16, map_mapfile=None, gpx_style=None,
             gpx_file=True, font_path=None, func=None, position=None, maps_cache=None,
             support_breaks=False, position_break_func=None,
-            angle_offset=None
+            angle_offset=None, metatile_size=None, rotate_raster=False,
+            position_quantum=None, angle_quantum=None, cache_backend='files',
+            cache_max_bytes=None, cache_encoding='zlib',
+            memory_cache_bytes=256*2**20, track_tolerance=None
             ):
         try:
             from .MapnikRenderer import MapnikRenderer
@@ -240,6 +316,15 @@ class DefaultConfig(object):
                 "gpx_file":"__gpx_file", #If true path to gpx file will be added when
                 "maps_cache":maps_cache,
                 "font_path":font_path,
+                "metatile_size":metatile_size,
+                "rotate_raster":rotate_raster,
+                "position_quantum":position_quantum,
+                "angle_quantum":angle_quantum,
+                "cache_backend":cache_backend,
+                "cache_max_bytes":cache_max_bytes,
+                "cache_encoding":cache_encoding,
+                "memory_cache_bytes":memory_cache_bytes,
+                "track_tolerance":track_tolerance,
                 "_support_breaks":support_breaks,
                 "_break_func": self._get_interpolation_functions,
                 #class is initialized
@@ -269,7 +354,9 @@ class DefaultConfig(object):
                 config=map_config,
                 sample_value= lambda clip, config:ColorClip((config["map_w"],
                     config["map_h"]), [125,35,0]),
-                position_break_func=break_position_func
+                position_break_func=break_position_func,
+                #Map name at position and angle quantized by renderer
+                memo_key="map_key"
                 ))
 
     def _get_interpolation_functions(self, start_value, end_value, break_type,
@@ -345,21 +432,28 @@ class DefaultConfig(object):
             return clip.set_pos(lambda z: (f_x(z), f_y(z)))
         
 
-    def make_chart_config(self, key, position, config, func=None):
+    def make_chart_config(self, key, position, config, func=None,
+            memo_key=None):
         if "wanted_value" not in config:
             config["wanted_value"] = key
         if "gpx_data" not in config:
             config["gpx_data"] = "__gpx_data"
         func = self._if_set(func, lambda c: c)
         ci = ChartConfigItem(position=position,
-                config=config, func=func)
+                config=config, func=func, memo_key=memo_key)
         self.config[key].append(ci)
 
-    def make_gauge_config(self, key, position, config, func=None):
+    def make_gauge_config(self, key, position, config, func=None,
+            memo_key=None):
+        """Gauge of gps_info key
+
+        Gauges with values which differ less than 0.1 are rendered once,
+        unless memo_key is given (see util.ConfigItem)"""
         config["_run_func"][1]["value"]="__gps_info:" + key
         func = self._if_set(func, lambda c: c)
         ci = GaugeConfigItem(position=position,
-                config=config, func=func)
+                config=config, func=func, memo_key=self._if_set(memo_key,
+                    lambda args: self._rounded_args(args, 1)))
         self.config[key].append(ci)
 
     def make_demo_clip(self, image=None):
@@ -389,11 +483,14 @@ class DefaultConfig(object):
 
 
 
-    def make_speed_clip(self, speed):
+    @staticmethod
+    def speed_text(speed):
         if speed*3.6 < 1:
-            txt = "STOPPED"
-        else:
-            txt = "%2.2f km/h" % (speed*3.6)
+            return "STOPPED"
+        return "%2.2f km/h" % (speed*3.6)
+
+    def make_speed_clip(self, speed):
+        txt = self.speed_text(speed)
         return TextClipPIL(txt,
             fontsize=self.large_font_size, font=self.default_font, color='white',
             stroke_color=None)
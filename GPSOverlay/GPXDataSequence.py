@@ -5,15 +5,20 @@ import collections
 import time
 import math
 import itertools
+import bisect
 from operator import itemgetter
 from collections import Counter
 
 #from moviepy.video.VideoClip import VideoClip
 from moviepy.video.io.ImageSequenceClip import ImageSequenceClip
 from moviepy.video.VideoClip import ImageClip, VideoClip
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
 
+import numpy as np
 from gpxpy import geo
 from .gpxdata import GPXData
+from .lib.geo import interpolate_many, EPOCH
+from .metrics import TRACK_METRICS
 from .util import make_func, BreakType, GPSData
 from .ImageSequenceClipDelay import ImageSequenceClipDelay
 
@@ -54,6 +59,8 @@ class GPXDataSequence(VideoClip):
 
     gpx_file
       - path to GPX filename with route
+      - or list of paths to GPX files of the same route from many devices
+        (see GPXData)
 
     time_offset
       - offset in seconds between image times and GPX. (It is assumed that GPX
@@ -70,6 +77,21 @@ class GPXDataSequence(VideoClip):
       If True it is calculated for each data clip how much time it took to
       create clips for each frame. This is shown in str method of this class.
 
+    timeline_fps
+      If set, GPS data, image index and breaks are calculated for all frames
+      at this fps when clip is created (see make_timeline). Frames at those
+      times then only read one row from the timeline.
+
+    exif_workers
+      Number of parallel workers used to read EXIF of images. If None it is
+      number of CPUs.
+
+    overlay_memo_size
+      How many rendered overlay clips are kept in LRU memo. Each overlay
+      clip is keyed by quantized input of its ConfigItem (see
+      ConfigItem.memo_key), so frames which show the same text, gauge value,
+      chart index or map only blit the already rendered clip. 0 disables it.
+
     data_clips
       Dictionary, where key can be one of ['lat', 'lon', 'bearing',
       'elevation', 'speed', 'heart', 'datetime', 'map'] and value is a function which gets
@@ -96,7 +118,8 @@ class GPXDataSequence(VideoClip):
     def from_sequence_with_breaks(cls, sequence, fps=None, durations=None, with_mask=True,
             ismask=False, load_images=False, gpx_file=None, time_offset=0,
             interval=0, speedup_factor=24, config=None, max_image_delay=None,
-            calculate_stats=False):
+            calculate_stats=False, timeline_fps=None, exif_workers=None,
+            overlay_memo_size=256):
 
         if fps is not None:
             #It needs to be wanted FPS*image taken interval?
@@ -105,13 +128,20 @@ class GPXDataSequence(VideoClip):
         clip = ImageSequenceClipDelay(sequence, durations, with_mask, ismask,
                 load_images, speedup_factor, max_image_delay=max_image_delay)
         return cls(clip, gpx_file, time_offset, interval,
-                speedup_factor, None, config, calculate_stats=calculate_stats)
+                speedup_factor, None, config, calculate_stats=calculate_stats,
+                timeline_fps=timeline_fps, exif_workers=exif_workers,
+                overlay_memo_size=overlay_memo_size)
 
     def __init__(self, clip, gpx_file=None, time_offset=0,
             interval=0, speedup_factor=1, clip_start_time=None, config=None,
-            calculate_stats=False):
+            calculate_stats=False, timeline_fps=None, exif_workers=None,
+            overlay_memo_size=256):
 
         self.stats = Counter()
+        self.overlay_memo = collections.OrderedDict()
+        self.overlay_memo_size = overlay_memo_size
+        self.overlay_memo_hits = 0
+        self.overlay_memo_misses = 0
         self.calculate_stats = calculate_stats
         self.clip = clip
         duration = clip.duration
@@ -122,11 +152,15 @@ class GPXDataSequence(VideoClip):
             self.have_any_breaks = any((duration > (config.effect_length*2+2) for duration in
                 self.clip.durations))
             self.gpx_data = GPXData(sequence=self.clip.sequence,
-                    gpx_file=gpx_file,time_offset=time_offset)
+                    gpx_file=gpx_file,time_offset=time_offset,
+                    exif_workers=exif_workers)
             self.durations = self.clip.durations
             self.images_starts = self.clip.images_starts
-            self.find_image_index = lambda t: max([i for i in range(len(self.clip.sequence))
-                    if self.clip.images_starts[i]<=t])
+            self._starts_array = np.asarray(self.images_starts,
+                    dtype=np.float64)
+            self._starts_list = self._starts_array.tolist()
+            self._image_cursor = 0
+            self.find_image_index = self._find_image_index
         else:
             if speedup_factor != 1:
                 self.clip.old_make_frame = self.clip.make_frame
@@ -157,6 +191,172 @@ class GPXDataSequence(VideoClip):
                 print (key, "needs config")
                 key_config.init(vars(self))
 
+        self.break_table = None
+        if isinstance(clip, ImageSequenceClip) and self.have_any_breaks:
+            self.break_table = self.make_break_table()
+
+        self.timeline = None
+        self.timeline_fps = timeline_fps
+        if timeline_fps is not None and isinstance(clip, ImageSequenceClip):
+            self.timeline = self.make_timeline(timeline_fps)
+
+    def _find_image_index(self, t):
+        """Index of image shown at time t (last image which starts before t)
+
+        Frames are usually rendered with growing t, so image from previous
+        call and the next one are checked first. Otherwise image is found with
+        searchsorted over image starts.
+        """
+        starts = self._starts_list
+        cursor = self._image_cursor
+        if starts[cursor] <= t:
+            for index in (cursor, cursor+1):
+                if index+1 == len(starts) or t < starts[index+1]:
+                    self._image_cursor = index
+                    return index
+        index = int(np.searchsorted(self._starts_array, t, side='right'))-1
+        if index < 0:
+            raise ValueError("No image is shown at {}s".format(t))
+        self._image_cursor = index
+        return index
+
+    def make_break_table(self):
+        """Finds which images are last before a recording break
+
+        Break status of each image interval is found once for all images with
+        GPXData.are_breaks, so find_break only needs a lookup.
+
+        Returns
+        ------
+        dict
+            Arrays with one value per image: start and end (clip times when
+            image is shown and when next one is) and is_break. Last image is
+            never a break. Without GPX track there are no breaks.
+        """
+        starts = np.asarray(self.images_starts, dtype=np.float64)
+        ends = np.append(starts[1:], max(self.duration, starts[-1]))
+        is_break = np.zeros(len(starts), dtype=bool)
+        if len(starts) > 1 and self.gpx_data.track_index is not None:
+            is_break[:-1] = self.gpx_data.are_breaks(
+                    starts[:-1]*self.speedup_factor,
+                    starts[1:]*self.speedup_factor, self.config.effect_length,
+                    self.speedup_factor)
+        return {
+                'start': starts,
+                'end': ends,
+                'is_break': is_break,
+                }
+
+    def make_timeline(self, fps):
+        """Calculates everything make_frame needs for all frames at given fps
+
+        This is the same as calling find_image_index, find_break and make_gpx
+        for each frame, but GPS data for all frames is interpolated at once
+        with lib.geo.interpolate_many.
+
+        Returns
+        ------
+        dict
+            Struct of arrays with one row per frame: image_index, gpx_index,
+            break_type (BreakType value), time_in_break, end_break_time and
+            GPS fields (lat, lon, bearing, elevation, speed, heart, slope and
+            datetime in microseconds since epoch), derived track metrics
+            (see metrics.TrackMetrics) and extension channels of GPX track
+            (cad, atemp, power...)
+        """
+        effect_length = self.config.effect_length
+        times = np.arange(int(math.ceil(self.duration*fps)))/fps
+        starts = np.asarray(self.images_starts, dtype=np.float64)
+        image_count = len(starts)
+        index = np.searchsorted(starts, times, side='right')-1
+        time_in_break = times-starts[index]
+
+        #Break type for each frame (same as find_break)
+        break_type = np.full(len(times), BreakType.NO.value, dtype=np.int8)
+        if self.break_table is not None:
+            in_break = self.break_table['is_break'][index]
+            next_start = starts[np.minimum(index+1, image_count-1)]
+            is_start_break = time_in_break <= effect_length
+            is_end_break = next_start-times <= effect_length
+            break_type[in_break] = BreakType.MIDDLE.value
+            break_type[in_break & is_end_break] = BreakType.END.value
+            break_type[in_break & is_start_break] = BreakType.START.value
+            end_break_time = np.asarray(self.durations, dtype=np.float64)[index]
+        else:
+            end_break_time = np.full(len(times), np.nan)
+
+        #GPX time of each frame (same as make_gpx)
+        image_times = self.gpx_data.gpx_data.times
+        has_next = index+1 < image_count
+        next_index = np.where(has_next, index+1, index)
+        prev_index = np.where(has_next, index, index-1)
+        time_next = np.where(has_next, starts[next_index],
+                2*starts[index]-starts[prev_index])
+        dt_diff = image_times[next_index]-image_times[prev_index]
+        #Whole seconds of the timedelta without days, like timedelta.seconds
+        dt_diff_seconds = (dt_diff//10**6) % 86400
+        ratio = np.round(np.round(time_in_break/(time_next-starts[index])*10)+0.5)/10
+        gpx_times = image_times[index]+np.round(ratio*dt_diff_seconds*10**6)\
+                .astype(np.int64)
+
+        gps = interpolate_many(self.gpx_data.track_index, gpx_times)
+        slopes = self.gpx_data.gpx_data.columns['slope'].astype(np.float64)
+        timeline = {
+                'image_index': index,
+                'gpx_index': gps['index'],
+                'break_type': break_type,
+                'time_in_break': time_in_break,
+                'end_break_time': end_break_time,
+                'lat': gps['lat'],
+                'lon': gps['lon'],
+                'bearing': gps['bearing'] % 360,
+                'elevation': gps['elevation'],
+                'speed': gps['speed'],
+                'heart': gps['hr'],
+                'slope': slopes[index],
+                'datetime': gpx_times,
+                }
+        timeline.update(self.gpx_data.metrics.at_times(gpx_times))
+        for name in self.gpx_data.channels:
+            timeline[name] = gps[name]
+        return timeline
+
+    def _timeline_row(self, t):
+        """Returns row in timeline for time t or None if t isn't a frame time"""
+        if self.timeline is None:
+            return None
+        row = int(round(t*self.timeline_fps))
+        if row < 0 or row >= len(self.timeline['image_index']) or \
+                abs(row/self.timeline_fps-t) > 1e-6:
+            return None
+        return row
+
+    def _frame_state_from_timeline(self, row):
+        """Image index, break and GPS info for frame from timeline row
+
+        Returns same values make_frame gets from find_image_index, find_break
+        and make_gpx
+        """
+        timeline = self.timeline
+        index = int(timeline['image_index'][row])
+        break_video = BreakType(int(timeline['break_type'][row]))
+        end_break_time = timeline['end_break_time'][row]
+        end_break_time = None if np.isnan(end_break_time) else \
+                float(end_break_time)
+        def value(key):
+            v = float(timeline[key][row])
+            return None if math.isnan(v) else v
+        gps_info = GPSData(value('lat'), value('lon'), value('bearing'),
+                value('elevation'), value('speed'), value('heart'),
+                EPOCH+datetime.timedelta(microseconds=int(timeline['datetime'][row])),
+                None, value('slope'), 0)._asdict()
+        for key in TRACK_METRICS:
+            gps_info[key] = value(key)
+        for key in self.gpx_data.channels:
+            gps_info[key] = value(key)
+        return index, break_video, end_break_time, gps_info, \
+                int(timeline['gpx_index'][row])
+
 
     def get_index(self, t):
         index = self.find_image_index(t)
@@ -214,31 +414,38 @@ class GPXDataSequence(VideoClip):
     def make_frame(self, t):
         #start = time.time()
         f = self.clip.make_frame(t)
-        index = self.find_image_index(t)
-        time_start = t*self.speedup_factor
-        break_video, end_break_time = self.find_break(index, t,
-                self.config.effect_length)
+        row = self._timeline_row(t)
+        if row is not None:
+            index, break_video, end_break_time, gps_info, gpx_index = \
+                    self._frame_state_from_timeline(row)
+        else:
+            index = self.find_image_index(t)
+            time_start = t*self.speedup_factor
+            break_video, end_break_time = self.find_break(index, t,
+                    self.config.effect_length)
+            #Prev
+            #gps_info, gpx_index = self.gpx_data.get_geo_at(index, time_start)
+            gps_info, gpx_index = self.make_gpx(t, index)
+            #print ("GPS INFO, index:", gps_info, gpx_index, t, from_start,
+                    #from_start/time_diff)
+            #print ("FROM START",from_start)
+            gps_info = gps_info._asdict()
+            gps_info.update(self.gpx_data.metrics_at(gpx_index,
+                gps_info['datetime']))
+            gps_info.update(self.gpx_data.channels_at(gpx_index,
+                gps_info['datetime']))
         #kinda hackishly change image at break end so that end picture is shown
         #not picture before the break
         if break_video == BreakType.END:
             f = self.clip.make_frame(self.clip.images_starts[index+1])
 
-
-        #Prev
-        #gps_info, gpx_index = self.gpx_data.get_geo_at(index, time_start)
-        gps_info, gpx_index = self.make_gpx(t, index)
-        #print ("GPS INFO, index:", gps_info, gpx_index, t, from_start,
-                #from_start/time_diff)
-        #print ("FROM START",from_start)
-        gps_info = gps_info._asdict()
         #print (gps_info, self.data_clips)
 # For each wanted datafield make clip and set position
         for key, key_config in self.config.make_items():
             if self.calculate_stats:
                 start_key = time.time()
-            c = key_config.get_clip(key, gps_info, gpx_index, self.w,
-                    self.h, break_video, end_break_time,
-                    t-self.images_starts[index])
+            c = self._overlay_clip(key, key_config, gps_info, gpx_index,
+                    break_video, end_break_time, t-self.images_starts[index])
             if self.calculate_stats:
                 self.stats[key]+=time.time()-start_key
             #print(self.stats)
@@ -252,23 +459,69 @@ class GPXDataSequence(VideoClip):
         #print ("%f, %s, Rendering took %r s" % (t, break_video.name, time.time()-start,))
         return f
 
+    def _overlay_clip(self, key, key_config, gps_info, gpx_index, break_video,
+            end_break_time, time_in_break):
+        """Clip of one overlay, reused from overlay_memo if it was already
+        rendered for the same quantized input
+
+        Memoized clips are flattened to one RGBA image with its position, so
+        reusing them only costs blitting.
+        """
+        run_args = key_config.run_args(key, gps_info, gpx_index, break_video,
+                end_break_time, time_in_break, self.w, self.h)
+        args = (key, gps_info, gpx_index, self.w, self.h, break_video,
+                end_break_time, time_in_break, run_args)
+        memo_key = None
+        if self.overlay_memo_size:
+            memo_key = key_config.memo_key(key, gps_info, gpx_index,
+                    break_video, end_break_time, time_in_break, self.w, self.h,
+                    run_args)
+        if memo_key is None:
+            return key_config.get_clip(*args)
+        memo_key = (key, id(key_config), memo_key)
+        if memo_key in self.overlay_memo:
+            self.overlay_memo.move_to_end(memo_key)
+            self.overlay_memo_hits += 1
+            return self.overlay_memo[memo_key]
+        self.overlay_memo_misses += 1
+        c = key_config.get_clip(*args)
+        if c is not None:
+            c = self._flatten_clip(c)
+        self.overlay_memo[memo_key] = c
+        while len(self.overlay_memo) > self.overlay_memo_size:
+            self.overlay_memo.popitem(last=False)
+        return c
+
+    @staticmethod
+    def _flatten_clip(c):
+        """ImageClip with rendered frame, mask and position of clip c"""
+        pos = c.pos(0)
+        if isinstance(c, CompositeVideoClip) or not isinstance(c, ImageClip):
+            image = ImageClip(c.get_frame(0))
+            if c.mask is not None:
+                image = image.set_mask(ImageClip(c.mask.get_frame(0),
+                    ismask=True))
+            c = image
+        return c.set_pos(pos)
+
     def find_break(self, index,  t, effect_length):
         """Checks if current image is in a break
 
         and which part of a break. Start, Middle or End
+
+        Break status of images is taken from break_table. If index is None
+        image interval of time t is found with bisect in the table.
         """
         break_video = BreakType.NO
-        if not self.have_any_breaks:
+        if not self.have_any_breaks or self.break_table is None:
             return break_video, None
+        table = self.break_table
+        if index is None:
+            index = max(bisect.bisect_right(table['start'], t)-1, 0)
         if len(self.images_starts) > (index+1):
-            next_image_start = self.images_starts[index+1]*self.speedup_factor
-            is_break = self.gpx_data.is_break(index,
-                self.images_starts[index]*self.speedup_factor,
-                    next_image_start, effect_length,
-                    self.speedup_factor)
-            if is_break:
-                is_start_break = t-self.images_starts[index] <= effect_length
-                is_end_break = self.images_starts[index+1]-t <= effect_length
+            if table['is_break'][index]:
+                is_start_break = t-table['start'][index] <= effect_length
+                is_end_break = table['end'][index]-t <= effect_length
                 if is_start_break:
                     #print ("BREAK: Start break")
                     break_video = BreakType.START
@@ -322,6 +575,8 @@ class GPXDataSequence(VideoClip):
             ret_string.append("{}s {}".format(datetime.timedelta(seconds=diff), prev_break[1]))
 
         if self.calculate_stats:
+            ret_string.append("Overlay memo: {} hits, {} misses".format(
+                self.overlay_memo_hits, self.overlay_memo_misses))
             ret_string.append("Stats:")
             for key, cnt in self.stats.items():
                 ret_string.append("{}: {}".format(key,
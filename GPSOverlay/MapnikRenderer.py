@@ -1,13 +1,21 @@
 import time
 import os
+import json
+import math
+import collections
 import multiprocessing
 from io import BytesIO
 
 from moviepy.video.VideoClip import ImageClip
 from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
 
-from .util import format_filename
 from .DefaultConfig import DefaultConfig
+from .simplify import douglas_peucker
+from .mapcache import make_map_store, MemoryMapCache
+from .trackcache import load_gpx_track, load_gpx_segments
+from .maptiles import world_pixel, world_pixel_to_lat_lon, \
+        quantize_position, quantize_angle, map_name, metatile_window, \
+        metatile_bounds, rotate_map
 from PIL import Image as ImagePIL
 import numpy as np
 try:
@@ -17,6 +25,7 @@ except:
 
 
 circle, radius = DefaultConfig._make_circle(8, (0,255,0))
+
 def make_gpx_track_view(width, height, gpx_file=None, gpx_style=None, mapfile=None, 
         maps_cache=None, font_path=None, layer_padding=10, lat=45, lon=15,
         render_point=False):
@@ -106,6 +115,45 @@ class MapnikRenderer(object):
     maps_cache : str
         Path to where should we cache generated maps so that they are generated
         only once. Or None if no cache should be used
+    track_tolerance : float
+        GPX track is simplified with Douglas-Peucker so that no point is more
+        than this many meters from drawn line (needs geojson plugin of
+        mapnik). If None (default) GPX file is drawn as it is through OGR
+    metatile_size : int
+        If set north-up maps are cut from square metatiles of this size in
+        pixels (like 2048) instead of rendering each map. Metatiles are in a
+        grid with step metatile_size-map size, so each map fits in one of
+        them. They are rendered once (and saved in maps_cache if it is set)
+        and maps are NumPy views of them. Maps with angle (map config always
+        gives one) are then made as with rotate_raster, so metatile_size
+        implies rotate_raster.
+    metatile_cache : int
+        How many metatiles are kept in memory
+    rotate_raster : bool
+        If True maps with angle are made by rotating north-up map (padded to
+        the diagonal) with PIL instead of rendering each angle in its own
+        aeqd projection. So north-up map (or metatile) is rendered once for
+        all angles.
+    position_quantum : float
+        Map center is moved to the nearest point of a grid with this step in
+        screen pixels, so maps whose centers are closer than that are the
+        same map (and are read from maps_cache). Current location is still
+        returned at its exact sub-pixel position. None is no quantization.
+    angle_quantum : float
+        Map angle is rounded to a multiple of this many degrees. None is no
+        quantization. Angle is always wrapped to [0, 360).
+    cache_backend : str
+        How maps are saved in maps_cache. files is one PNG per map, sqlite is
+        all maps in one indexed SQLite file (see mapcache.MapStore)
+    cache_max_bytes : int
+        Size budget of sqlite map cache. Least recently used maps are removed
+        when it is exceeded. None is no limit.
+    cache_encoding : str
+        How maps are encoded in sqlite map cache: raw, zlib (default) or png
+    memory_cache_bytes : int
+        Budget in bytes for decoded maps kept in memory (LRU in front of
+        maps_cache), so the same map requested for many frames is decoded
+        once. None or 0 disables it.
     """
 # long/lat in degrees, aka ESPG:4326 and "WGS 84"
     longlat = mapnik.Projection('+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs')
@@ -119,13 +167,21 @@ class MapnikRenderer(object):
 # can also be constructed as:
 #longlat = mapnik.Projection('+init=epsg:4326')
 
+    #Attributes saved in config.json of maps_cache (see _save_cache)
+    _CACHE_KEYS = ('mapfile', 'gpx_style', 'gpx_file', 'map_width',
+            'map_height', 'zoom_changeable', 'map_zoom', 'maps_cache',
+            'mapnik_style_file')
+
     def __init__(self, map_w, map_h,
             gpx_file=None,
             gpx_style=None,
             map_zoom=18,
             mapfile=None,
             maps_cache=None, no_lazy_load=False,
-            font_path=None):
+            font_path=None, track_tolerance=None, metatile_size=None,
+            metatile_cache=16, rotate_raster=False, position_quantum=None,
+            angle_quantum=None, cache_backend='files', cache_max_bytes=None,
+            cache_encoding='zlib', memory_cache_bytes=256*2**20):
 
         if font_path is not None:
             mapnik.register_fonts(font_path)
@@ -135,6 +191,14 @@ class MapnikRenderer(object):
         self.mapfile = mapfile
         self.gpx_style = gpx_style
         self.gpx_file = gpx_file
+        self.track_tolerance = track_tolerance
+        self.metatile_size = metatile_size
+        self.metatile_cache = metatile_cache
+        self.rotate_raster = rotate_raster
+        self.position_quantum = position_quantum
+        self.angle_quantum = angle_quantum
+        self._metatiles = collections.OrderedDict()
+        self._preloaded = {}
         self.map_width = map_w
         self.map_height = map_h
         if map_zoom is None:
@@ -145,7 +209,12 @@ class MapnikRenderer(object):
         self.maps_cache=maps_cache
         self.mapnik_style_file = mapfile
 
+        self._map_store = None
+        self._memory_maps = MemoryMapCache(memory_cache_bytes) if \
+                memory_cache_bytes else None
         if self.maps_cache is not None:
+            self._map_store = make_map_store(maps_cache, cache_backend,
+                    cache_max_bytes, cache_encoding)
             self._save_cache()
 
         else:
@@ -175,7 +244,11 @@ class MapnikRenderer(object):
         """Saved options for map generation to cache
 
 
-        All settings are saved in config.json in maps_cache folder.
+        Settings which change how maps look (_CACHE_KEYS and
+        track_tolerance if it is set) are saved in config.json in maps_cache
+        folder. Options which only change which maps are rendered or kept in
+        memory (metatiles, rotation of rasters, quantization, cache backends)
+        aren't, since maps they make have different names.
 
         If config.json already exists in cache folder it is compared with
         current settings. If it is not the same Exception is raised
@@ -183,7 +256,10 @@ class MapnikRenderer(object):
         import json
         import os.path
 
-        current_cache = {k:v for k,v in vars(self).items() if k != 'm'}
+        current_cache = {k:getattr(self, k) for k in self._CACHE_KEYS}
+#Tracks drawn from simplified GeoJSON look different from OGR ones
+        if self.track_tolerance is not None:
+            current_cache['track_tolerance'] = self.track_tolerance
         cache_fn = os.path.join(self.maps_cache, "config.json")
 
         if os.path.isfile(cache_fn):
@@ -241,20 +317,26 @@ class MapnikRenderer(object):
 
         Parameters
         ---------
-        gpx_file : str
-            Full path to gpx file
+        gpx_file : str or list
+            Full path to gpx file or list of paths (each is its own layer)
         gpx_style : str
             Name of style layer for gpx file
 
         """
         if gpx_file is not None and gpx_style is not None:
+            gpx_files = gpx_file if isinstance(gpx_file, (list, tuple)) else \
+                    [gpx_file]
+            for gpx_file in gpx_files:
 # Create a layer to hold GPX points
-            print ("Adding GPX file")
-            layer = mapnik.Layer("gpx")
-            layer.datasource = mapnik.Ogr(file=gpx_file,
-                    layer='tracks')
-            layer.styles.append(gpx_style)
-            self.m.layers.append(layer)
+                print ("Adding GPX file")
+                layer = mapnik.Layer("gpx")
+                if self.track_tolerance is None:
+                    layer.datasource = mapnik.Ogr(file=gpx_file,
+                            layer='tracks')
+                else:
+                    layer.datasource = self._simplified_track(gpx_file)
+                layer.styles.append(gpx_style)
+                self.m.layers.append(layer)
             #print (self.m.layers)
             #print ("symbolizer took %r s" % (time.perf_counter()-start,))
             #mapnik.save_map(self.m,
@@ -263,50 +345,238 @@ class MapnikRenderer(object):
         #for layer in self.m.layers:
             #print (layer.name)
 
-    def _make_name(self, lat, lon, width=None, height=None, zoom=None,
-            zoom_to_layer=False):
-        """Generates name based on lat, lon width and height
+    def _simplified_track(self, gpx_file):
+        """Mapnik datasource with GPX track simplified with Douglas-Peucker
 
-        Name is lat_lon rounded to 5 decimal places after multipled by 10^5
-        So that we have integer. _width_height is added if they are not None
+        Track is read with trackcache. Points of each track segment are
+        projected to meters around the track (equirectangular) and simplified
+        to self.track_tolerance. Result is one GeoJSON MultiLineString with a
+        line per segment (like tracks layer of OGR), so gaps between segments
+        aren't drawn.
+        """
+        columns = load_gpx_track(gpx_file, local_time=False)
+        segments = np.asarray(load_gpx_segments(gpx_file))
+        lat = np.asarray(columns['lat'])
+        lon = np.asarray(columns['lon'])
+        lines = []
+        if len(lat):
+            earth_radius = 6371008.8
+            y = np.radians(lat)*earth_radius
+            x = np.radians(lon)*earth_radius*np.cos(np.radians(np.mean(lat)))
+            for segment in np.unique(segments[segments >= 0]):
+                points = np.flatnonzero(segments == segment)
+                if len(points) < 2:
+                    continue
+                kept = points[douglas_peucker(x[points], y[points],
+                    self.track_tolerance)]
+                lines.append(np.column_stack((lon[kept], lat[kept])).tolist())
+        geojson = {
+                "type": "FeatureCollection",
+                "features": [{
+                    "type": "Feature",
+                    "properties": {},
+                    "geometry": {
+                        "type": "MultiLineString",
+                        "coordinates": lines,
+                        },
+                    }],
+                }
+        return mapnik.Datasource(type='geojson', inline=json.dumps(geojson))
+
+    world_pixel = staticmethod(world_pixel)
+
+    world_pixel_to_lat_lon = staticmethod(world_pixel_to_lat_lon)
+
+    def _quantize_position(self, lat, lon, zoom):
+        """lat, lon moved to the nearest point of position_quantum pixel
+        grid at zoom (see maptiles.quantize_position)"""
+        return quantize_position(lat, lon, zoom, self.position_quantum)
+
+    def _quantize_angle(self, angle):
+        """angle rounded to multiple of angle_quantum (see
+        maptiles.quantize_angle)"""
+        return quantize_angle(angle, self.angle_quantum)
+
+    def _render_array(self):
+        """Renders current map in memory and returns it as RGBA array"""
+        im = mapnik.Image(self.m.width, self.m.height)
+        mapnik.render(self.m, im)
+#Saving image to bytes buffer needs to be nonpalletted image otherwise it needs
+        #to be converted to RGB when reading in numpy anyways
+        buffer = BytesIO(im.tostring('png32'))
+        return np.asarray(ImagePIL.open(buffer))
 
-        Parameters
-        ---------
-        lat : float
-            Latitude in WGS84 - center point of a map (around 46 in Europe)
-        lon : float
-            Longitude in WGS84 - center point of a map (around 15 in Europe)
-        width : int
-            Wanted width of the map
-        height : int
-            Wanted height of the map
-        zoom : float
-            map zoom
-        zoom_to_layer : bool
-            If true map shows whole layer and lat,lon, zoom are actually
-            ignored
+    def _metatile(self, zoom, step_x, step_y, col, row):
+        """Metatile at grid position col, row as RGBA array
 
+        Top left corner of metatile is at world pixel (col*step_x, row*step_y).
+        Metatiles are kept in memory LRU and in maps_cache if it is set.
+        """
+        key = (zoom, step_x, step_y, col, row)
+        if key in self._metatiles:
+            self._metatiles.move_to_end(key)
+            return self._metatiles[key]
+        size = self.metatile_size
+        tile_name = "META_Z{}_{}_{}_{}_{}_{}".format(int(round(zoom*10**5)),
+                size, step_x, step_y, col, row)
+        tile = self._cached_map(tile_name)
+        if tile is None:
+            self._lazy_init_map()
+            self.m.srs = self.mercator_projection.params()
+            self.m.resize(size, size)
+            self.m.zoom_to_box(mapnik.Box2d(*metatile_bounds(zoom, step_x,
+                step_y, col, row, size)))
+            tile = self._render_array()
+            self.m.resize(self.map_width, self.map_height)
+            self._cache_map(tile_name, tile)
+        self._metatiles[key] = tile
+        while len(self._metatiles) > self.metatile_cache:
+            self._metatiles.popitem(last=False)
+        return tile
+
+    def _cached_map(self, name):
+        """Map array from memory, preloaded maps or map store or None"""
+        if self._memory_maps is not None:
+            array = self._memory_maps.get(name)
+            if array is not None:
+                return array
+        if name in self._preloaded:
+            array = self._preloaded.pop(name)
+        elif self._map_store is not None:
+            array = self._map_store.get(name)
+        else:
+            return None
+        if array is not None and self._memory_maps is not None:
+            self._memory_maps.put(name, array)
+        return array
+
+    def _cache_map(self, name, array):
+        """Saves rendered map array in memory and map store"""
+        if self._memory_maps is not None:
+            self._memory_maps.put(name, array)
+        if self._map_store is not None:
+            self._map_store.put(name, array)
+
+    def _forget_map(self, name):
+        """Removes map from memory, preloaded maps and map store"""
+        if self._memory_maps is not None:
+            self._memory_maps.delete(name)
+        self._preloaded.pop(name, None)
+        if self._map_store is not None:
+            self._map_store.delete(name)
+
+    def flush_map_cache(self):
+        """Writes pending times of last use of maps to maps_cache store"""
+        if self._map_store is not None:
+            self._map_store.flush()
+
+    def map_cache_stats(self):
+        """Hits, misses and evictions of in memory and maps_cache store
+
+        Returns dict with keys memory and store (None if not used), each is
+        a dict with hits, misses and evictions.
+        """
+        def stats(cache):
+            if cache is None:
+                return None
+            return {'hits': cache.hits, 'misses': cache.misses,
+                    'evictions': cache.evictions}
+        return {'memory': stats(self._memory_maps),
+                'store': stats(self._map_store)}
+
+    def preload_maps(self, names):
+        """Reads maps with given names (see _make_name) from maps_cache at once
+
+        With sqlite cache_backend this is one query per 500 maps instead of
+        one per map. Preloaded maps are used (and forgotten) by the next
+        render_map which needs them.
+        """
+        if self._map_store is not None:
+            self._preloaded.update(self._map_store.preload(names))
 
-        Returns
-        ------
-        str
-            Filename
+    def _render_from_metatile(self, lat, lon, zoom, width, height):
+        """Map of given size centered at lat, lon cut from metatile
 
+        Returns same as render_map. Center coordinate keeps sub-pixel
+        position of lat, lon.
         """
-        if zoom_to_layer:
-            name = "LAYER_"+format_filename(self.gpx_file[-20:])
-            return name
-        round_lat = round(lat*10**5)
-        round_lon = round(lon*10**5)
-        latlon= "{}_{}".format(round_lat, round_lon)
-        if width and height:
-            name = latlon + "_{}_{}".format(width,height)
+        x, y = self.world_pixel(lat, lon, zoom)
+        step_x, step_y, col, row, left, top, tile_left, tile_top = \
+                metatile_window(x, y, width, height, self.metatile_size)
+        tile = self._metatile(zoom, step_x, step_y, col, row)
+        map_data = tile[tile_top:tile_top+height, tile_left:tile_left+width]
+        return ImageClip(map_data), (x-left, y-top)
+
+    @staticmethod
+    def _clip_rgba(clip):
+        """RGBA array of ImageClip (ImageClip keeps alpha as mask)"""
+        if clip.img.ndim == 3 and clip.img.shape[2] == 4:
+            return clip.img
+        rgb = clip.img if clip.img.ndim == 3 else np.dstack([clip.img]*3)
+        if clip.mask is None:
+            alpha = np.full(rgb.shape[:2], 255, dtype=np.uint8)
         else:
-            name = latlon
-        if zoom:
-            round_zoom = int(round(zoom*10**5))
-            name += "_Z{}".format(round_zoom)
-        return name
+            alpha = np.round(clip.mask.img*255).astype(np.uint8)
+        return np.dstack((rgb.astype(np.uint8), alpha))
+
+    def _render_rotated(self, lat, lon, angle, zoom, width, height):
+        """Map rotated so that angle points up made from north-up map
+
+        North-up map is rendered with render_map (so it can come from
+        metatiles or maps_cache) with size of the diagonal of wanted map. It
+        is rotated around exact lat, lon pixel with PIL and cropped.
+
+        Returns same as render_map.
+        """
+        size = int(math.ceil(math.hypot(width, height)))+2
+        north_up, (center_x, center_y) = self.render_map(lat, lon, zoom=zoom,
+                img_width=size, img_height=size)
+        map_data, center = rotate_map(self._clip_rgba(north_up), angle,
+                center_x, center_y, width, height)
+        return ImageClip(map_data), center
+
+    def _make_name(self, lat, lon, width=None, height=None, zoom=None,
+            zoom_to_layer=False, angle=None):
+        """Generates name based on lat, lon width and height
+
+        See maptiles.map_name, zoom_to_layer maps are named after gpx_file.
+        Their size is only in the name if it isn't map size, so they keep
+        names they had in existing maps_cache.
+        """
+        if zoom_to_layer and (width, height) == (self.map_width,
+                self.map_height):
+            width = height = None
+        return map_name(lat, lon, width, height, zoom, zoom_to_layer, angle,
+                self.gpx_file)
+
+    def map_key(self, lat, lon, angle=None, angle_offset=0, zoom=None,
+            overwrite=False, img_width=None, img_height=None,
+            zoom_to_layer=False, layer_padding=10):
+        """Name of map which render_map shows for the same arguments
+
+        Position and angle are quantized with _quantize_position and
+        _quantize_angle as in render_map, so frames which get the same map
+        get the same name. It is used as memo key of map overlay (see
+        DefaultConfig.make_map_config). Location point drawn on memoized map
+        is then off by at most position_quantum/2 pixels.
+
+        Returns None if lat or lon is missing.
+        """
+        if lat is None or lon is None:
+            return None
+        width = self.map_width if img_width is None else img_width
+        height = self.map_height if img_height is None else img_height
+        if zoom is None:
+            zoom = self.map_zoom
+        if not zoom_to_layer:
+            lat, lon = self._quantize_position(lat, lon, zoom)
+        if angle is not None:
+            angle = self._quantize_angle(angle+angle_offset)
+#Zoom is only in the name if it can differ from map_zoom
+        zoom_name = zoom if self.zoom_changeable or zoom != self.map_zoom \
+                else None
+        return self._make_name(lat, lon, width, height, zoom_name,
+                zoom_to_layer, angle)
 
     def render_map(self, lat, lon, angle=None, angle_offset=0, zoom=None,
             overwrite=False, img_width=None, img_height=None,
@@ -314,12 +584,16 @@ class MapnikRenderer(object):
         """Renders map with help of mapnik
 
         If maps_cache is used it is first checked if image already exists in
-        cache. Image name is created with self._make_name which creates name
-        from lat_lon rounded to 5 decimals and width height if they are
-        provided. If image exists and overwrite is False image is returned as
+        cache. Image name is created with self.map_key which creates name
+        from quantized lat_lon rounded to 5 decimals and width height. If image exists and overwrite is False image is returned as
         ImageClip. If overwrite is True image is deleted and image is rendered
         and also returned as ImageClip.
 
+        If metatile_size is set north-up maps are cut from metatiles (see
+        _render_from_metatile) and not rendered for each lat, lon. If
+        rotate_raster or metatile_size is set maps with angle are rotated
+        north-up maps (see _render_rotated).
+
         Parameters
         ---------
         lat : float
@@ -354,7 +628,6 @@ class MapnikRenderer(object):
 
 
         """
-        map_uri = None
         width = self.map_width if img_width is None else img_width
         height = self.map_height if img_height is None else img_height
         if zoom is None:
@@ -362,13 +635,35 @@ class MapnikRenderer(object):
                 raise Exception("One of map_zoom or zoom needs to be set!")
             zoom = self.map_zoom
 
+        if angle is not None and not zoom_to_layer and (self.rotate_raster or
+                self.metatile_size is not None):
+            return self._render_rotated(lat, lon,
+                    self._quantize_angle(angle+angle_offset), zoom, width,
+                    height)
+
+        if self.metatile_size is not None and angle is None and \
+                not zoom_to_layer and width < self.metatile_size and \
+                height < self.metatile_size:
+            return self._render_from_metatile(lat, lon, zoom, width, height)
+
+        fn = self.map_key(lat, lon, angle, angle_offset, zoom,
+                img_width=width, img_height=height,
+                zoom_to_layer=zoom_to_layer)
+#Map is rendered at quantized center and angle, location is projected
+        #exactly
+        location = mapnik.Coord(lon, lat)
+        if not zoom_to_layer:
+            lat, lon = self._quantize_position(lat, lon, zoom)
+        if angle is not None:
+            angle = self._quantize_angle(angle+angle_offset)
+
         if angle is None:
 # spherical mercator (most common target map projection of osm data imported with osm2pgsql)
             merc = self.mercator_projection
         else:
 #Map rotation https://gis.stackexchange.com/questions/183175/rotating-90-using-two-point-equidistant-projection-with-proj4
             merc = mapnik.Projection('+proj=aeqd +ellps=sphere +lat_0=90 +lon_0=-' +
-                    str(angle+angle_offset))
+                    str(angle))
         self._lazy_init_map()
 # ensure the target map projection is mercator
         self.m.srs = merc.params()
@@ -412,43 +707,27 @@ class MapnikRenderer(object):
 # Note: aspect_fix_mode is only available in Mapnik >= 0.6.0
         self.m.zoom_to_box(bounds)
 
-        center_pixel_coord = self.m.view_transform().forward(merc_centre)
+        center_pixel_coord = self.m.view_transform().forward(
+                transform.forward(location))
         #print ("img_width: {} map_width:{} width:{}".format(img_width, self.map_width, width))
-        if self.maps_cache is not None:
-            zoom_name = zoom if self.zoom_changeable else None
-            fn = self._make_name(lat, lon, width,
-                height, zoom_name, zoom_to_layer)
-            #print ("Rendering " + fn)
-            map_uri = os.path.join(self.maps_cache, "{}.png".format(fn))
-#If we don't want to overwrite and file already exists skip map rendering
-            if not overwrite and os.path.isfile(map_uri):
-                return ImageClip(map_uri), (center_pixel_coord.x,
+        #print ("Rendering " + fn)
+#If we don't want to overwrite and map is already cached skip map rendering
+        if not overwrite:
+            map_data = self._cached_map(fn)
+            if map_data is not None:
+                if img_width is not None and img_height is not None:
+                    self.m.resize(self.map_width, self.map_height)
+                return ImageClip(map_data), (center_pixel_coord.x,
                         center_pixel_coord.y)
-#If we want to overwrite and file exists we remove file
-            if overwrite and os.path.isfile(map_uri):
-                os.remove(map_uri)
+#If we want to overwrite and map exists we remove it
+        else:
+            self._forget_map(fn)
 
 
         #start = time.perf_counter()
-        if self.maps_cache is not None:
-            mapnik.render_to_file(self.m, map_uri)
-            map_data = map_uri
-        else:
-#Renders map to image in memory saves it to buffer and reads in numpy
-            im = mapnik.Image(self.m.width, self.m.height)
-            mapnik.render(self.m, im)
-            #im.save("/tmp/tmp.png", 'png256')
-#Saving image to bytes buffer needs to be nonpalletted image otherwise it needs
-            #to be converted to RGB when reading in numpy anyways
-            string_image = im.tostring('png32')
-            buffer = BytesIO(string_image)
-            #with open("/tmp/tmp1.png", "wb") as o:
-                #o.write(buffer.getvalue())
-            pil_image = ImagePIL.open(buffer)
-            #print (pil_image.format, pil_image.mode, pil_image.size,
-                    #pil_image.palette)
-            map_data = np.asarray(pil_image)
-            #map_data = "/tmp/tmp.png"
+#Renders map to image in memory and reads in numpy
+        map_data = self._render_array()
+        self._cache_map(fn, map_data)
         if img_width is not None and img_height is not None:
             self.m.resize(self.map_width, self.map_height)
 
@@ -462,7 +741,6 @@ class MapnikRenderer(object):
         print("  Using map file: " + mapfile)
         print("  Using bounds: " + repr(bounds))
         print("  Scale Denominator: " + str(m.scale_denominator()))
-        print("  Render into file: " + map_uri)
         print("  Image size: " + str(m.width) + "x" + str(m.height))
 
 
@@ -492,6 +770,7 @@ class MapnikMultiProcessRenderer(multiprocessing.Process):
             next_task = self.task_queue.get()
             if next_task is None:
                 #print ('%s Exiting' % (proc_name,))
+                self.renderer.flush_map_cache()
                 if self.cnt_times > 0:
                    self.result_queue.put('%s done %d tasks in %f s %f items per second' %(proc_name, self.cnt_items,
                     self.cnt_times, self.cnt_items/self.cnt_times))
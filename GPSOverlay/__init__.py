@@ -6,12 +6,28 @@ cachedir = "/var/tmp/overlay"
 memory = Memory(cachedir=cachedir, verbose=0)
 
 
-@memory.cache
+#ExifIndex used by exif_fields (made on first use)
+_exif_index = None
+
+
 def exif_fields(filename):
-    exif = EXIF(filename)
-    geo_data = exif.extract_geo()
-    exif_time = exif.extract_capture_time()
-    bearing = exif.extract_direction()
+    """Returns geo data dictionary, capture time and bearing of image
+
+    Values are cached in ExifIndex of image directory. Only the row of this
+    image is read from the index.
+    """
+    global _exif_index
+    if _exif_index is None:
+        from .exifindex import ExifIndex
+        _exif_index = ExifIndex()
+    (_, _, exif_time, _, lat, lon, altitude, bearing), = \
+            _exif_index.load_rows([filename], workers=1)
+    geo_data = {'altitude': altitude}
+    if lat is not None and lon is not None:
+        geo_data['latitude'] = lat
+        geo_data['longitude'] = lon
+    if exif_time is None:
+        exif_time = 0
     return geo_data, exif_time, bearing
 
 #Doesn't work
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import sqlite3
+import datetime
+
+from .exifscan import EXIF_COLUMNS, read_exif_rows, rows_to_columns
+from .lib.geo import datetime_to_microseconds, EPOCH
+
+#Increase when format of indexed values changes
+EXIF_INDEX_VERSION = 1
+
+INDEX_FILENAME = ".gpsoverlay_exif.sqlite"
+
+#Columns saved for each image besides name, size and mtime
+_VALUE_COLUMNS = EXIF_COLUMNS[1:]
+_TIME_COLUMNS = ('datetime_original', 'capture_time')
+
+
+def _to_db(row):
+    """Converts row from exifscan.read_exif_row to values saved in index"""
+    values = dict(zip(EXIF_COLUMNS, row))
+    for key in _TIME_COLUMNS:
+        if values[key] is not None:
+            values[key] = datetime_to_microseconds(values[key])
+    return tuple(values[key] for key in _VALUE_COLUMNS)
+
+
+def _from_db(filename, values):
+    """Converts values from index back to exifscan.read_exif_row row"""
+    values = dict(zip(_VALUE_COLUMNS, values))
+    for key in _TIME_COLUMNS:
+        if values[key] is not None:
+            values[key] = EPOCH + datetime.timedelta(microseconds=values[key])
+    values['filename'] = filename
+    return tuple(values[key] for key in EXIF_COLUMNS)
+
+
+class ExifIndex(object):
+    """SQLite index of EXIF fields of images
+
+    Each image directory has one SQLite file with a row per image keyed by
+    image name, size and mtime. It is saved in the image directory as
+    INDEX_FILENAME or, if directory isn't writable, in exif directory in
+    cachedir named by hash of directory path.
+
+    Rows of wanted images are read with one query per 500 images. Only
+    images which are missing in the index or whose size or mtime changed are
+    read again (with exifscan.read_exif_rows) and saved back in one
+    transaction. Connection to each index is opened once per process.
+
+    Attributes
+    ---------
+    hits : int
+        Number of images found in the index
+    misses : int
+        Number of images which had to be read
+
+    Parameters
+    ---------
+    cachedir : str
+        Where indexes of not writable directories are saved. If None it is
+        exif directory in GPSOverlay.cachedir
+    """
+
+    def __init__(self, cachedir=None):
+        if cachedir is None:
+            from . import cachedir as overlay_cachedir
+            cachedir = os.path.join(overlay_cachedir, "exif")
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+        self._connections = {}
+        self._pid = None
+
+    def index_path(self, directory):
+        """Path of SQLite file with index of given directory"""
+        if os.access(directory, os.W_OK):
+            return os.path.join(directory, INDEX_FILENAME)
+        os.makedirs(self.cachedir, exist_ok=True)
+        name = hashlib.sha1(directory.encode("utf-8")).hexdigest()
+        return os.path.join(self.cachedir, name + ".sqlite")
+
+    def _connect(self, directory):
+        if self._pid != os.getpid():
+            self._connections = {}
+            self._pid = os.getpid()
+        if directory in self._connections:
+            return self._connections[directory]
+        conn = sqlite3.connect(self.index_path(directory))
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != EXIF_INDEX_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS images")
+                conn.execute("PRAGMA user_version = {}".format(
+                    EXIF_INDEX_VERSION))
+        conn.execute("CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY "
+                "KEY, size INTEGER, mtime_ns INTEGER, {})".format(
+                    ", ".join(_VALUE_COLUMNS)))
+        self._connections[directory] = conn
+        return conn
+
+    def close(self):
+        """Closes connections to all indexes"""
+        for conn in self._connections.values():
+            conn.close()
+        self._connections = {}
+
+    def load_rows(self, files, workers=None, use_threads=False):
+        """Returns EXIF rows of files same as exifscan.read_exif_rows
+
+        Only images which aren't up to date in the index are read.
+        """
+        files = list(files)
+        rows = [None]*len(files)
+        by_directory = {}
+        for i, filename in enumerate(files):
+            directory = os.path.dirname(os.path.abspath(filename))
+            by_directory.setdefault(directory, []).append(i)
+
+        for directory, positions in by_directory.items():
+            conn = self._connect(directory)
+            names = [os.path.basename(files[i]) for i in positions]
+            indexed = {}
+            for start in range(0, len(names), 500):
+                chunk = names[start:start+500]
+                indexed.update((row[0], row[1:]) for row in
+                        conn.execute("SELECT name, size, mtime_ns, {} FROM "
+                            "images WHERE name IN ({})".format(
+                                ", ".join(_VALUE_COLUMNS),
+                                ", ".join(["?"]*len(chunk))), chunk))
+            stale = []
+            stats = {}
+            for i, name in zip(positions, names):
+                stat = os.stat(files[i])
+                stats[i] = (name, stat.st_size, stat.st_mtime_ns)
+                entry = indexed.get(name)
+                if entry is not None and entry[0] == stat.st_size and \
+                        entry[1] == stat.st_mtime_ns:
+                    rows[i] = _from_db(files[i], entry[2:])
+                else:
+                    stale.append(i)
+            self.hits += len(positions)-len(stale)
+            self.misses += len(stale)
+            if not stale:
+                continue
+            read_rows = read_exif_rows([files[i] for i in stale], workers,
+                    use_threads)
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO images VALUES "
+                        "({})".format(", ".join(
+                            ["?"]*(3+len(_VALUE_COLUMNS)))),
+                        [stats[i]+_to_db(row) for i, row in
+                            zip(stale, read_rows)])
+            for i, row in zip(stale, read_rows):
+                rows[i] = row
+        return rows
+
+    def load(self, files, workers=None, use_threads=False):
+        """Returns EXIF columns of files same as exifscan.read_exif_columns"""
+        return rows_to_columns(self.load_rows(files, workers, use_threads))
@@ -0,0 +1,102 @@
+import os
+import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from .lib.exif import EXIF
+
+EXIF_COLUMNS = ('filename', 'datetime_original', 'capture_time', 'subsec',
+        'lat', 'lon', 'altitude', 'direction')
+
+
+def read_exif_row(filename):
+    """Reads all EXIF fields GPXData needs from one image
+
+    File is read only once. Missing values are None.
+
+    Returns
+    ------
+    tuple
+        Values in the order of EXIF_COLUMNS
+    """
+    exif = EXIF(filename)
+    dt_str = exif.tags.get("EXIF DateTimeOriginal")
+    datetime_original = None
+    if dt_str is not None:
+        datetime_original = datetime.datetime.strptime(str(dt_str),
+                "%Y:%m:%d %H:%M:%S")
+    try:
+        subsec = exif.extract_subsec()
+        capture_time = exif.extract_capture_time()
+    except ValueError:
+        subsec = 0
+        capture_time = None
+    if not isinstance(capture_time, datetime.datetime):
+        capture_time = None
+    lon, lat = exif.extract_lon_lat()
+    altitude = exif.extract_altitude()
+    direction = exif.extract_direction()
+    return (filename, datetime_original, capture_time, subsec, lat, lon,
+            altitude, direction)
+
+
+def rows_to_columns(rows):
+    """Converts rows from read_exif_row to columns
+
+    Times are datetime64[us] (NaT when missing), numbers are float64 (NaN
+    when missing) and filename is object array.
+    """
+    columns = dict(zip(EXIF_COLUMNS, zip(*rows))) if rows else \
+            {key: () for key in EXIF_COLUMNS}
+    result = {
+            'filename': np.array(columns['filename'], dtype=object),
+            'subsec': np.array(columns['subsec'], dtype=np.int64),
+            }
+    for key in ('datetime_original', 'capture_time'):
+        result[key] = np.array(columns[key], dtype='datetime64[us]')
+    for key in ('lat', 'lon', 'altitude', 'direction'):
+        result[key] = np.array([np.nan if value is None else value for value
+            in columns[key]], dtype=np.float64)
+    return result
+
+
+def read_exif_rows(files, workers=None, use_threads=False):
+    """Reads EXIF of all images in a single pass
+
+    Each file is opened once and all fields from EXIF_COLUMNS are read from
+    it. Files are read in parallel in a process pool (exifread is pure Python
+    so threads are limited by GIL, but they are cheaper to start for short
+    sequences).
+
+    Parameters
+    ---------
+    files : list
+        Image filenames
+    workers : int
+        Number of parallel workers. If None it is number of CPUs. With 1
+        files are read in current process.
+    use_threads : bool
+        Use thread pool instead of process pool
+
+    Returns
+    ------
+    list
+        Row from read_exif_row for each file in the same order as files
+    """
+    files = list(files)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(files))
+    if workers <= 1:
+        return [read_exif_row(filename) for filename in files]
+    executor_class = ThreadPoolExecutor if use_threads else \
+            ProcessPoolExecutor
+    chunksize = max(1, len(files)//(workers*4))
+    with executor_class(max_workers=workers) as executor:
+        return list(executor.map(read_exif_row, files, chunksize=chunksize))
+
+
+def read_exif_columns(files, workers=None, use_threads=False):
+    """Same as read_exif_rows but returns columns (see rows_to_columns)"""
+    return rows_to_columns(read_exif_rows(files, workers, use_threads))
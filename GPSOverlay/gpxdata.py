@@ -1,20 +1,24 @@
 import datetime
 import os
+import sys
 import collections
-from .lib.gps_parser import get_lat_lon_time_from_gpx
-from .lib.geo import interpolate_lat_lon, decimal_to_dms
+import numpy as np
+from .lib.gps_parser import columns_to_points
+from .lib.geo import interpolate_lat_lon, decimal_to_dms, TrackIndex, \
+        interpolate_many, distance_array, datetime_to_microseconds, \
+        times_to_microseconds, track_columns, track_channels, EPOCH
 from gpxpy import geo
-import exifread
 from .lib.exif import EXIF
 from .util import make_offsets, GPSData
-from . import exif_fields, memory
+from . import exif_fields
+from .trackcache import load_gpx_track
+from .trackmerge import load_gpx_tracks
+from .spatialindex import TrackSpatialIndex
+from .exifindex import ExifIndex
+from .trackstore import TrackStore
+from .metrics import TrackMetrics
 
-#FIXME: why are we reading images twice, first in estimate sub second time and
-#then in get_geo
-
-
-@memory.cache
-def _estimate_sub_second_time(files, interval):
+def estimate_sub_second_time(exif_times, interval):
     '''
     Estimate the capture time of a sequence with sub-second precision
 
@@ -22,25 +26,15 @@ def _estimate_sub_second_time(files, interval):
     uses the given interval between shots to Estimate the time inside that
     second that each picture was taken.
 
-    If interval is 0 it just returns list of datetimes which are
-        DateTimeOriginal from EXIF of given files
+    If interval is 0 it just returns list of given datetimes (DateTimeOriginal
+        from EXIF)
     '''
-    def exif_time(filename):
-        img = open(filename, 'rb')
-        tags = exifread.process_file(img, details=False,
-                stop_tag="EXIF DateTimeOriginal")
-        dt_str = tags["EXIF DateTimeOriginal"]
-        #print (dt_str)
-        dt = datetime.datetime.strptime(str(dt_str), "%Y:%m:%d %H:%M:%S")
-        return dt
-
     if interval <= 0.0:
-        return [exif_time(f) for f in files]
+        return list(exif_times)
 
     onesecond = datetime.timedelta(seconds=1.0)
     T = datetime.timedelta(seconds=interval)
-    for i, f in enumerate(files):
-        m = exif_time(f)
+    for i, m in enumerate(exif_times):
         if i == 0:
             smin = m
             smax = m + onesecond
@@ -54,38 +48,201 @@ def _estimate_sub_second_time(files, interval):
         return None
     else:
         s = smin + (smax - smin) / 2
-        return [s + T * i for i in range(len(files))]
+        return [s + T * i for i in range(len(exif_times))]
+
+
+def find_time_offsets(track, image_times, lats, lons, time_offset=0,
+        max_diff=50, max_dt=1):
+    """Finds time offset between GPX track and each image
+
+    For each image offsets from util.make_offsets are tried in order around
+    offset of the previous image (time_offset for the first one). Offset
+    is found when position interpolated at image time minus offset is the same
+    as image EXIF position rounded to 5 decimals.
+
+    Each tried offset is interpolated for all images at once with
+    lib.geo.interpolate_many and cached, so usually only a few vectorized
+    passes are needed for the whole sequence.
+
+    Parameters
+    ---------
+    track
+        Track columns, TrackIndex or list of points
+    image_times
+        Image creation times (see lib.geo.times_to_microseconds)
+    lats : numpy.ndarray
+        EXIF latitudes of images
+    lons : numpy.ndarray
+        EXIF longitudes of images
+    time_offset : int
+        Offset in seconds to start the search with
+    max_diff : int
+        Maximal difference in seconds from previous offset
+    max_dt : float
+        How many seconds outside of track times can still be extrapolated
+
+    Returns
+    ------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray
+        Offset for each image in seconds, distance in meters between
+        interpolated and EXIF position at that offset (NaN if it is outside of
+        the track) and indexes of images where no offset was found (those get
+        offset of the previous image)
+    """
+    track_times = track_columns(track)['time']
+    image_us = times_to_microseconds(image_times)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    round_lats = np.round(lats, 5)
+    round_lons = np.round(lons, 5)
+    first = track_times[0]-max_dt*10**6
+    last = track_times[-1]+max_dt*10**6
+
+    def interpolate_at(offsets):
+        """Interpolates positions at image times minus offsets
+
+        Returns lat, lon arrays (NaN outside of track)"""
+        t = image_us-np.round(np.asarray(offsets)*10**6).astype(np.int64)
+        lat = np.full(len(t), np.nan)
+        lon = np.full(len(t), np.nan)
+        valid = (t >= first) & (t <= last)
+        if valid.any():
+            gps = interpolate_many(track, t[valid], max_dt, verbose=False)
+            lat[valid] = gps['lat']
+            lon[valid] = gps['lon']
+        return lat, lon
+
+    matches = {}
+    def matches_at(offset):
+        if offset not in matches:
+            lat, lon = interpolate_at(np.full(len(image_us), offset))
+            matches[offset] = (np.round(lat, 5) == round_lats) & \
+                    (np.round(lon, 5) == round_lons)
+        return matches[offset]
+
+    offsets = []
+    unmatched = []
+    center = time_offset
+    for i in range(len(image_us)):
+        for offset in make_offsets(center, max_diff):
+            if matches_at(offset)[i]:
+                break
+        else:
+            unmatched.append(i)
+            offset = center
+        offsets.append(offset)
+        center = offset
+
+    offsets = np.array(offsets, dtype=np.float64)
+    lat, lon = interpolate_at(offsets)
+    residuals = distance_array(lat, lon, None, lats, lons, None)
+    return offsets, residuals, np.array(unmatched, dtype=np.int64)
+
 
 class GPXData(object):
+    """GPS data of image sequence and/or GPX track
+
+    Parameters
+    ---------
+    sequence : list
+        Image filenames
+    gpx_file : str or list
+        Path to GPX file. If it is a list of paths (same trip from many
+        devices) files are read in parallel and merged into one track with
+        trackmerge.merge_tracks. Channels are taken from the first file in
+        the list which has them.
+    time_offset : int
+        Offset in seconds between image times and GPX times where search for
+        offset of each image starts
+    interval : float
+        Time between shots (see estimate_sub_second_time)
+    gpx_start_time : datetime
+        Start time if there is no sequence
+    match_by_location : bool
+        If True, starting time_offset is found from image EXIF positions:
+        each image is matched to the nearest track segment with
+        TrackSpatialIndex and the median difference between image times and
+        matched track times is used. Useful when camera clock is far off.
+    exif_workers : int
+        Number of parallel workers used to read EXIF of images (see
+        exifscan.read_exif_rows). If None it is number of CPUs.
+
+    Attributes
+    ---------
+    gpx_data : TrackStore
+        GPSData of each image (GPSPoint rows)
+    exif_index : ExifIndex
+        Index from which EXIF of images were loaded. Its hits and misses
+        show how many images were read from the index.
+    channels : list
+        Names of extension channels in GPX track (cad, atemp, power...)
+    column_for : dict
+        Track column of each value which can be shown in a chart (elevation,
+        speed, heart and every extension channel)
+    """
     def __init__(self, sequence=None, gpx_file=None, time_offset=0, interval=0,
-            gpx_start_time=None):
+            gpx_start_time=None, match_by_location=False, exif_workers=None):
         self.gpx_data = []
+        self.offset_residuals = []
+        self.unmatched_images = []
         if sequence is None and gpx_file is None:
             raise Exception("Sequence and gpx_file is none. "+
                     "One of them or both has to be set")
         self.time_offset = time_offset
+        self.match_by_location = match_by_location
+        self._gpx = None
+        self._spatial_index = None
+        self._metrics = None
+        self.exif = None
+        self.exif_index = ExifIndex()
         if gpx_file is not None:
-            # read gpx file to get track locations
-            self.gpx = get_lat_lon_time_from_gpx(gpx_file)
+            # read gpx file (or binary cache of it) to get track locations
+            if isinstance(gpx_file, (list, tuple)):
+                self.track = load_gpx_tracks(gpx_file)
+            else:
+                self.track = load_gpx_track(gpx_file)
+            self.track_index = TrackIndex(self.track)
+            self.channels = track_channels(self.track)
         else:
-            self.gpx = None
+            self.track = None
+            self.track_index = None
+            self.channels = []
         if sequence is not None:
+# Read EXIF of all images at once (only images not in the index are read)
+            self.exif = self.exif_index.load(sequence, exif_workers)
+            print ("EXIF index: {} hits, {} misses".format(
+                self.exif_index.hits, self.exif_index.misses))
+            missing = np.isnat(self.exif['datetime_original'])
+            if missing.any():
+                filename = self.exif['filename'][np.argmax(missing)]
+                print ("No DateTimeOriginal in {}".format(filename))
+                raise KeyError("EXIF DateTimeOriginal")
 # Estimate capture time with sub-second precision
-            image_creation_times = _estimate_sub_second_time(sequence, interval)
+            image_creation_times = estimate_sub_second_time(
+                    self.exif['datetime_original'].astype(object).tolist(),
+                    interval)
             if not image_creation_times:
                 sys.exit(1)
             #For each image in sequence based on imagecreation time and gpx file time offset
             # find closest saved track_point in gpx file and interpolate lat,lon, elevation, speed etc
             #So that self.gpx_data has same number of items as input self.sequence
             #And each item is GPSData with information at this point in time as image was creatd
-            for filepath, file_creation_time in zip(sequence, image_creation_times):
-                if self.gpx_data:
-                    time_offset = self.gpx_data[-1].offset
-                self._add_exif_using_timestamp(filepath, file_creation_time, self.gpx,
+            if self.track_index is not None:
+                self._add_exif_using_offsets(sequence, image_creation_times,
                         time_offset, 0)
+            else:
+                for i, (filepath, file_creation_time) in enumerate(zip(sequence,
+                    image_creation_times)):
+                    if self.gpx_data:
+                        time_offset = self.gpx_data[-1].offset
+                    self._add_exif_using_timestamp(filepath, file_creation_time,
+                            self.track_index, time_offset, 0,
+                            self._geo_from_exif_columns(i, time_offset))
             if gpx_file is not None:
                 assert (len(sequence)==len(self.gpx_data)) , "{} != {}".format(len(sequence), 
                 len(self.gpx_data))
+        self.gpx_data = TrackStore.from_records(self.gpx_data)
+        self._set_slopes()
         if gpx_start_time is not None:
             self.gpx_start_time = gpx_start_time
         elif self.gpx_data:
@@ -95,11 +252,82 @@ class GPXData(object):
             raise Exception("No gpx_start_time this needs to be set" +
                     " from argument or from sequence")
 
-        self.index_for = {
-                'elevation':3,
-                'speed':4,
-                'heart':5
+        self.column_for = {
+                'elevation':'elevation',
+                'speed':'speed',
+                'heart':'hr'
                 }
+        self.column_for.update((name, name) for name in self.channels)
+
+    @property
+    def spatial_index(self):
+        """TrackSpatialIndex over GPX track made the first time it is needed"""
+        if self._spatial_index is None and self.track is not None:
+            self._spatial_index = TrackSpatialIndex(self.track)
+        return self._spatial_index
+
+    @property
+    def metrics(self):
+        """TrackMetrics of GPX track made the first time it is needed"""
+        if self._metrics is None and self.track is not None:
+            self._metrics = TrackMetrics(self.track)
+        return self._metrics
+
+    def metrics_at(self, gpx_index, t=None):
+        """Derived track metrics (see TrackMetrics) at GPX index and time t
+
+        Returns empty dict if there is no GPX track. Missing values are None.
+        """
+        if self.metrics is None or gpx_index is None:
+            return {}
+        return {key: None if np.isnan(value) else value for key, value in
+                self.metrics.at(gpx_index, t).items()}
+
+    def channels_at(self, gpx_index, t=None):
+        """Extension channels at GPX index and time t as dict
+
+        If time t is given channels are interpolated the same way as in
+        lib.geo.interpolate_many. Returns empty dict if there is no GPX
+        track. Missing values are None.
+        """
+        if not self.channels or gpx_index is None:
+            return {}
+        if t is None:
+            values = {name: self.track[name][gpx_index] for name in
+                    self.channels}
+        else:
+            gps = interpolate_many(self.track_index, [t], max_dt=np.inf,
+                    verbose=False)
+            values = {name: gps[name][0] for name in self.channels}
+        return {name: None if np.isnan(value) else float(value) for name,
+                value in values.items()}
+
+    def location_offsets(self, lats, lons, image_times, max_distance=None):
+        """Time offsets of images found from their positions
+
+        Each position is matched to the nearest track segment. Offset is
+        difference in seconds between image time and time of that position on
+        the track.
+
+        Returns
+        ------
+        numpy.ndarray, numpy.ndarray
+            Offsets (NaN where nothing was found closer than max_distance)
+            and distances in meters to the track
+        """
+        nearest = self.spatial_index.nearest_segments(lats, lons, max_distance)
+        offsets = (times_to_microseconds(image_times)-nearest['time'])/1e6
+        offsets[nearest['index'] < 0] = np.nan
+        return offsets, nearest['distance']
+
+    @property
+    def gpx(self):
+        """GPX track as list of tuples (time, lat, lon, elevation, speed, hr)
+
+        It is made from self.track the first time it is needed"""
+        if self._gpx is None and self.track is not None:
+            self._gpx = columns_to_points(self.track)
+        return self._gpx
 
     def is_break(self, index, seconds_from_start, next_image_start,
             effect_length, speedup_factor):
@@ -119,6 +347,32 @@ class GPXData(object):
 
         return (next_image_start-seconds_from_start)/speedup_factor > (2*effect_length+2) and  distance > 10
 
+    def are_breaks(self, seconds_from_start, next_image_start,
+            effect_length, speedup_factor):
+        """Array version of is_break
+
+        Checks many images at once. seconds_from_start and next_image_start
+        are arrays with one value per image. GPS positions at all the times are
+        interpolated at once and distances are computed in one pass.
+
+        Returns
+        ------
+        numpy.ndarray
+            Boolean array, True where image is last in recording break
+        """
+        seconds_from_start = np.asarray(seconds_from_start, dtype=np.float64)
+        next_image_start = np.asarray(next_image_start, dtype=np.float64)
+        start = datetime_to_microseconds(self.gpx_start_time)
+        gpx_start = interpolate_many(self.track_index,
+                start+np.round(seconds_from_start*10**6).astype(np.int64))
+        gpx_end = interpolate_many(self.track_index,
+                start+np.round(next_image_start*10**6).astype(np.int64))
+        distance = distance_array(gpx_start['lat'], gpx_start['lon'],
+                gpx_start['elevation'], gpx_end['lat'], gpx_end['lon'],
+                gpx_end['elevation'])
+        return ((next_image_start-seconds_from_start)/speedup_factor >
+                (2*effect_length+2)) & (distance > 10)
+
     def get_geo_at(self, index, seconds_from_start, return_index=False,
             from_index=False):
         """Gets geo information based on time from start"""
@@ -143,12 +397,14 @@ class GPXData(object):
         #print ("Getting geo at:{} {}, {} {}".format(t, seconds_from_start,
             #offset_time, self.gpx_start_time))
         lat, lon, bearing, elevation, speed, heart, idx = \
-                interpolate_lat_lon(self.gpx, t)
+                interpolate_lat_lon(self.track_index, t)
         #if not return_index:
         corrected_bearing = (bearing + offset_bearing) % 360
-        #FIXME: this needs to be interpolated
+        #Without image slope smoothed grade from the track is used
         if index is None:
-            slope = None
+            slope = self.metrics_at(idx, t).get('grade')
+            if slope is not None:
+                slope = int(round(slope))
         else:
             slope = self.gpx_data[index].slope
 #Returned times are not the same as times in Exif pictures they differ by
@@ -161,7 +417,13 @@ class GPXData(object):
             #return idx
 
 
-    def get_geo_from_exif(self, filename, time_offset=0):
+    def get_geo_from_exif(self, filename, time_offset=0, with_slope=True):
+        """Gets GPSData from EXIF of the image
+
+        If with_slope is True speed and slope from previous image in gpx_data
+        are also calculated. When whole sequence is read they are calculated
+        at the end for all images at once (see _set_slopes).
+        """
         try:
             geo_data, exif_time, bearing = exif_fields(filename)
             if self is not None and self.gpx_data:
@@ -177,7 +439,7 @@ class GPXData(object):
             elevation = geo_data["altitude"]
             speed = None
             slope = None
-            if self is not None and self.gpx_data:
+            if with_slope and self is not None and self.gpx_data:
                 last = self.gpx_data[-1]
                 seconds = (t-last.datetime).total_seconds()
                 length = geo.distance(last.lat, last.lon, last.elevation, lat,
@@ -194,12 +456,129 @@ class GPXData(object):
 
 
 
+    def _geo_from_exif_columns(self, index, time_offset=0):
+        """Gets GPSData of index-th image from already read EXIF columns
+
+        Same as get_geo_from_exif with with_slope=False, but without reading
+        the image again.
+        """
+        filename = self.exif['filename'][index]
+        lat = self.exif['lat'][index].item()
+        if np.isnan(lat):
+            print ("No latitude in {}".format(filename))
+            raise KeyError("latitude")
+        capture_time = self.exif['capture_time'][index]
+        if np.isnat(capture_time):
+            print("Skipping {0}: {1}".format(filename, "No capture time"))
+            return None
+        t = capture_time.astype(object) - \
+            datetime.timedelta(seconds=time_offset)
+        bearing = self.exif['direction'][index].item()
+        if np.isnan(bearing):
+            bearing = None
+        return GPSData(lat, self.exif['lon'][index].item(), bearing,
+                self.exif['altitude'][index].item(), None, None, t, None, None,
+                None)
+
+    def _set_slopes(self):
+        """Sets slope from previous image for all images in gpx_data
+
+        Slope is in % and is calculated from EXIF positions and altitudes
+        of consecutive images in one pass. It is None for the first image and
+        where images are at the same position.
+        """
+        if len(self.gpx_data) < 2:
+            return
+        columns = self.gpx_data.columns
+        lat = columns['lat']
+        lon = columns['lon']
+        ele = columns['elevation']
+        length = distance_array(lat[:-1], lon[:-1], ele[:-1], lat[1:], lon[1:],
+                ele[1:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.round((ele[1:]-ele[:-1])/length*100)
+        columns['slope'][1:] = np.where(np.isfinite(slopes), slopes, np.nan)
+
+    def _add_exif_using_offsets(self, sequence, creation_times,
+            given_offset_time=0, offset_bearing=0):
+        """Adds GPSData for all images in sequence to gpx_data
+
+        EXIF of images is taken from self.exif columns read in __init__.
+
+        Same as calling _add_exif_using_timestamp for each image with offset
+        of previous image, but offsets for all images are found at once with
+        find_time_offsets.
+
+        Distance between EXIF and GPX position for each added image is saved
+        in offset_residuals and names of images without found offset in
+        unmatched_images.
+        """
+        filenames = []
+        times = []
+        geo_exifs = []
+        for i, (filename, file_creation_time) in enumerate(zip(sequence,
+            creation_times)):
+            geo_exif = self._geo_from_exif_columns(i)
+            if geo_exif is None:
+                continue
+            filenames.append(filename)
+            times.append(file_creation_time)
+            geo_exifs.append(geo_exif)
+        if not geo_exifs:
+            return
+
+        if self.match_by_location:
+            location_offsets, _ = self.location_offsets(
+                    [g.lat for g in geo_exifs], [g.lon for g in geo_exifs],
+                    times)
+            if np.isfinite(location_offsets).any():
+                given_offset_time = int(round(np.nanmedian(location_offsets)))
+                print ("Time offset from image locations: {}s".format(
+                    given_offset_time))
+
+        offsets, residuals, unmatched = find_time_offsets(self.track_index,
+                times, [g.lat for g in geo_exifs], [g.lon for g in geo_exifs],
+                given_offset_time)
+        self.unmatched_images = [filenames[i] for i in unmatched]
+        for filename in self.unmatched_images:
+            print ("No offset diff found for {}".format(filename))
+
+        image_us = times_to_microseconds(times)
+        gpx_times = image_us-np.round(offsets*10**6).astype(np.int64)
+        track_times = self.track['time']
+        in_track = (gpx_times >= track_times[0]-10**6) & \
+                (gpx_times <= track_times[-1]+10**6)
+        gps = interpolate_many(self.track_index, gpx_times[in_track],
+                verbose=False)
+        speeds = np.full(len(gpx_times), np.nan)
+        hearts = np.full(len(gpx_times), np.nan)
+        speeds[in_track] = gps['speed']
+        hearts[in_track] = gps['hr']
+
+        self.offset_residuals = []
+        for i, (filename, geo_exif) in enumerate(zip(filenames, geo_exifs)):
+            if not in_track[i]:
+                print("Skipping {0}: {1}".format(filename,
+                    "Time t not in scope of gpx file."))
+                continue
+            offset_time = offsets[i].item()
+            if offset_time.is_integer():
+                offset_time = int(offset_time)
+            corrected_bearing = (geo_exif.bearing + offset_bearing) % 360
+            t = EPOCH + datetime.timedelta(microseconds=int(gpx_times[i]))
+            self.gpx_data.append(GPSData(geo_exif.lat, geo_exif.lon,
+                corrected_bearing, geo_exif.elevation,
+                speeds[i].item(), hearts[i].item(), t,
+                os.path.basename(filename), geo_exif.slope, offset_time))
+            self.offset_residuals.append(residuals[i].item())
+
     #Adds lat,lon, bearing, elevation,speed, heart, time to gpx_data list at time when gilename image was created
     #Those information are interpolated from points array and found based on offset_time 
     def _add_exif_using_timestamp(self, filename, file_creation_time, points,
-            given_offset_time=0, offset_bearing=0):
+            given_offset_time=0, offset_bearing=0, geo_exif=None):
         try:
-            geo_exif = self.get_geo_from_exif(filename)
+            if geo_exif is None:
+                geo_exif = self.get_geo_from_exif(filename, with_slope=False)
             lat_exif = round(geo_exif.lat, 5)
             lon_exif = round(geo_exif.lon, 5)
             found_diff = False
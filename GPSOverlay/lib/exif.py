@@ -5,7 +5,9 @@
 
 import os
 import sys
+import struct
 import exifread
+from exifread.utils import Ratio
 import datetime
 from .geo import normalize_bearing
 
@@ -110,6 +112,181 @@ def is_image(filename):
     return filename.lower().endswith(('jpg', 'jpeg', 'png', 'tif', 'tiff', 'pgm', 'pnm', 'gif'))
 
 
+# Tags read by read_exif_tags. Names are the same as in exifread
+# IFD0 and Exif IFD share tag numbers
+FAST_EXIF_TAGS = {
+    0x0100: 'ImageWidth',
+    0x0101: 'ImageLength',
+    0x010E: 'ImageDescription',
+    0x010F: 'Make',
+    0x0110: 'Model',
+    0x0112: 'Orientation',
+    0x0132: 'DateTime',
+    0x9003: 'DateTimeOriginal',
+    0x9004: 'DateTimeDigitized',
+    0x9290: 'SubSecTime',
+    0x9291: 'SubSecTimeOriginal',
+    0x9292: 'SubSecTimeDigitized',
+    0xA002: 'ExifImageWidth',
+    0xA003: 'ExifImageLength',
+    0xA433: 'LensMake',
+    0xA434: 'LensModel',
+}
+
+FAST_GPS_TAGS = {
+    0x0001: 'GPSLatitudeRef',
+    0x0002: 'GPSLatitude',
+    0x0003: 'GPSLongitudeRef',
+    0x0004: 'GPSLongitude',
+    0x0005: 'GPSAltitudeRef',
+    0x0006: 'GPSAltitude',
+    0x0007: 'GPSTimeStamp',
+    0x000B: 'GPSDOP',
+    0x000E: 'GPSTrackRef',
+    0x000F: 'GPSTrack',
+    0x0010: 'GPSImgDirectionRef',
+    0x0011: 'GPSImgDirection',
+    0x001D: 'GPSDate',
+}
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+# TIFF field type: (struct format, size)
+# Types not here (floats) aren't handled by read_exif_tags
+FAST_FIELD_TYPES = {
+    1: ('B', 1),
+    2: ('s', 1),
+    3: ('H', 2),
+    4: ('I', 4),
+    5: ('I', 8),
+    6: ('b', 1),
+    7: ('B', 1),
+    8: ('h', 2),
+    9: ('i', 4),
+    10: ('i', 8),
+}
+
+
+class FastTag:
+    '''
+    Tag read by read_exif_tags
+
+    Has values the same as exifread IfdTag: str for ASCII fields, list of
+    Ratio for rational fields and list of ints otherwise
+    '''
+    __slots__ = ('values', 'printable')
+
+    def __init__(self, values):
+        self.values = values
+        if not isinstance(values, str) and len(values) == 1:
+            self.printable = str(values[0])
+        else:
+            self.printable = str(values)
+
+    def __str__(self):
+        return self.printable
+
+    def __repr__(self):
+        return self.printable
+
+
+def _read_app1(fileobj):
+    '''
+    Returns TIFF data from EXIF APP1 segment of JPEG or None
+    '''
+    if fileobj.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        marker = fileobj.read(4)
+        if len(marker) < 4 or marker[0] != 0xff:
+            return None
+        length = (marker[2] << 8) | marker[3]
+        if marker[1] == 0xe1:
+            data = fileobj.read(length - 2)
+            if data[:6] == b'Exif\x00\x00':
+                return data[6:]
+        # Start of scan or end of image: there is no EXIF
+        elif marker[1] in (0xda, 0xd9):
+            return None
+        else:
+            fileobj.seek(length - 2, 1)
+
+
+def _read_ifd(tiff, endian, offset, prefix, names, tags):
+    '''
+    Adds tags from names in IFD at offset to tags
+
+    Returns dictionary of sub IFD pointers in this IFD
+    '''
+    pointers = {}
+    count, = struct.unpack_from(endian + 'H', tiff, offset)
+    for i in range(count):
+        entry = offset + 2 + 12 * i
+        tag, field_type, n = struct.unpack_from(endian + 'HHI', tiff, entry)
+        if tag in (EXIF_IFD_POINTER, GPS_IFD_POINTER) and prefix == 'Image':
+            pointers[tag], = struct.unpack_from(endian + 'I', tiff, entry + 8)
+            continue
+        name = names.get(tag)
+        if name is None:
+            continue
+        if field_type not in FAST_FIELD_TYPES or n >= 1000:
+            raise ValueError("Unhandled field type {} of {}".format(field_type, name))
+        fmt, size = FAST_FIELD_TYPES[field_type]
+        value_offset = entry + 8
+        if n * size > 4:
+            value_offset, = struct.unpack_from(endian + 'I', tiff, value_offset)
+        if value_offset + n * size > len(tiff):
+            raise ValueError("Value of {} is outside of APP1".format(name))
+        if field_type == 2:
+            values = tiff[value_offset:value_offset + n].split(b'\x00', 1)[0]
+            values = values.decode('utf-8')
+        elif field_type in (5, 10):
+            ints = struct.unpack_from(endian + fmt * (2 * n), tiff, value_offset)
+            values = [Ratio(ints[j], ints[j + 1]) for j in range(0, 2 * n, 2)]
+        else:
+            values = list(struct.unpack_from(endian + fmt * n, tiff, value_offset))
+        tags[prefix + ' ' + name] = FastTag(values)
+    return pointers
+
+
+def read_exif_tags(filename):
+    '''
+    Reads only tags used by EXIF class from APP1 segment of JPEG
+
+    Only the start of the file up to the end of APP1 segment is read and only
+    tags in FAST_EXIF_TAGS and FAST_GPS_TAGS from IFD0, Exif IFD and GPS IFD
+    are parsed.
+
+    Returns dictionary of FastTag with the same keys as exifread.process_file
+    or None if file isn't JPEG with EXIF or has something unusual in needed
+    tags. Then exifread should be used.
+    '''
+    with open(filename, 'rb') as fileobj:
+        tiff = _read_app1(fileobj)
+    if tiff is None:
+        return None
+    try:
+        if tiff[:2] == b'II':
+            endian = '<'
+        elif tiff[:2] == b'MM':
+            endian = '>'
+        else:
+            return None
+        ifd0, = struct.unpack_from(endian + 'I', tiff, 4)
+        tags = {}
+        pointers = _read_ifd(tiff, endian, ifd0, 'Image', FAST_EXIF_TAGS, tags)
+        if EXIF_IFD_POINTER in pointers:
+            _read_ifd(tiff, endian, pointers[EXIF_IFD_POINTER], 'EXIF',
+                      FAST_EXIF_TAGS, tags)
+        if GPS_IFD_POINTER in pointers:
+            _read_ifd(tiff, endian, pointers[GPS_IFD_POINTER], 'GPS',
+                      FAST_GPS_TAGS, tags)
+    except (struct.error, ValueError):
+        return None
+    return tags
+
+
 class EXIF:
     '''
     EXIF class for reading exif from an image
@@ -120,8 +297,11 @@ class EXIF:
         '''
         self.filename = filename
         if type(filename) == str:
-            with open(filename, 'rb') as fileobj:
-                self.tags = exifread.process_file(fileobj, details=details)
+            # Fast path for usual JPEGs. Falls back to exifread
+            self.tags = None if details else read_exif_tags(filename)
+            if self.tags is None:
+                with open(filename, 'rb') as fileobj:
+                    self.tags = exifread.process_file(fileobj, details=details)
         else:
             self.tags = exifread.process_file(filename, details=details)
 
@@ -3,9 +3,11 @@
 #From https://github.com/mapillary/mapillary_tools
 #Commit aa122c9671ab26f1fc9026267e069a1a5234dd67
 
+import bisect
 import datetime
 import math
 
+import numpy as np
 import gpxpy.geo
 
 WGS84_a = 6378137.0
@@ -48,6 +50,75 @@ def gps_distance(latlon_1, latlon_2):
 
     return dis
 
+def ecef_from_lla_array(lat, lon, alt):
+    '''
+    Array version of ecef_from_lla
+    '''
+    a2 = WGS84_a**2
+    b2 = WGS84_b**2
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    L = 1.0 / np.sqrt(a2 * np.cos(lat)**2 + b2 * np.sin(lat)**2)
+    x = (a2 * L + alt) * np.cos(lat) * np.cos(lon)
+    y = (a2 * L + alt) * np.cos(lat) * np.sin(lon)
+    z = (b2 * L + alt) * np.sin(lat)
+    return x, y, z
+
+
+def gps_distance_array(lat1, lon1, lat2, lon2):
+    '''
+    Array version of gps_distance (straight line distance between ECEF
+    points on the ellipsoid)
+    '''
+    x1, y1, z1 = ecef_from_lla_array(lat1, lon1, 0.)
+    x2, y2, z2 = ecef_from_lla_array(lat2, lon2, 0.)
+
+    return np.sqrt((x1-x2)**2 + (y1-y2)**2 + (z1-z2)**2)
+
+
+def haversine_distance_array(lat1, lon1, lat2, lon2):
+    '''
+    Haversine distance in meters between arrays of points.
+
+    Array version of gpxpy.geo.haversine_distance.
+    '''
+    d_lon = np.radians(np.subtract(lon1, lon2))
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    d_lat = lat1 - lat2
+
+    a = np.sin(d_lat/2)**2 + np.sin(d_lon/2)**2 * np.cos(lat1) * np.cos(lat2)
+    return gpxpy.geo.EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+
+
+def distance_array(lat1, lon1, ele1, lat2, lon2, ele2, haversine=False):
+    '''
+    Distance in meters between arrays of points.
+
+    Array version of gpxpy.geo.distance with the same numeric results:
+    points further then 0.2 degrees apart use haversine distance, the rest a
+    flat approximation. Missing elevations (NaN) give 2D distance.
+    '''
+    lat1 = np.asarray(lat1, dtype=np.float64)
+    lon1 = np.asarray(lon1, dtype=np.float64)
+    lat2 = np.asarray(lat2, dtype=np.float64)
+    lon2 = np.asarray(lon2, dtype=np.float64)
+    x = lat1 - lat2
+    y = (lon1 - lon2) * np.cos(np.radians(lat1))
+    dist = np.sqrt(x * x + y * y) * gpxpy.geo.ONE_DEGREE
+    if ele1 is not None and ele2 is not None:
+        d_ele = np.subtract(ele1, ele2, dtype=np.float64)
+        with_ele = np.isfinite(d_ele) & (d_ele != 0)
+        dist = np.where(with_ele, np.sqrt(dist**2 + np.where(with_ele,
+            d_ele, 0)**2), dist)
+    far = (np.abs(x) > .2) | (np.abs(lon1 - lon2) > .2)
+    if haversine:
+        far = np.ones_like(far)
+    if far.any():
+        dist = np.where(far, haversine_distance_array(lat1, lon1, lat2,
+            lon2), dist)
+    return dist
+
 def dms_to_decimal(degrees, minutes, seconds, hemisphere):
     '''
     Convert from degrees, minutes, seconds to decimal degrees.
@@ -92,6 +163,16 @@ def utc_to_localtime(utc_time):
     utc_offset_timedelta = datetime.datetime.utcnow() - datetime.datetime.now()
     return utc_time - utc_offset_timedelta
 
+def utc_offset_microseconds():
+    '''
+    Difference between UTC and local time in microseconds
+
+    Same offset as utc_to_localtime uses, rounded to whole seconds. Subtract
+    it from UTC epoch times to get local times.
+    '''
+    utc_offset_timedelta = datetime.datetime.utcnow() - datetime.datetime.now()
+    return int(round(utc_offset_timedelta.total_seconds())) * 10**6
+
 
 def compute_bearing(start_lat, start_lon, end_lat, end_lon):
     '''
@@ -121,6 +202,23 @@ def compute_bearing(start_lat, start_lon, end_lat, end_lon):
 
     return bearing
 
+def compute_bearing_array(start_lat, start_lon, end_lat, end_lon):
+    '''
+    Array version of compute_bearing
+    '''
+    start_lat = np.radians(start_lat)
+    start_lon = np.radians(start_lon)
+    end_lat = np.radians(end_lat)
+    end_lon = np.radians(end_lon)
+
+    dLong = end_lon - start_lon
+    dLong = np.where(dLong > math.pi, -(2.0 * math.pi - dLong), dLong)
+    dLong = np.where(dLong < -math.pi, 2.0 * math.pi + dLong, dLong)
+
+    y = np.sin(dLong)*np.cos(end_lat)
+    x = np.cos(start_lat)*np.sin(end_lat) - np.sin(start_lat)*np.cos(end_lat)*np.cos(dLong)
+    return (np.degrees(np.arctan2(y, x)) + 360.0) % 360.0
+
 def diff_bearing(b1, b2):
     '''
     Compute difference between two bearings
@@ -130,6 +228,14 @@ def diff_bearing(b1, b2):
     return d
 
 
+def diff_bearing_array(b1, b2):
+    '''
+    Array version of diff_bearing
+    '''
+    d = np.abs(np.subtract(b2, b1))
+    return np.where(d > 180, 360-d, d)
+
+
 def offset_bearing(bearing, offset):
     '''
     Add offset to bearing
@@ -150,14 +256,80 @@ def normalize_bearing(bearing, check_hex=False):
     bearing %= 360
     return bearing
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+#Columns every track has. Other columns are extension channels
+GPX_COLUMNS = ('time', 'lat', 'lon', 'elevation', 'speed', 'hr')
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def datetime_to_microseconds(t):
+    '''
+    Convert naive datetime to microseconds since epoch
+    '''
+    return (t - EPOCH) // ONE_MICROSECOND
+
+
+class TrackIndex(object):
+    '''
+    Sorted time index over track points
+
+    Finds the points enclosing a time with bisection instead of scanning the
+    whole track. Create it once per track and pass it to interpolate_lat_lon
+    (which doesn't accept the list of points any more).
+
+    Points are a list of tuples (time, lat, lon, elevation, speed, hr) sorted
+    by time or dict of columns as returned by
+    gps_parser.get_track_columns_from_gpx. For columns tuples are made only for
+    the points that are actually used, same as
+    gps_parser.columns_to_points would make them.
+    '''
+    def __init__(self, points):
+        if isinstance(points, dict):
+            self.columns = points
+            self.points = None
+            self.times = points['time']
+        else:
+            self.columns = None
+            self.points = points
+            self.times = [point[0] for point in points]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, i):
+        if self.points is not None:
+            return self.points[i]
+        columns = self.columns
+        ele = float(columns['elevation'][i])
+        speed = float(columns['speed'][i])
+        return (EPOCH + datetime.timedelta(microseconds=int(columns['time'][i])),
+                float(columns['lat'][i]), float(columns['lon'][i]),
+                None if math.isnan(ele) else ele, speed if speed else 0,
+                int(columns['hr'][i]))
+
+    def find(self, t):
+        '''
+        Index of the first point which is after time t
+        '''
+        if self.points is not None:
+            return bisect.bisect_right(self.times, t)
+        return int(np.searchsorted(self.times, datetime_to_microseconds(t),
+            side='right'))
+
+
 #Function now also returns index of point and interpolates
 #Speed and heartrate
 def interpolate_lat_lon(points, t, max_dt=1):
     '''
     Return interpolated lat, lon and compass bearing for time t.
 
-    Points is a list of tuples (time, lat, lon, elevation), t a datetime object.
+    Points is a TrackIndex, t a datetime object. Make TrackIndex once per
+    track (from list of tuples (time, lat, lon, elevation, speed, hr) or
+    columns), making it for each call would scan the whole track every time.
     '''
+    if not isinstance(points, TrackIndex):
+        raise TypeError("interpolate_lat_lon needs TrackIndex of points, "
+                "got {}".format(type(points).__name__))
     # find the enclosing points in sorted list
     if (t<=points[0][0]) or (t>=points[-1][0]):
         if t<=points[0][0]:
@@ -187,15 +359,9 @@ def interpolate_lat_lon(points, t, max_dt=1):
             x = points[-1]
             return (x[1], x[2], bearing, x[3], x[4], x[5], -1)
     else:
-        for i,point in enumerate(points):
-            if t<point[0]:
-                if i>0:
-                    before = points[i-1]
-                else:
-                    before = points[i]
-                after = points[i]
-                idx = i
-                break
+        idx = points.find(t)
+        before = points[idx-1]
+        after = points[idx]
 
     # time diff
     dt_before = (t-before[0]).total_seconds()
@@ -207,7 +373,9 @@ def interpolate_lat_lon(points, t, max_dt=1):
 
     bearing = compute_bearing(before[1], before[2], after[1], after[2])
 
-    if before[3] is not None:
+    #Elevation is missing if one of enclosing points doesn't have it (same as
+    #NaN in interpolate_many)
+    if before[3] is not None and after[3] is not None:
         ele = (before[3]*dt_after + after[3]*dt_before) / (dt_before + dt_after)
     else:
         ele = None
@@ -238,3 +406,155 @@ def interpolate_lat_lon(points, t, max_dt=1):
 
 
     return lat, lon, bearing, ele, speed, hr, idx
+
+
+def track_columns(track):
+    '''
+    Columns of a track given as dict of columns, TrackIndex or list of tuples
+    '''
+    if isinstance(track, TrackIndex):
+        if track.columns is not None:
+            return track.columns
+        track = track.points
+    if isinstance(track, dict):
+        return track
+    return {
+            'time': np.array([p[0] for p in track], dtype='datetime64[us]')
+                .astype(np.int64),
+            'lat': np.array([p[1] for p in track], dtype=np.float64),
+            'lon': np.array([p[2] for p in track], dtype=np.float64),
+            'elevation': np.array([np.nan if p[3] is None else p[3]
+                for p in track], dtype=np.float64),
+            'speed': np.array([p[4] or 0 for p in track], dtype=np.float64),
+            'hr': np.array([p[5] for p in track], dtype=np.float64),
+            }
+
+
+def track_channels(columns):
+    '''
+    Names of extension channels (cad, atemp, power...) in track columns
+
+    Those are all columns besides GPX_COLUMNS, sorted by name
+    '''
+    return sorted(key for key in columns if key not in GPX_COLUMNS)
+
+
+def times_to_microseconds(times):
+    '''
+    Convert times to int64 microseconds since epoch
+
+    Times can be an int64 array which is already in microseconds, a
+    datetime64 array or a list of naive datetimes
+    '''
+    times = np.asarray(times)
+    if times.dtype == object:
+        times = times.astype('datetime64[us]')
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype('datetime64[us]').astype(np.int64)
+    return times.astype(np.int64)
+
+
+def interpolate_many(track, times, max_dt=1, verbose=True):
+    '''
+    Vectorized interpolate_lat_lon for many times at once
+
+    Track is a dict of columns (see gps_parser.get_track_columns_from_gpx),
+    TrackIndex or list of tuples. Times can be anything times_to_microseconds
+    accepts.
+
+    Enclosing points are found with searchsorted and values are linearly
+    blended in one pass. Results are the same as calling interpolate_lat_lon
+    for each time (elevation is NaN instead of None when one of enclosing
+    points doesn't have it). Only exception
+    is bearing exactly at the first point, which is bearing of the first
+    segment instead of the last one.
+
+    Returns dict of arrays: lat, lon, bearing, elevation, speed, hr, each
+    extension channel (see track_channels) by its name and index of the
+    point after each time (0 or -1 at the track ends). All extension channels
+    are blended together as one 2D array. Missing channel values are NaN.
+
+    If verbose is False warning about extrapolated times isn't printed.
+    '''
+    columns = track_columns(track)
+    track_times = columns['time']
+    n = len(track_times)
+    t = times_to_microseconds(times)
+
+    # how far outside of the track times are in seconds
+    outside = np.maximum(track_times[0] - t, t - track_times[-1]) / 1e6
+    if np.any(outside > max_dt):
+        raise ValueError("Time t not in scope of gpx file.")
+    extrapolated = np.count_nonzero(outside > 0)
+    if extrapolated and verbose:
+        print ("Warning: {} times not in scope of gpx file, extrapolating...".format(extrapolated))
+
+    index = np.searchsorted(track_times, t, side='right')
+    after = np.clip(index, 1, n-1)
+    before = after - 1
+    at_start = t <= track_times[0]
+    at_end = t >= track_times[-1]
+
+    dt_before = (t - track_times[before]) / 1e6
+    dt_after = (track_times[after] - t) / 1e6
+    dt = dt_before + dt_after
+
+    def blend(column):
+        values = np.asarray(column, dtype=np.float64)
+        return (values[before]*dt_after + values[after]*dt_before) / dt
+
+    lat_col = np.asarray(columns['lat'], dtype=np.float64)
+    lon_col = np.asarray(columns['lon'], dtype=np.float64)
+    lat = blend(lat_col)
+    lon = blend(lon_col)
+    ele = blend(columns['elevation'])
+    bearing = compute_bearing_array(lat_col[before], lon_col[before],
+            lat_col[after], lon_col[after])
+
+    before_speed = np.asarray(columns['speed'], dtype=np.float64)[before]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        #speed is calculated as distance/time
+        speed = distance_array(lat_col[before], lon_col[before],
+                np.asarray(columns['elevation'], dtype=np.float64)[before],
+                lat, lon, ele) / dt_before
+    speed = np.where(dt_before == 0, before_speed, speed)
+    speed = np.where(before_speed == 0, 0, speed)
+
+    before_hr = np.asarray(columns['hr'], dtype=np.float64)[before]
+    hr = np.where(before_hr == 0, 0, blend(columns['hr']))
+
+    channels = track_channels(columns)
+    channel_values = np.empty((len(channels), len(t)))
+    if channels:
+        channel_before = np.array([np.asarray(columns[key])[before]
+            for key in channels], dtype=np.float64)
+        channel_after = np.array([np.asarray(columns[key])[after]
+            for key in channels], dtype=np.float64)
+        channel_values = (channel_before*dt_after +
+                channel_after*dt_before) / dt
+
+    index = np.where(at_end, -1, np.where(at_start, 1, index))
+
+    # times exactly at the ends return values of end points
+    for exact, point in ((t == track_times[0], 0), (t == track_times[-1], -1)):
+        if np.any(exact):
+            lat[exact] = lat_col[point]
+            lon[exact] = lon_col[point]
+            ele[exact] = columns['elevation'][point]
+            speed[exact] = columns['speed'][point]
+            hr[exact] = columns['hr'][point]
+            for row, key in enumerate(channels):
+                channel_values[row, exact] = columns[key][point]
+            index[exact] = point
+
+    result = dict(zip(channels, channel_values))
+    result.update({
+            'lat': lat,
+            'lon': lon,
+            'bearing': bearing,
+            'elevation': ele,
+            'speed': speed,
+            'hr': hr,
+            'index': index,
+            })
+    return result
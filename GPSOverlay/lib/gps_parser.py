@@ -8,9 +8,17 @@ from __future__ import print_function
 
 import sys
 import os
+import re
+import math
 import datetime
 import time
-from .geo import gpgga_to_dms, utc_to_localtime
+from array import array
+from xml.etree import ElementTree
+
+import numpy as np
+
+from .geo import gpgga_to_dms, utc_to_localtime, utc_offset_microseconds, \
+        distance_array, GPX_COLUMNS
 
 try:
     import gpxpy
@@ -22,6 +30,240 @@ except ImportError as error:
 Methods for parsing gps data from various file format e.g. GPX, NMEA, SRT.
 '''
 
+_GPX_TIME_RE = re.compile(r'^\s*(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)'
+        r'(Z|[+-]\d\d:?\d\d)?\s*$')
+
+#How many time strings are collected before they are converted with numpy
+_TIME_CHUNK = 65536
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _parse_utc_offset(offset):
+    '''
+    Convert ISO 8601 UTC offset (+01:00, -0230, Z) to microseconds
+    '''
+    if offset is None or offset == 'Z':
+        return 0
+    sign = -1 if offset[0] == '-' else 1
+    digits = offset[1:].replace(':', '')
+    return sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60) * 10**6
+
+
+def compute_speeds(time_col, lat_col, lon_col, ele_col):
+    '''
+    Speed in m/s of each point from the previous one (0 for the first point
+    and points with the same time)
+    '''
+    speed_col = np.zeros(len(time_col), dtype=np.float64)
+    if len(time_col) > 1:
+        seconds = np.abs(np.diff(time_col)) / 1e6
+        length = distance_array(lat_col[:-1], lon_col[:-1], ele_col[:-1],
+                lat_col[1:], lon_col[1:], ele_col[1:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed_col[1:] = np.where(seconds > 0, length / seconds, 0)
+    return speed_col
+
+
+def get_track_columns_from_gpx(gpx_file, local_time=True, waypoints=True,
+        segments=False):
+    '''
+    Stream track points and waypoints from a GPX file into NumPy columns.
+
+    The file is read with iterparse and each point is discarded as soon as
+    it is read, so memory use is a few bytes per point.
+
+    Returns a dict with the columns from GPX_COLUMNS:
+        - time: int64 microseconds since epoch
+        - lat, lon: float64
+        - elevation: float32, NaN if point has no elevation
+        - speed: float32 speed in m/s from previous track point
+        - hr: float32 heart rate, 0 if point doesn't have it
+
+    Every other element with a number in point extensions (cad, atemp, power
+    from Garmin TrackPointExtension or any other namespace) is an extension
+    channel. Channels are found while the file is read and each one becomes
+    a float32 column named by the element's local name (prefixed with ext_ if
+    it is the same as one of GPX_COLUMNS). Points without the channel have
+    NaN in it.
+
+    Points are sorted by time. Points without time are skipped.
+    Times are converted to local time the same way as in
+    get_lat_lon_time_from_gpx. If waypoints is False only track points are
+    read.
+
+    If segments is True (columns, segment) is returned. segment is int32
+    array with index of trkseg (counted over all trk elements) of each point
+    in the same order as columns, -1 for waypoints.
+    '''
+    times = array('q')
+    time_chunk = []
+    offsets = array('q')
+    lats = array('d')
+    lons = array('d')
+    elevations = array('d')
+    hrs = array('f')
+    point_segments = array('i')
+    segment = -1
+    #Extension channel name -> values of all track points read so far
+    channels = {}
+    #Track points are first, waypoints are added after them
+    wpt_rows = []
+
+    def flush_times():
+        if time_chunk:
+            times.extend(np.array(time_chunk, dtype='datetime64[us]')
+                    .astype(np.int64))
+            del time_chunk[:]
+
+    #Elements which are still open, so that read elements can be removed
+    #from their parent
+    open_elements = []
+    for event, elem in ElementTree.iterparse(gpx_file, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(elem)
+            if _local_name(elem.tag) == 'trkseg':
+                segment += 1
+            continue
+        open_elements.pop()
+        name = _local_name(elem.tag)
+        if name not in ('trkpt', 'wpt'):
+            if name in ('trkseg', 'trk', 'rte') and open_elements:
+                open_elements[-1].remove(elem)
+            continue
+
+        point_time = None
+        ele = np.nan
+        hr = 0
+        point_channels = {}
+        for child in elem:
+            child_name = _local_name(child.tag)
+            if child_name == 'time':
+                point_time = child.text
+            elif child_name == 'ele' and child.text:
+                ele = float(child.text)
+            elif child_name == 'extensions':
+                for ext in child.iter():
+                    if len(ext) or not ext.text:
+                        continue
+                    ext_name = _local_name(ext.tag)
+                    try:
+                        value = float(ext.text)
+                    except ValueError:
+                        continue
+                    if ext_name == 'hr':
+                        hr = value
+                    else:
+                        if ext_name in GPX_COLUMNS:
+                            ext_name = 'ext_' + ext_name
+                        point_channels[ext_name] = value
+        lat = float(elem.get('lat'))
+        lon = float(elem.get('lon'))
+        if open_elements:
+            open_elements[-1].remove(elem)
+        if point_time is None:
+            continue
+        match = _GPX_TIME_RE.match(point_time)
+        if match is None:
+            raise ValueError("Unknown GPX time format: {}".format(point_time))
+        if name == 'wpt':
+            if waypoints:
+                wpt_rows.append((match.group(1), _parse_utc_offset(match.group(2)),
+                    lat, lon, ele, point_channels))
+            continue
+        for ext_name in point_channels:
+            if ext_name not in channels:
+                channels[ext_name] = array('f', [np.nan])*len(lats)
+        for ext_name, values in channels.items():
+            values.append(point_channels.get(ext_name, np.nan))
+        time_chunk.append(match.group(1))
+        offsets.append(_parse_utc_offset(match.group(2)))
+        lats.append(lat)
+        lons.append(lon)
+        elevations.append(ele)
+        hrs.append(hr)
+        point_segments.append(max(segment, 0))
+        if len(time_chunk) >= _TIME_CHUNK:
+            flush_times()
+    flush_times()
+
+    time_col = np.frombuffer(times, dtype=np.int64) - \
+            np.frombuffer(offsets, dtype=np.int64)
+    lat_col = np.frombuffer(lats, dtype=np.float64)
+    lon_col = np.frombuffer(lons, dtype=np.float64)
+    ele_col = np.frombuffer(elevations, dtype=np.float64)
+
+    # speed between consecutive track points in file order
+    speed_col = compute_speeds(time_col, lat_col, lon_col, ele_col)
+
+    columns = {
+            'time': time_col,
+            'lat': lat_col,
+            'lon': lon_col,
+            'elevation': ele_col.astype(np.float32),
+            'speed': speed_col.astype(np.float32),
+            'hr': np.frombuffer(hrs, dtype=np.float32),
+            }
+    for ext_name in sorted(channels):
+        columns[ext_name] = np.frombuffer(channels[ext_name], dtype=np.float32)
+    segment_col = np.frombuffer(point_segments, dtype=np.int32)
+    if wpt_rows:
+        wpt_times = np.array([w[0] for w in wpt_rows],
+                dtype='datetime64[us]').astype(np.int64) - \
+                np.array([w[1] for w in wpt_rows], dtype=np.int64)
+        wpt_columns = {
+                'time': wpt_times,
+                'lat': np.array([w[2] for w in wpt_rows], dtype=np.float64),
+                'lon': np.array([w[3] for w in wpt_rows], dtype=np.float64),
+                'elevation': np.array([w[4] for w in wpt_rows],
+                    dtype=np.float32),
+                'speed': np.zeros(len(wpt_rows), dtype=np.float32),
+                'hr': np.zeros(len(wpt_rows), dtype=np.float32),
+                }
+        for ext_name in channels:
+            wpt_columns[ext_name] = np.array([w[5].get(ext_name, np.nan)
+                for w in wpt_rows], dtype=np.float32)
+        columns = {key: np.concatenate((value, wpt_columns[key]))
+                for key, value in columns.items()}
+        segment_col = np.concatenate((segment_col,
+            np.full(len(wpt_rows), -1, dtype=np.int32)))
+
+    # sort by time just in case (ties are sorted by lat, lon like tuples were)
+    order = np.lexsort((columns['lon'], columns['lat'], columns['time']))
+    if np.any(order != np.arange(len(order))):
+        columns = {key: value[order] for key, value in columns.items()}
+        segment_col = segment_col[order]
+    else:
+        columns = {key: np.array(value) for key, value in columns.items()}
+        segment_col = np.array(segment_col)
+
+    if local_time:
+        columns['time'] -= utc_offset_microseconds()
+
+    if segments:
+        return columns, segment_col
+    return columns
+
+
+def columns_to_points(columns):
+    '''
+    Convert GPX columns to list of tuples (time, lat, lon, elevation, speed, hr)
+
+    Compatibility view for code that expects the output of
+    get_lat_lon_time_from_gpx. Times are naive datetime objects, missing
+    elevation is None.
+    '''
+    times = columns['time'].astype('datetime64[us]').tolist()
+    elevations = [None if math.isnan(e) else e
+            for e in columns['elevation'].tolist()]
+    speeds = [s if s else 0 for s in columns['speed'].tolist()]
+    hrs = [int(h) for h in columns['hr'].tolist()]
+    return list(zip(times, columns['lat'].tolist(), columns['lon'].tolist(),
+        elevations, speeds, hrs))
+
+
 #Function now returns also speed and heart rate
 def get_lat_lon_time_from_gpx(gpx_file, local_time=True):
     '''
@@ -34,72 +276,207 @@ def get_lat_lon_time_from_gpx(gpx_file, local_time=True):
     So times are in local time converted from UTC based on current date
     difference. Times can be wrong if DST happened between recording of track
     and now.
+
+    This is a view over get_track_columns_from_gpx.
     '''
-    with open(gpx_file, 'r') as f:
-        gpx = gpxpy.parse(f, None, '1.1')
-
-    points = []
-    prev_point = None
-    if len(gpx.tracks)>0:
-        for track in gpx.tracks:
-            for segment in track.segments:
-                for point in segment.points:
-                    t = utc_to_localtime(point.time) if local_time else point.time
-                    speed = 0
-                    hr = 0
-                    try:
-                        hr = int(point.extensions['hr'])
-                    except KeyError as k:
-                        pass
-                    if prev_point is not None:
-                        speed = prev_point.speed_between(point)
-                    points.append( (t, point.latitude, point.longitude,
-                        point.elevation, speed, hr) )
-                    prev_point = point
-    if len(gpx.waypoints) > 0:
-        for point in gpx.waypoints:
-            t = utc_to_localtime(point.time) if local_time else point.time
-            points.append( (t, point.latitude, point.longitude,
-                point.elevation, 0, 0) )
-
-    # sort by time just in case
-    points.sort()
-
-    return points
+    return columns_to_points(get_track_columns_from_gpx(gpx_file, local_time))
 
 
-def get_lat_lon_time_from_nmea(nmea_file, local_time=True):
+#How many NMEA lines are checksummed at once
+_NMEA_CHUNK = 4096
+
+_NMEA_EPOCH = datetime.date(1970, 1, 1)
+
+_NMEA_DM_RE = re.compile(r'^(\d+)(\d\d\.\d+)$')
+
+
+def _nmea_checksums(bodies):
     '''
-    Read location and time stamps from a track in a NMEA file.
+    XOR of all characters of each sentence body (between $ and *)
+    '''
+    data = np.frombuffer(''.join(bodies).encode('latin-1'), dtype=np.uint8)
+    lengths = np.fromiter((len(body) for body in bodies), dtype=np.int64,
+            count=len(bodies))
+    return np.bitwise_xor.reduceat(data, np.cumsum(lengths) - lengths)
 
-    Returns a list of tuples (time, lat, lon).
 
-    GPX stores time in UTC, by default we assume your camera used the local time
-    and convert accordingly.
+def _nmea_time(value):
     '''
-    with open(nmea_file, "r") as f:
-        lines = f.readlines()
-        lines = [l.rstrip("\n\r") for l in lines]
-
-    # Get initial date
-    for l in lines:
-        if "GPRMC" in l:
-            data = pynmea2.parse(l)
-            date = data.datetime.date()
+    Convert hhmmss[.ss] to microseconds from midnight (same as pynmea2)
+    '''
+    fraction = value[6:]
+    return (int(value[0:2]) * 3600 + int(value[2:4]) * 60 +
+            int(value[4:6])) * 10**6 + \
+            (fraction and int(float(fraction) * 1000000) or 0)
+
+
+def _nmea_degrees(value, direction, positive, negative):
+    '''
+    Convert dddmm.mmmm and hemisphere to signed degrees (same as pynmea2)
+    '''
+    if not value or value == '0':
+        degrees = 0.
+    else:
+        match = _NMEA_DM_RE.match(value)
+        if not match:
+            raise ValueError("Invalid coordinate {}".format(value))
+        degrees = float(match.group(1)) + float(match.group(2)) / 60
+    if direction == positive:
+        return degrees
+    elif direction == negative:
+        return -degrees
+    return 0.
+
+
+def _parse_nmea_sentence(sentence, checksum_ok):
+    '''
+    Parse GGA or RMC sentence
+
+    Returns ('RMC', days since epoch) or ('GGA', microseconds from midnight,
+    lat, lon, altitude). GPS talker sentences with valid checksum are split by
+    hand, others are parsed with pynmea2 (which raises on bad checksum).
+    '''
+    if checksum_ok and sentence[1:3] == 'GP':
+        try:
+            fields = sentence.split('*', 1)[0].split(',')
+            if sentence[3:6] == 'RMC':
+                date = datetime.datetime.strptime(fields[9], '%d%m%y').date()
+                return ('RMC', (date - _NMEA_EPOCH).days)
+            return ('GGA', _nmea_time(fields[1]),
+                    _nmea_degrees(fields[2], fields[3], 'N', 'S'),
+                    _nmea_degrees(fields[4], fields[5], 'E', 'W'),
+                    float(fields[9]) if fields[9] else None)
+        except (ValueError, IndexError):
+            pass
+    data = pynmea2.parse(sentence)
+    if sentence[3:6] == 'RMC':
+        return ('RMC', (data.datestamp - _NMEA_EPOCH).days)
+    timestamp = data.timestamp
+    return ('GGA', ((timestamp.hour * 60 + timestamp.minute) * 60 +
+        timestamp.second) * 10**6 + timestamp.microsecond, data.latitude,
+        data.longitude, data.altitude)
+
+
+def iter_nmea_fixes(lines):
+    '''
+    Stream GGA fixes from NMEA lines
+
+    Yields (time in microseconds since epoch (UTC), lat, lon, altitude or
+    None) in file order. Date of each fix is from the last RMC sentence before
+    it. Fixes before the first RMC are kept until its date is known.
+
+    Lines are processed in chunks of _NMEA_CHUNK, so checksums of a chunk are
+    checked with numpy at once. Only GGA and RMC sentences are read, from any
+    talker (GP, GN, GL...). Receivers which send GGA from several talkers
+    send them one after another for the same epoch, so a GGA from another
+    talker with the same time as the previous fix is skipped.
+    '''
+    day = None
+    pending = []
+    last_gga = (None, None)
+    lines = iter(lines)
+    while True:
+        chunk = []
+        for line in lines:
+            start = line.find('$')
+            if start >= 0 and line[start + 3:start + 6] in ('GGA', 'RMC'):
+                chunk.append(line[start:].rstrip())
+                if len(chunk) == _NMEA_CHUNK:
+                    break
+        if not chunk:
+            break
+        bodies = []
+        given = []
+        for sentence in chunk:
+            star = sentence.rfind('*')
+            if star > 0:
+                bodies.append(sentence[1:star])
+                given.append(sentence[star + 1:star + 3])
+            else:
+                bodies.append(sentence[1:])
+                given.append(None)
+        checksums = _nmea_checksums(bodies).tolist()
+        for sentence, expected, checksum in zip(chunk, given, checksums):
+            try:
+                checksum_ok = expected is None or int(expected, 16) == checksum
+            except ValueError:
+                checksum_ok = False
+            parsed = _parse_nmea_sentence(sentence, checksum_ok)
+            if parsed[0] == 'GGA':
+                talker = sentence[1:3]
+                if parsed[1] == last_gga[0] and talker != last_gga[1]:
+                    continue
+                last_gga = (parsed[1], talker)
+            if parsed[0] == 'RMC':
+                day = parsed[1]
+                for fix in pending:
+                    yield (day * 86400 * 10**6 + fix[0],) + fix[1:]
+                pending = []
+            elif day is None:
+                pending.append(parsed[1:])
+            else:
+                yield (day * 86400 * 10**6 + parsed[1],) + parsed[2:]
+        if len(chunk) < _NMEA_CHUNK:
             break
 
-    # Parse GPS trace
-    points = []
-    for l in lines:
-        if "GPRMC" in l:
-            data = pynmea2.parse(l)
-            date = data.datetime.date()
-
-        if "$GPGGA" in l:
-            data = pynmea2.parse(l)
-            timestamp = datetime.datetime.combine(date, data.timestamp)
-            lat, lon, alt = data.latitude, data.longitude, data.altitude
-            points.append((timestamp, lat, lon, alt))
-
-    points.sort()
-    return points
+
+def _read_nmea(nmea_file):
+    '''
+    Read GGA fixes from NMEA file into sorted float64 columns (UTC times)
+    '''
+    times = array('q')
+    lats = array('d')
+    lons = array('d')
+    elevations = array('d')
+    with open(nmea_file, "r") as f:
+        for time_us, lat, lon, alt in iter_nmea_fixes(f):
+            times.append(time_us)
+            lats.append(lat)
+            lons.append(lon)
+            elevations.append(float('nan') if alt is None else alt)
+    columns = {
+            'time': np.frombuffer(times, dtype=np.int64),
+            'lat': np.frombuffer(lats, dtype=np.float64),
+            'lon': np.frombuffer(lons, dtype=np.float64),
+            'elevation': np.frombuffer(elevations, dtype=np.float64),
+            }
+    order = np.lexsort((columns['lon'], columns['lat'], columns['time']))
+    return {key: value[order] for key, value in columns.items()}
+
+
+def get_track_columns_from_nmea(nmea_file, local_time=True):
+    '''
+    Stream GGA fixes from a NMEA file into NumPy columns.
+
+    Returns the same columns as get_track_columns_from_gpx (speed is
+    calculated from positions, hr is 0). Date is taken from RMC sentences.
+    File is read line by line with iter_nmea_fixes, so memory use only
+    depends on the number of fixes.
+    '''
+    columns = _read_nmea(nmea_file)
+    columns['speed'] = compute_speeds(columns['time'], columns['lat'],
+            columns['lon'], columns['elevation']).astype(np.float32)
+    columns['elevation'] = columns['elevation'].astype(np.float32)
+    columns['hr'] = np.zeros(len(columns['time']), dtype=np.float32)
+    if local_time:
+        columns['time'] = columns['time'] - utc_offset_microseconds()
+    return columns
+
+
+def get_lat_lon_time_from_nmea(nmea_file, local_time=True):
+    '''
+    Read location and time stamps from a track in a NMEA file.
+
+    Returns a list of tuples (time, lat, lon, altitude).
+
+    Times are UTC as they are in the file (local_time isn't used).
+
+    This is a view over the same streaming parser as
+    get_track_columns_from_nmea.
+    '''
+    columns = _read_nmea(nmea_file)
+    times = columns['time'].astype('datetime64[us]').tolist()
+    elevations = [None if math.isnan(e) else e
+            for e in columns['elevation'].tolist()]
+    return list(zip(times, columns['lat'].tolist(), columns['lon'].tolist(),
+        elevations))
@@ -0,0 +1,397 @@
+import os
+import io
+import time
+import zlib
+import sqlite3
+import collections
+
+import numpy as np
+from PIL import Image as ImagePIL
+
+#Increase when format of stored maps changes
+MAP_STORE_VERSION = 1
+
+MAP_STORE_FILENAME = "maps.sqlite"
+
+#How maps can be encoded in MapStore
+MAP_ENCODINGS = ('raw', 'zlib', 'png')
+
+#How many reads of MapStore are remembered before their last_used is written
+_TOUCH_BATCH = 256
+
+
+def encode_map(array, encoding, level=1):
+    """Encodes map RGBA (or RGB) uint8 array to bytes"""
+    array = np.ascontiguousarray(array, dtype=np.uint8)
+    if encoding == 'raw':
+        return array.tobytes()
+    if encoding == 'zlib':
+        return zlib.compress(array.tobytes(), level)
+    if encoding == 'png':
+        buffer = io.BytesIO()
+        ImagePIL.fromarray(array).save(buffer, format="PNG",
+                compress_level=level)
+        return buffer.getvalue()
+    raise ValueError("Unknown map encoding: {}".format(encoding))
+
+
+def decode_map(data, encoding, shape):
+    """Decodes bytes from encode_map back to array of given shape"""
+    if encoding == 'raw':
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+    if encoding == 'zlib':
+        return np.frombuffer(zlib.decompress(data), dtype=np.uint8) \
+                .reshape(shape)
+    if encoding == 'png':
+        return np.asarray(ImagePIL.open(io.BytesIO(data)))
+    raise ValueError("Unknown map encoding: {}".format(encoding))
+
+
+class DirectoryMapStore(object):
+    """Map cache with one PNG file per map in a directory
+
+    This is how maps_cache always worked. It has the same methods as
+    MapStore.
+
+    Parameters
+    ---------
+    directory : str
+        Where PNG files are saved
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, "{}.png".format(name))
+
+    def get(self, name):
+        """Map array saved under name or None if it isn't cached"""
+        path = self._path(name)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.asarray(ImagePIL.open(path).convert("RGBA"))
+
+    def put(self, name, array):
+        """Saves map array under name"""
+        ImagePIL.fromarray(np.asarray(array, dtype=np.uint8)).save(
+                self._path(name))
+
+    def delete(self, name):
+        """Removes map from cache if it exists"""
+        path = self._path(name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def flush(self):
+        """Nothing to write, files are saved in put"""
+
+    def preload(self, names):
+        """Map arrays of all cached names as dict"""
+        maps = {}
+        for name in names:
+            array = self.get(name)
+            if array is not None:
+                maps[name] = array
+        return maps
+
+
+class MapStore(object):
+    """Map cache with all maps in one SQLite file
+
+    Each map is one row keyed by its name (see MapnikRenderer._make_name)
+    with encoded pixels, shape and time of last use. When max_bytes is set
+    and size of all encoded maps goes over it least recently used maps are
+    removed. Maps larger than max_bytes aren't saved.
+
+    Reads don't write to the file. Times of last use are remembered and
+    written in one transaction every _TOUCH_BATCH reads, before eviction and
+    on flush. Size of all maps is summed in SQL once per connection and then
+    kept as running total updated on put, delete and eviction. It is summed
+    again only when PRAGMA data_version shows that another connection
+    changed the file, so it is correct when many processes use the same file.
+
+    Connection is opened in each process the first time it is needed, so
+    the same store can be used from MapnikMultiProcessRenderer workers.
+
+    Attributes
+    ---------
+    hits : int
+        Number of maps found in the store
+    misses : int
+        Number of maps which weren't in the store
+    evictions : int
+        Number of maps removed because of max_bytes
+
+    Parameters
+    ---------
+    path : str
+        SQLite file
+    max_bytes : int
+        Budget for size of encoded maps. None is no limit.
+    encoding : str
+        One of MAP_ENCODINGS. raw is uncompressed, zlib and png use
+        compression level level (1 is fast)
+    level : int
+        Compression level for zlib and png
+    """
+
+    def __init__(self, path, max_bytes=None, encoding='zlib', level=1):
+        if encoding not in MAP_ENCODINGS:
+            raise ValueError("Unknown map encoding: {}".format(encoding))
+        self.path = path
+        self.max_bytes = max_bytes
+        self.encoding = encoding
+        self.level = level
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._pid = None
+        self._touched = {}
+        self._total_bytes = None
+        self._data_version = None
+
+    def _connect(self):
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        conn = sqlite3.connect(self.path, timeout=60)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != MAP_STORE_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS maps")
+                conn.execute("PRAGMA user_version = {}".format(
+                    MAP_STORE_VERSION))
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS maps (name TEXT PRIMARY "
+                "KEY, encoding TEXT, height INTEGER, width INTEGER, "
+                "channels INTEGER, size INTEGER, last_used REAL, data BLOB)")
+        conn.execute("CREATE INDEX IF NOT EXISTS maps_last_used ON "
+                "maps (last_used)")
+        self._conn = conn
+        self._pid = os.getpid()
+        self._touched = {}
+        self._total_bytes = None
+        return conn
+
+    def _map_size(self, conn, name):
+        row = conn.execute("SELECT size FROM maps WHERE name = ?",
+                (name,)).fetchone()
+        return 0 if row is None else row[0]
+
+    @staticmethod
+    def _decode_row(encoding, height, width, channels, data):
+        shape = (height, width) if channels == 1 else (height, width,
+                channels)
+        return decode_map(data, encoding, shape)
+
+    def get(self, name):
+        """Map array saved under name or None if it isn't cached"""
+        conn = self._connect()
+        row = conn.execute("SELECT encoding, height, width, channels, data "
+                "FROM maps WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch([name])
+        return self._decode_row(*row)
+
+    def _touch(self, names):
+        """Remembers that maps were used now"""
+        if self.max_bytes is None:
+            return
+        now = time.time()
+        self._touched.update((name, now) for name in names)
+        if len(self._touched) >= _TOUCH_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Writes remembered times of last use in one transaction"""
+        if not self._touched:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany("UPDATE maps SET last_used = ? WHERE name = ?",
+                    [(used, name) for name, used in self._touched.items()])
+        self._touched = {}
+
+    def put(self, name, array):
+        """Saves map array under name and evicts old maps over max_bytes
+
+        Maps larger than max_bytes aren't saved.
+        """
+        conn = self._connect()
+        array = np.asarray(array, dtype=np.uint8)
+        channels = array.shape[2] if array.ndim == 3 else 1
+        data = encode_map(array, self.encoding, self.level)
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        total = self.total_bytes
+        with conn:
+            old_size = self._map_size(conn, name)
+            conn.execute("INSERT OR REPLACE INTO maps VALUES (?, ?, ?, ?, ?, "
+                    "?, ?, ?)", (name, self.encoding, array.shape[0],
+                        array.shape[1], channels, len(data), time.time(),
+                        data))
+        self._total_bytes = total+len(data)-old_size
+        self._touched.pop(name, None)
+        self._evict()
+
+    def delete(self, name):
+        """Removes map from cache if it exists"""
+        conn = self._connect()
+        total = self.total_bytes
+        with conn:
+            size = self._map_size(conn, name)
+            conn.execute("DELETE FROM maps WHERE name = ?", (name,))
+        self._total_bytes = total-size
+        self._touched.pop(name, None)
+
+    def _evict(self):
+        """Removes least recently used maps until size is in max_bytes"""
+        if self.max_bytes is None:
+            return
+        over = self.total_bytes-self.max_bytes
+        if over <= 0:
+            return
+        self.flush()
+        conn = self._connect()
+        removed = []
+        removed_bytes = 0
+        cursor = conn.execute("SELECT name, size FROM maps ORDER BY "
+                "last_used")
+        for name, size in cursor:
+            removed.append((name,))
+            removed_bytes += size
+            if removed_bytes >= over:
+                break
+        cursor.close()
+        total = self.total_bytes
+        with conn:
+            conn.executemany("DELETE FROM maps WHERE name = ?", removed)
+        self._total_bytes = total-removed_bytes
+        self.evictions += len(removed)
+
+    def preload(self, names):
+        """Map arrays of all cached names read with one query per 500 names
+
+        Returns dict name -> array
+        """
+        conn = self._connect()
+        names = list(names)
+        maps = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start+500]
+            for name, encoding, height, width, channels, data in \
+                    conn.execute("SELECT name, encoding, height, width, "
+                            "channels, data FROM maps WHERE name IN ({})"
+                            .format(", ".join(["?"]*len(chunk))), chunk):
+                maps[name] = self._decode_row(encoding, height, width,
+                        channels, data)
+        self._touch(maps)
+        return maps
+
+    @property
+    def total_bytes(self):
+        """Size of all encoded maps in the store
+
+        Running total, summed in SQL only the first time and after other
+        connections changed the file.
+        """
+        conn = self._connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._total_bytes is None or version != self._data_version:
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) "
+                    "FROM maps").fetchone()[0]
+            self._data_version = version
+        return self._total_bytes
+
+
+class MemoryMapCache(object):
+    """LRU of decoded map arrays in memory sized by their nbytes
+
+    Used in front of map store so the same map requested for many frames
+    is decoded only once.
+
+    Attributes
+    ---------
+    hits : int
+        Number of maps found in memory
+    misses : int
+        Number of maps which weren't in memory
+    evictions : int
+        Number of maps removed because of max_bytes
+
+    Parameters
+    ---------
+    max_bytes : int
+        Budget for nbytes of all arrays. Arrays larger than that aren't kept.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._maps = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._maps)
+
+    def __contains__(self, key):
+        return key in self._maps
+
+    def get(self, key):
+        """Array saved under key or None if it isn't in memory"""
+        array = self._maps.get(key)
+        if array is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._maps.move_to_end(key)
+        return array
+
+    def put(self, key, array):
+        """Saves array under key and evicts least recently used arrays"""
+        self.delete(key)
+        if array.nbytes > self.max_bytes:
+            return
+        self._maps[key] = array
+        self.total_bytes += array.nbytes
+        while self.total_bytes > self.max_bytes:
+            _, old = self._maps.popitem(last=False)
+            self.total_bytes -= old.nbytes
+            self.evictions += 1
+
+    def delete(self, key):
+        """Removes array from memory if it is there"""
+        old = self._maps.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+
+    def clear(self):
+        self._maps.clear()
+        self.total_bytes = 0
+
+
+def make_map_store(maps_cache, backend='files', max_bytes=None,
+        encoding='zlib'):
+    """Map store in maps_cache directory
+
+    backend is files (DirectoryMapStore) or sqlite (MapStore in
+    MAP_STORE_FILENAME in maps_cache)
+    """
+    os.makedirs(maps_cache, exist_ok=True)
+    if backend == 'files':
+        return DirectoryMapStore(maps_cache)
+    if backend == 'sqlite':
+        return MapStore(os.path.join(maps_cache, MAP_STORE_FILENAME),
+                max_bytes, encoding)
+    raise ValueError("Unknown map cache backend: {}".format(backend))
@@ -0,0 +1,166 @@
+import math
+
+import numpy as np
+from PIL import Image as ImagePIL
+
+from .util import format_filename
+
+#Half of the width of the world in spherical mercator meters
+MERCATOR_HALF_WORLD = 20037508.34
+
+
+def world_pixel(lat, lon, zoom):
+    """Position in pixels of spherical mercator world map at zoom
+
+    World map is 256*2**zoom pixels wide, 0,0 is top left corner.
+    """
+    world = 256*2**zoom
+    x = (lon+180)/360*world
+    lat_rad = math.radians(lat)
+    y = (1-math.log(math.tan(lat_rad)+1/math.cos(lat_rad))/math.pi)/2*world
+    return x, y
+
+
+def world_pixel_to_lat_lon(x, y, zoom):
+    """Inverse of world_pixel"""
+    world = 256*2**zoom
+    lon = x/world*360-180
+    lat = math.degrees(math.atan(math.sinh(math.pi*(1-2*y/world))))
+    return lat, lon
+
+
+def quantize_position(lat, lon, zoom, quantum):
+    """lat, lon moved to the nearest point of grid with step quantum world
+    pixels at zoom
+
+    Returns lat, lon unchanged if quantum is None or 0.
+    """
+    if not quantum:
+        return lat, lon
+    x, y = world_pixel(lat, lon, zoom)
+    return world_pixel_to_lat_lon(round(x/quantum)*quantum,
+            round(y/quantum)*quantum, zoom)
+
+
+def quantize_angle(angle, quantum):
+    """angle rounded to multiple of quantum degrees in [0, 360)
+
+    Without quantum angle is only wrapped to [0, 360). None stays None.
+    """
+    if angle is None:
+        return None
+    if quantum:
+        angle = round(angle/quantum)*quantum
+    return angle % 360
+
+
+def map_name(lat, lon, width=None, height=None, zoom=None,
+        zoom_to_layer=False, angle=None, gpx_file=None):
+    """Name of map in maps_cache
+
+    Name is lat_lon rounded to 5 decimal places after multipled by 10^5
+    So that we have integer. _width_height is added if they are not None,
+    _Z with zoom multiplied by 10^5 if zoom is set and _A with angle in 1/100
+    of degree if map is rotated. Names of north-up maps are the same as they
+    were before _A was added, so existing maps_cache can still be used.
+
+    Parameters
+    ---------
+    lat : float
+        Latitude in WGS84 - center point of a map (around 46 in Europe)
+    lon : float
+        Longitude in WGS84 - center point of a map (around 15 in Europe)
+    width : int
+        Wanted width of the map
+    height : int
+        Wanted height of the map
+    zoom : float
+        map zoom
+    zoom_to_layer : bool
+        If true map shows whole layer of gpx_file and lat, lon, zoom and
+        angle are ignored. Name is LAYER_ with end of gpx_file name
+    angle : float
+        Angle of map rotation (with angle_offset) or None
+    gpx_file : str
+        GPX file shown on zoom_to_layer map
+
+    Returns
+    ------
+    str
+        Filename
+    """
+    if zoom_to_layer:
+        name = "LAYER_"+format_filename((gpx_file or "")[-20:])
+        if width and height:
+            name += "_{}_{}".format(width, height)
+        return name
+    round_lat = round(lat*10**5)
+    round_lon = round(lon*10**5)
+    latlon= "{}_{}".format(round_lat, round_lon)
+    if width and height:
+        name = latlon + "_{}_{}".format(width,height)
+    else:
+        name = latlon
+    if zoom:
+        round_zoom = int(round(zoom*10**5))
+        name += "_Z{}".format(round_zoom)
+    if angle is not None:
+        name += "_A{}".format(int(round(angle*100)))
+    return name
+
+
+def metatile_window(x, y, width, height, metatile_size):
+    """Where in metatile grid is map of given size centered at world pixel x, y
+
+    Metatiles are squares of metatile_size pixels in a grid with step
+    metatile_size-width (and metatile_size-height), so each map which is
+    smaller than metatile fits whole in one of them.
+
+    Returns
+    ------
+    tuple
+        step_x, step_y, col and row of metatile and left, top corner of the
+        map in world pixels and in metatile pixels (tile_left, tile_top).
+        Map is tile[tile_top:tile_top+height, tile_left:tile_left+width]
+    """
+    step_x = metatile_size-width
+    step_y = metatile_size-height
+    left = int(round(x-width/2))
+    top = int(round(y-height/2))
+    col = left//step_x
+    row = top//step_y
+    return (step_x, step_y, col, row, left, top, left-col*step_x,
+            top-row*step_y)
+
+
+def metatile_bounds(zoom, step_x, step_y, col, row, metatile_size):
+    """Spherical mercator bounds (minx, miny, maxx, maxy) of metatile at
+    grid position col, row
+
+    Top left corner of metatile is at world pixel (col*step_x, row*step_y).
+    """
+    meters = 2*MERCATOR_HALF_WORLD/(256*2**zoom)
+    minx = col*step_x*meters-MERCATOR_HALF_WORLD
+    maxy = MERCATOR_HALF_WORLD-row*step_y*meters
+    return (minx, maxy-metatile_size*meters, minx+metatile_size*meters, maxy)
+
+
+def rotate_map(rgba, angle, center_x, center_y, width, height):
+    """Rotates map around center_x, center_y so that angle points up and
+    crops width x height map around it
+
+    rgba is north-up map array which needs to be at least as large as the
+    diagonal of the wanted map. It is rotated with PIL (bilinear).
+
+    Returns
+    ------
+    numpy.ndarray, tuple
+        Cropped rotated map and position of center in it
+    """
+    image = ImagePIL.fromarray(rgba)
+    rotated = np.asarray(image.rotate(angle, resample=ImagePIL.BILINEAR,
+        center=(center_x, center_y)))
+    left = int(round(center_x-width/2))
+    top = int(round(center_y-height/2))
+    return rotated[top:top+height, left:left+width], (center_x-left,
+            center_y-top)
@@ -0,0 +1,167 @@
+import numpy as np
+
+from .lib.geo import track_columns, distance_array, times_to_microseconds
+
+TRACK_METRICS = ('distance', 'ascent', 'descent', 'grade', 'moving_time',
+        'average_speed')
+
+
+def climb_steps(elevation, threshold):
+    """Ascent and descent at each point with hysteresis
+
+    Change of elevation is only counted when elevation moved at least
+    threshold meters from the last counted elevation, so GPS or barometer
+    noise doesn't add to total climb. Missing (NaN) elevations are skipped.
+
+    This stage is deliberately scalar: each counted elevation depends on the
+    previous one, so it has no prefix sum form. It is one O(n) pass over
+    elevations once per track. Totals at each point are then cumulative sums
+    of the result, so lookups stay O(1).
+
+    Returns
+    ------
+    numpy.ndarray, numpy.ndarray
+        Climb and descent (positive) counted at each point
+    """
+    elevation = np.asarray(elevation, dtype=np.float64)
+    up = np.zeros(len(elevation))
+    down = np.zeros(len(elevation))
+    valid = np.flatnonzero(np.isfinite(elevation))
+    if len(valid) == 0:
+        return up, down
+    values = elevation[valid].tolist()
+    reference = values[0]
+    for i, value in zip(valid[1:].tolist(), values[1:]):
+        diff = value-reference
+        if diff >= threshold:
+            up[i] = diff
+            reference = value
+        elif diff <= -threshold:
+            down[i] = -diff
+            reference = value
+    return up, down
+
+
+class TrackMetrics(object):
+    """Metrics derived from whole GPX track
+
+    All metrics are calculated once for each track point with vectorized
+    cumulative sums, so reading them for a frame is O(1):
+
+        - distance : float - Distance from start of the track in meters
+        - ascent : float - Total climb from start of the track in meters
+          (changes smaller than climb_threshold are ignored, see
+          climb_steps)
+        - descent : float - Total descent from start of the track in meters
+        - grade : float - Smoothed slope in % (elevation difference over
+          grade_distance meters of track around the point)
+        - moving_time : float - Seconds from start of the track in which
+          speed was above moving_speed
+        - average_speed : float - Average speed in m/s in last speed_window
+          seconds
+
+    Parameters
+    ---------
+    track
+        Track columns, lib.geo.TrackIndex or list of points
+    grade_distance : float
+        Length of track in meters over which grade is calculated
+    moving_speed : float
+        Minimal speed in m/s which counts as moving
+    speed_window : float
+        Length of window for average_speed in seconds
+    climb_threshold : float
+        Elevation change in meters needed before it counts to ascent or
+        descent
+    """
+
+    def __init__(self, track, grade_distance=50, moving_speed=0.5,
+            speed_window=30, climb_threshold=2):
+        columns = track_columns(track)
+        self.times = np.asarray(columns['time'], dtype=np.int64)
+        lat = np.asarray(columns['lat'], dtype=np.float64)
+        lon = np.asarray(columns['lon'], dtype=np.float64)
+        ele = np.asarray(columns['elevation'], dtype=np.float64)
+
+        segments = distance_array(lat[:-1], lon[:-1], ele[:-1], lat[1:],
+                lon[1:], ele[1:])
+        distance = np.concatenate(([0.0], np.cumsum(segments)))
+
+        up, down = climb_steps(ele, climb_threshold)
+        ascent = np.cumsum(up)
+        descent = np.cumsum(down)
+
+        seconds = np.diff(self.times)/1e6
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moving = (seconds > 0) & (segments/seconds > moving_speed)
+        moving_time = np.concatenate(([0.0],
+            np.cumsum(np.where(moving, seconds, 0))))
+
+        #Distance traveled from first point in window to each point
+        window_start = np.searchsorted(self.times,
+                self.times-int(speed_window*10**6), side='left')
+        elapsed = (self.times-self.times[window_start])/1e6
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average_speed = np.where(elapsed > 0,
+                    (distance-distance[window_start])/elapsed, 0)
+
+        grade = np.full(len(distance), np.nan)
+        has_elevation = np.isfinite(ele)
+        if has_elevation.any():
+            total = distance[-1]
+            grade_start = np.clip(distance-grade_distance/2, 0, total)
+            grade_end = np.clip(distance+grade_distance/2, 0, total)
+            ele_start = np.interp(grade_start, distance[has_elevation],
+                    ele[has_elevation])
+            ele_end = np.interp(grade_end, distance[has_elevation],
+                    ele[has_elevation])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                grade = np.where(grade_end > grade_start,
+                        (ele_end-ele_start)/(grade_end-grade_start)*100, 0)
+
+        self.columns = {
+                'distance': distance,
+                'ascent': ascent,
+                'descent': descent,
+                'grade': grade,
+                'moving_time': moving_time,
+                'average_speed': average_speed,
+                }
+
+    def _blend(self, before, after, t):
+        """Linear interpolation weights between points at time t"""
+        dt_before = (t-self.times[before])/1e6
+        dt_after = (self.times[after]-t)/1e6
+        dt = dt_before+dt_after
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(dt > 0, dt_before/dt, 0)
+        return np.clip(weight, 0, 1)
+
+    def at(self, index, t=None):
+        """Metrics at point index as dict
+
+        index is GPX index as returned from lib.geo.interpolate_lat_lon (index
+        of the point after time t, -1 after end of the track). If time t (in
+        microseconds since epoch or datetime) is given values are interpolated
+        between previous point and this one.
+        """
+        n = len(self.times)
+        after = index % n
+        before = max(after-1, 0)
+        if t is None or before == after:
+            return {key: column[after].item() for key, column in
+                    self.columns.items()}
+        weight = self._blend(before, after,
+                int(times_to_microseconds([t])[0])).item()
+        return {key: (column[before]+(column[after]-column[before])*weight)
+                .item() for key, column in self.columns.items()}
+
+    def at_times(self, times):
+        """Metrics interpolated at many times (same as at) as dict of arrays"""
+        times = times_to_microseconds(times)
+        after = np.clip(np.searchsorted(self.times, times, side='right'), 0,
+                len(self.times)-1)
+        before = np.maximum(after-1, 0)
+        weight = self._blend(before, after, times)
+        return {key: column[before]+(column[after]-column[before])*weight
+                for key, column in self.columns.items()}
@@ -0,0 +1,192 @@
+import heapq
+
+import numpy as np
+
+
+def index_map(kept, n):
+    """Simplified index of each of n original points
+
+    kept are sorted indices of points which were kept (output of lttb,
+    douglas_peucker or visvalingam). For each original point result is
+    index in kept of the last kept point at or before it, so original point i
+    lies on simplified segment between kept[result[i]] and
+    kept[result[i]+1].
+    """
+    return np.searchsorted(kept, np.arange(n), side='right')-1
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of a time series
+
+    First and last points are always kept. Other points are split into
+    n_out-2 buckets and from each bucket the point which makes the largest
+    triangle with previously kept point and average of the next bucket is
+    kept. Areas of all points in a bucket are calculated at once. Points
+    with NaN y are only kept if whole bucket is NaN.
+
+    Parameters
+    ---------
+    x : numpy.ndarray
+        Increasing x values (time or point index)
+    y : numpy.ndarray
+        Values
+    n_out : int
+        Number of points to keep
+
+    Returns
+    ------
+    numpy.ndarray
+        Sorted indices of kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = (np.arange(n_out-1)*(n-2)//(n_out-2)+1).astype(np.int64)
+
+    #Averages of each bucket from cumulative sums (NaNs are left out)
+    finite = np.isfinite(y)
+    sum_x = np.concatenate(([0.0], np.cumsum(np.where(finite, x, 0))))
+    sum_y = np.concatenate(([0.0], np.cumsum(np.where(finite, y, 0))))
+    count = np.concatenate(([0], np.cumsum(finite)))
+    bucket_count = count[edges[1:]]-count[edges[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_x = (sum_x[edges[1:]]-sum_x[edges[:-1]])/bucket_count
+        avg_y = (sum_y[edges[1:]]-sum_y[edges[:-1]])/bucket_count
+    #Bucket after the last one is the last point
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n-1
+    for i in range(n_out-2):
+        start, end = edges[i], edges[i+1]
+        a = kept[i]
+        area = np.abs((x[a]-avg_x[i])*(y[start:end]-y[a]) -
+                (x[a]-x[start:end])*(avg_y[i]-y[a]))
+        kept[i+1] = start+np.argmax(np.where(np.isnan(area), -1, area))
+    return kept
+
+
+def _segment_distances(x, y, x1, y1, x2, y2):
+    """Distances of points from segment (x1, y1)-(x2, y2)"""
+    dx = x2-x1
+    dy = y2-y1
+    length = dx*dx+dy*dy
+    if length == 0:
+        return np.hypot(x-x1, y-y1)
+    t = np.clip(((x-x1)*dx+(y-y1)*dy)/length, 0, 1)
+    return np.hypot(x-(x1+t*dx), y-(y1+t*dy))
+
+
+def douglas_peucker(x, y, tolerance):
+    """Douglas-Peucker simplification of a polyline
+
+    Distances of all points of a part from its segment are calculated at
+    once. Parts are split at the farthest point until no point is more than
+    tolerance away.
+
+    Parameters
+    ---------
+    x, y : numpy.ndarray
+        Coordinates of polyline points (in the same units, like meters)
+    tolerance : float
+        Maximal distance of removed points from simplified line
+
+    Returns
+    ------
+    numpy.ndarray
+        Sorted indices of kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    parts = [(0, n-1)]
+    while parts:
+        start, end = parts.pop()
+        if end-start < 2:
+            continue
+        distances = _segment_distances(x[start+1:end], y[start+1:end],
+                x[start], y[start], x[end], y[end])
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            split = start+1+farthest
+            keep[split] = True
+            parts.append((start, split))
+            parts.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def _triangle_areas(x, y, a, b, c):
+    return np.abs((x[b]-x[a])*(y[c]-y[a])-(x[c]-x[a])*(y[b]-y[a]))/2
+
+
+def visvalingam(x, y, n_out=None, min_area=None):
+    """Visvalingam-Whyatt simplification of a polyline
+
+    Points are removed in order of the smallest area of triangle they make
+    with their neighbours until n_out points are left or the smallest area
+    is at least min_area. Areas of all points are calculated at once at the
+    start, afterwards only areas of neighbours of removed point change.
+
+    Parameters
+    ---------
+    x, y : numpy.ndarray
+        Coordinates of polyline points
+    n_out : int
+        Number of points to keep
+    min_area : float
+        Smallest area of kept points (used if n_out is None)
+
+    Returns
+    ------
+    numpy.ndarray
+        Sorted indices of kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n < 3 or (n_out is None and min_area is None) or \
+            (n_out is not None and n_out >= n):
+        return np.arange(n)
+    areas = np.full(n, np.inf)
+    middle = np.arange(1, n-1)
+    areas[1:-1] = _triangle_areas(x, y, middle-1, middle, middle+1)
+    areas[np.isnan(areas)] = 0
+    xs = x.tolist()
+    ys = y.tolist()
+    prev_point = list(range(-1, n-1))
+    next_point = list(range(1, n+1))
+    current = areas.tolist()
+    removed = np.zeros(n, dtype=bool)
+    to_remove = n-max(n_out, 2) if n_out is not None else n-2
+    heap = [(current[i], i) for i in range(1, n-1)]
+    heapq.heapify(heap)
+    while heap and to_remove:
+        area, i = heapq.heappop(heap)
+        if area != current[i]:
+            continue
+        if n_out is None and area >= min_area:
+            break
+        removed[i] = True
+        to_remove -= 1
+        current[i] = None
+        before, after = prev_point[i], next_point[i]
+        next_point[before] = after
+        prev_point[after] = before
+        for j in (before, after):
+            if 0 < j < n-1:
+                a, c = prev_point[j], next_point[j]
+                area = abs((xs[j]-xs[a])*(ys[c]-ys[a]) -
+                        (xs[c]-xs[a])*(ys[j]-ys[a]))/2
+                if area != area:
+                    area = 0.0
+                current[j] = area
+                heapq.heappush(heap, (area, j))
+    return np.flatnonzero(~removed)
@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+
+from .lib.geo import track_columns, WGS84_a
+
+
+class TrackSpatialIndex(object):
+    """Uniform grid index over track segments
+
+    Track points are projected to local equirectangular coordinates in meters
+    (around mean latitude of the track) and each segment between consecutive
+    points is added to grid cells it crosses. Cells are kept as sorted array
+    of cell keys so a cell is found with binary search.
+
+    Nearest segment to a point is found by searching growing blocks of cells
+    around the point until no unvisited cell can contain a closer segment.
+
+    Parameters
+    ---------
+    track
+        Track columns, lib.geo.TrackIndex or list of points
+    cell_size : float
+        Size of grid cell in meters. If None it is twice the median segment
+        length, but at least 10 meters.
+    """
+
+    def __init__(self, track, cell_size=None):
+        columns = track_columns(track)
+        self.times = np.asarray(columns['time'])
+        lat = np.asarray(columns['lat'], dtype=np.float64)
+        lon = np.asarray(columns['lon'], dtype=np.float64)
+        if len(lat) < 2:
+            raise ValueError("Track needs at least 2 points")
+        self.lat0 = float(np.mean(lat))
+        self.lon0 = float(np.mean(lon))
+        self.x, self.y = self.project(lat, lon)
+
+        x0, y0 = self.x[:-1], self.y[:-1]
+        x1, y1 = self.x[1:], self.y[1:]
+        if cell_size is None:
+            lengths = np.hypot(x1-x0, y1-y0)
+            cell_size = max(10.0, 2*float(np.median(lengths)))
+        self.cell_size = cell_size
+        self.min_x = float(self.x.min())
+        self.min_y = float(self.y.min())
+        self.cells_y = int((self.y.max()-self.min_y)//cell_size)+1
+        self.cells_x = int((self.x.max()-self.min_x)//cell_size)+1
+
+        #Each segment is split into pieces at most one cell long. Piece
+        #can only cross cells in 2x2 block of cells of its ends, so those are
+        #added. Long segments (GPS jumps) add only cells along the line
+        pieces = np.maximum(np.ceil(np.hypot(x1-x0, y1-y0)/cell_size),
+                1).astype(np.int64)
+        samples = pieces+1
+        segment = np.repeat(np.arange(len(x0)), samples)
+        step = np.arange(samples.sum())-np.repeat(np.cumsum(samples)-samples,
+                samples)
+        fraction = step/pieces[segment]
+        cx, cy = self._cell(x0[segment]+(x1-x0)[segment]*fraction,
+                y0[segment]+(y1-y0)[segment]*fraction)
+        same = segment[1:] == segment[:-1]
+        ax, ay = cx[:-1][same], cy[:-1][same]
+        bx, by = cx[1:][same], cy[1:][same]
+        segment = np.tile(segment[:-1][same], 4)
+        keys = self._key(np.concatenate((ax, bx, ax, bx)),
+                np.concatenate((ay, by, by, ay)))
+        order = np.lexsort((segment, keys))
+        keys = keys[order]
+        segment = segment[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (segment[1:] != segment[:-1])
+        keys = keys[first]
+        self.segment_ids = segment[first]
+        self.cell_keys, self.cell_starts = np.unique(keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(keys))
+
+    def project(self, lat, lon):
+        """Projects WGS84 coordinates to local x, y in meters"""
+        x = np.radians(np.subtract(lon, self.lon0))*WGS84_a* \
+                math.cos(math.radians(self.lat0))
+        y = np.radians(np.subtract(lat, self.lat0))*WGS84_a
+        return x, y
+
+    def _cell(self, x, y):
+        return ((x-self.min_x)//self.cell_size).astype(np.int64), \
+                ((y-self.min_y)//self.cell_size).astype(np.int64)
+
+    def _key(self, cell_x, cell_y):
+        return cell_x*(self.cells_y+1)+cell_y
+
+    def _segments_in_block(self, cell_x, cell_y, radius):
+        """Segment ids in cells at most radius cells away from given cell"""
+        xs = np.arange(max(cell_x-radius, 0), min(cell_x+radius+1,
+            self.cells_x))
+        ys = np.arange(max(cell_y-radius, 0), min(cell_y+radius+1,
+            self.cells_y))
+        if not len(xs) or not len(ys):
+            return np.empty(0, dtype=np.int64)
+        keys = self._key(xs[:, None], ys[None, :]).ravel()
+        pos = np.searchsorted(self.cell_keys, keys)
+        found = pos < len(self.cell_keys)
+        found[found] = self.cell_keys[pos[found]] == keys[found]
+        pos = pos[found]
+        if not len(pos):
+            return np.empty(0, dtype=np.int64)
+        starts = self.cell_starts[pos]
+        lengths = self.cell_ends[pos]-starts
+        ids = np.repeat(starts-np.cumsum(lengths)+lengths, lengths)+ \
+                np.arange(lengths.sum())
+        return np.unique(self.segment_ids[ids])
+
+    def _distances(self, segments, px, py):
+        """Distance and position along segments for point px, py"""
+        x0 = self.x[segments]
+        y0 = self.y[segments]
+        dx = self.x[segments+1]-x0
+        dy = self.y[segments+1]-y0
+        length2 = dx*dx+dy*dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(length2 > 0,
+                    ((px-x0)*dx+(py-y0)*dy)/length2, 0)
+        fraction = np.clip(fraction, 0, 1)
+        return np.hypot(x0+fraction*dx-px, y0+fraction*dy-py), fraction
+
+    def nearest_segments(self, lats, lons, max_distance=None):
+        """Finds nearest track segment for each point
+
+        Parameters
+        ---------
+        lats : array
+            Latitudes of points
+        lons : array
+            Longitudes of points
+        max_distance : float
+            Search only this many meters around the point. If nothing is
+            found index is -1
+
+        Returns
+        ------
+        dict
+            Arrays with one value per point: index (index of segment start
+            point), fraction (position along segment 0-1), distance (meters)
+            and time (interpolated time at nearest position in the same units
+            as track times)
+        """
+        px, py = self.project(np.atleast_1d(lats), np.atleast_1d(lons))
+        cells_x, cells_y = self._cell(px, py)
+        count = len(px)
+        index = np.full(count, -1, dtype=np.int64)
+        fraction = np.zeros(count)
+        distance = np.full(count, np.inf)
+        max_radius = max(self.cells_x, self.cells_y)
+        if max_distance is not None:
+            max_radius = int(max_distance//self.cell_size)+1
+        for i in range(count):
+            #Points outside of the grid start at radius where grid begins
+            radius = max(0, -cells_x[i], -cells_y[i],
+                    cells_x[i]-self.cells_x+1, cells_y[i]-self.cells_y+1)
+            radius_limit = radius+max_radius
+            #Block around the point is doubled until some segment is found
+            segments = self._segments_in_block(cells_x[i], cells_y[i], radius)
+            while not len(segments) and radius < radius_limit:
+                radius = min(max(1, 2*radius), radius_limit)
+                segments = self._segments_in_block(cells_x[i], cells_y[i],
+                        radius)
+            if not len(segments):
+                continue
+            dist, frac = self._distances(segments, px[i], py[i])
+            #Closer segments can only be in cells at most this far away
+            needed_radius = int(dist.min()//self.cell_size)+1
+            if needed_radius > radius:
+                segments = self._segments_in_block(cells_x[i], cells_y[i],
+                        needed_radius)
+                dist, frac = self._distances(segments, px[i], py[i])
+            best = np.argmin(dist)
+            distance[i] = dist[best]
+            index[i] = segments[best]
+            fraction[i] = frac[best]
+        if max_distance is not None:
+            too_far = distance > max_distance
+            index[too_far] = -1
+            distance[too_far] = np.inf
+        found = index >= 0
+        times = np.zeros(count, dtype=self.times.dtype)
+        start = self.times[index[found]]
+        times[found] = start+np.round((self.times[index[found]+1]-start)*
+                fraction[found]).astype(self.times.dtype)
+        return {
+                'index': index,
+                'fraction': fraction,
+                'distance': distance,
+                'time': times,
+                }
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+
+import numpy as np
+
+from .lib.gps_parser import get_track_columns_from_gpx, GPX_COLUMNS
+from .lib.geo import utc_offset_microseconds
+
+#Increase when format of cached columns changes
+TRACK_CACHE_VERSION = 3
+
+#File in cached track with trkseg index of each point (not a column)
+SEGMENTS_FILENAME = "_segments.npy"
+
+
+
+def _file_hash(filename, block_size=2**20):
+    """SHA1 of file content"""
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class TrackCache(object):
+    """Binary cache of parsed GPX tracks
+
+    Each parsed track is saved as a directory of .npy files (one per column
+    from GPX_COLUMNS and one per extension channel) named by SHA1 of GPX file
+    content, and SEGMENTS_FILENAME with trkseg index of each point (see
+    load_segments). Columns are loaded
+    memory mapped, so loading a cached track doesn't parse any XML and
+    doesn't create Python objects per point.
+
+    index.json maps GPX path to its size, mtime and content hash. If size and
+    mtime didn't change the file isn't hashed again. If they changed file is
+    hashed and if content is the same cached columns are still used.
+
+    Times are cached in UTC. Conversion to local time is done on load.
+
+    Parameters
+    ---------
+    cachedir : str
+        Directory where tracks are cached. If None it is tracks directory in
+        GPSOverlay.cachedir (where joblib cache is)
+    """
+
+    def __init__(self, cachedir=None):
+        if cachedir is None:
+            from . import cachedir as overlay_cachedir
+            cachedir = os.path.join(overlay_cachedir, "tracks")
+        self.cachedir = cachedir
+        self.index_fn = os.path.join(self.cachedir, "index.json")
+
+    def _read_index(self):
+        try:
+            with open(self.index_fn, "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        fd, tmp_fn = tempfile.mkstemp(dir=self.cachedir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_fn, self.index_fn)
+
+    def _bundle_dir(self, content_hash):
+        return os.path.join(self.cachedir, "{}_v{}".format(content_hash,
+            TRACK_CACHE_VERSION))
+
+    def _load_bundle(self, bundle_dir):
+        keys = [filename[:-len(".npy")] for filename in os.listdir(bundle_dir)
+                if filename.endswith(".npy") and filename != SEGMENTS_FILENAME]
+        if not set(GPX_COLUMNS).issubset(keys):
+            raise IOError("Incomplete track cache {}".format(bundle_dir))
+        return {key: np.load(os.path.join(bundle_dir, key + ".npy"),
+            mmap_mode="r") for key in keys}
+
+    def _save_bundle(self, bundle_dir, columns, segments):
+        tmp_dir = tempfile.mkdtemp(dir=self.cachedir)
+        for key in columns:
+            np.save(os.path.join(tmp_dir, key + ".npy"), columns[key])
+        np.save(os.path.join(tmp_dir, SEGMENTS_FILENAME), segments)
+        try:
+            os.rename(tmp_dir, bundle_dir)
+        except OSError:
+#Some other process already saved the same track
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _cached_bundle(self, gpx_file):
+        """Directory of cached track and its columns if it was loaded
+
+        GPX file is parsed and saved only if it isn't in the cache yet.
+        Returns bundle directory and columns (None if they weren't loaded)
+        """
+        os.makedirs(self.cachedir, exist_ok=True)
+        abs_gpx_file = os.path.abspath(gpx_file)
+        stat = os.stat(abs_gpx_file)
+        index = self._read_index()
+        entry = index.get(abs_gpx_file)
+        if entry is not None and entry[0] == stat.st_size and \
+                entry[1] == stat.st_mtime_ns:
+            content_hash = entry[2]
+        else:
+            content_hash = _file_hash(abs_gpx_file)
+        bundle_dir = self._bundle_dir(content_hash)
+
+        columns = None
+        if not os.path.isfile(os.path.join(bundle_dir, SEGMENTS_FILENAME)):
+            columns, segments = get_track_columns_from_gpx(abs_gpx_file,
+                    local_time=False, segments=True)
+            self._save_bundle(bundle_dir, columns, segments)
+
+        if entry != [stat.st_size, stat.st_mtime_ns, content_hash]:
+            index[abs_gpx_file] = [stat.st_size, stat.st_mtime_ns, content_hash]
+            self._write_index(index)
+        return bundle_dir, columns
+
+    def load(self, gpx_file, local_time=True):
+        """Returns GPX columns same as get_track_columns_from_gpx
+
+        GPX file is parsed only if it isn't in the cache yet.
+        """
+        bundle_dir, columns = self._cached_bundle(gpx_file)
+        if columns is None:
+            columns = self._load_bundle(bundle_dir)
+
+        if local_time:
+            columns = dict(columns)
+            columns['time'] = columns['time'] - utc_offset_microseconds()
+        return columns
+
+    def load_segments(self, gpx_file):
+        """trkseg index of each point of load (-1 for waypoints)
+
+        See get_track_columns_from_gpx with segments=True.
+        """
+        bundle_dir, _ = self._cached_bundle(gpx_file)
+        return np.load(os.path.join(bundle_dir, SEGMENTS_FILENAME),
+                mmap_mode="r")
+
+
+def load_gpx_track(gpx_file, local_time=True, cachedir=None):
+    """Reads GPX columns with help of TrackCache
+
+    See Also
+    -------
+    GPSOverlay.lib.gps_parser.get_track_columns_from_gpx : Output format
+    """
+    return TrackCache(cachedir).load(gpx_file, local_time)
+
+
+def load_gpx_segments(gpx_file, cachedir=None):
+    """Reads trkseg index of each point of load_gpx_track with TrackCache"""
+    return TrackCache(cachedir).load_segments(gpx_file)
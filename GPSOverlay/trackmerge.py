@@ -0,0 +1,159 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .lib.gps_parser import GPX_COLUMNS, compute_speeds
+from .lib.geo import track_channels
+from .trackcache import load_gpx_track
+
+#Channels aligned from other tracks. Value is function which returns mask of
+#points where channel has a value. Extension channels have a value where they
+#aren't NaN
+_CHANNELS = {
+        'lat': lambda column: np.ones(len(column), dtype=bool),
+        'lon': lambda column: np.ones(len(column), dtype=bool),
+        'elevation': np.isfinite,
+        'hr': lambda column: column > 0,
+        }
+
+
+def merge_sorted(arrays):
+    """Merges sorted arrays into one sorted array (k-way merge)
+
+    Arrays are merged in pairs with searchsorted until only one is left, so
+    each value is moved log(k) times.
+
+    Returns
+    ------
+    merged : numpy.ndarray
+        Sorted values
+    sources : numpy.ndarray
+        Index of array each merged value came from
+    """
+    runs = [(np.asarray(array), np.full(len(array), i, dtype=np.int64))
+            for i, array in enumerate(arrays)]
+    if not runs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    while len(runs) > 1:
+        merged_runs = []
+        for (a, a_src), (b, b_src) in zip(runs[::2], runs[1::2]):
+            #Position of each value of b in merged array. Equal values from a
+            #go first so merge is stable
+            b_pos = np.searchsorted(a, b, side='right')+np.arange(len(b))
+            a_mask = np.ones(len(a)+len(b), dtype=bool)
+            a_mask[b_pos] = False
+            merged = np.empty(len(a)+len(b), dtype=np.result_type(a, b))
+            merged_src = np.empty(len(a)+len(b), dtype=np.int64)
+            merged[a_mask] = a
+            merged[b_pos] = b
+            merged_src[a_mask] = a_src
+            merged_src[b_pos] = b_src
+            merged_runs.append((merged, merged_src))
+        if len(runs) % 2:
+            merged_runs.append(runs[-1])
+        runs = merged_runs
+    return runs[0]
+
+
+def align_channel(times, source_times, values, max_gap):
+    """Values of a channel from one track at given times
+
+    Values are linearly interpolated when both neighbouring points of the
+    source are at most max_gap microseconds away, otherwise value of the
+    nearest point is used if it is close enough. Elsewhere result is NaN.
+    """
+    result = np.full(len(times), np.nan)
+    if not len(source_times):
+        return result
+    values = np.asarray(values, dtype=np.float64)
+    after = np.clip(np.searchsorted(source_times, times), 0,
+            len(source_times)-1)
+    before = np.maximum(after-1, 0)
+    gap_before = np.abs(times-source_times[before])
+    gap_after = np.abs(source_times[after]-times)
+    nearest = np.where(gap_before <= gap_after, values[before],
+            values[after])
+    linear = np.interp(times, source_times, values)
+    result = np.where(np.minimum(gap_before, gap_after) <= max_gap, nearest,
+            result)
+    return np.where((gap_before <= max_gap) & (gap_after <= max_gap), linear,
+            result)
+
+
+def merge_tracks(tracks, max_gap=10):
+    """Merges GPX columns of the same trip recorded by many devices
+
+    Times of all tracks are merged with merge_sorted (same times are kept
+    once). Every channel (position, elevation, heart rate) at each merged
+    time is taken from the first track in the list which has that channel
+    close enough in time (see align_channel). So position can come from
+    a bike computer and heart rate from a watch. Extension channels (cadence,
+    power...) of all tracks are merged the same way. Speed is calculated
+    again from merged positions.
+
+    Parameters
+    ---------
+    tracks : list
+        GPX columns (see lib.gps_parser.get_track_columns_from_gpx) in
+        order of priority
+    max_gap : float
+        Maximal time in seconds between merged time and point in track from
+        which a value is taken
+
+    Returns
+    ------
+    dict
+        Merged GPX columns
+    """
+    channels = sorted(set(key for track in tracks for key in
+        track_channels(track)))
+    tracks = [{key: np.asarray(track[key]) for key in list(GPX_COLUMNS) +
+        track_channels(track)} for track in tracks]
+    times, _ = merge_sorted([track['time'] for track in tracks])
+    if len(times):
+        times = times[np.concatenate(([True], np.diff(times) != 0))]
+    max_gap = int(max_gap*10**6)
+
+    columns = {'time': times}
+    all_channels = dict(_CHANNELS)
+    all_channels.update((key, np.isfinite) for key in channels)
+    for key, has_value in all_channels.items():
+        column = np.full(len(times), np.nan)
+        for track in tracks:
+            missing = np.isnan(column)
+            if not missing.any():
+                break
+            if key not in track:
+                continue
+            valid = has_value(track[key])
+            column[missing] = align_channel(times[missing],
+                    track['time'][valid], track[key][valid], max_gap)
+        columns[key] = column
+    columns['elevation'] = columns['elevation'].astype(np.float32)
+    columns['hr'] = np.nan_to_num(columns['hr']).astype(np.float32)
+    for key in channels:
+        columns[key] = columns[key].astype(np.float32)
+    columns['speed'] = compute_speeds(times, columns['lat'], columns['lon'],
+            columns['elevation'].astype(np.float64)).astype(np.float32)
+    return columns
+
+
+def load_gpx_tracks(gpx_files, local_time=True, workers=None, max_gap=10):
+    """Reads many GPX files in parallel and merges them with merge_tracks
+
+    Each file is read with trackcache.load_gpx_track in a process pool with
+    given number of workers (number of CPUs if None).
+    """
+    gpx_files = list(gpx_files)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(gpx_files))
+    if workers <= 1:
+        tracks = [load_gpx_track(gpx_file, local_time) for gpx_file in
+                gpx_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tracks = list(executor.map(load_gpx_track, gpx_files,
+                [local_time]*len(gpx_files)))
+    return merge_tracks(tracks, max_gap)
@@ -0,0 +1,204 @@
+import datetime
+
+import numpy as np
+
+from .util import GPSData
+from .lib.geo import times_to_microseconds, EPOCH
+
+#Column types. datetime is microseconds since epoch, missing floats are NaN
+TRACK_STORE_DTYPES = {
+        'lat': np.float64,
+        'lon': np.float64,
+        'bearing': np.float64,
+        'elevation': np.float64,
+        'speed': np.float64,
+        'heart': np.float64,
+        'datetime': np.int64,
+        'map': object,
+        'slope': np.float64,
+        'offset': np.float64,
+        }
+
+
+def _float_or_none(value):
+    value = float(value)
+    return None if value != value else value
+
+
+def _int_or_none(value):
+    value = float(value)
+    return None if value != value else int(value)
+
+
+def _int_if_integer(value):
+    value = float(value)
+    if value != value:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+#How value from column is converted to what GPSData has
+_DECODE = {
+        'lat': _float_or_none,
+        'lon': _float_or_none,
+        'bearing': _float_or_none,
+        'elevation': _float_or_none,
+        'speed': _float_or_none,
+        'heart': _float_or_none,
+        'datetime': lambda value: EPOCH+datetime.timedelta(
+            microseconds=int(value)),
+        'map': lambda value: value,
+        'slope': _int_or_none,
+        'offset': _int_if_integer,
+        }
+
+
+class GPSPoint(object):
+    """Row of TrackStore
+
+    Behaves like GPSData namedtuple (fields, indexing, iteration, _asdict,
+    _replace and comparison with tuples) but only keeps reference to the
+    store and row number. Values are read from columns when accessed.
+    """
+    __slots__ = ('_store', '_index')
+    _fields = GPSData._fields
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def _get(self, field):
+        return _DECODE[field](self._store.columns[field][self._index])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self)[i]
+        return self._get(self._fields[i])
+
+    def __iter__(self):
+        return (self._get(field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(self.to_gpsdata())
+
+    def __reduce__(self):
+        #Pickle only values of this row, not the whole store
+        return (GPSData, tuple(self))
+
+    def to_gpsdata(self):
+        """Returns values as GPSData namedtuple"""
+        return GPSData(*self)
+
+    def _asdict(self):
+        return self.to_gpsdata()._asdict()
+
+    def _replace(self, **kwargs):
+        return self.to_gpsdata()._replace(**kwargs)
+
+
+def _make_property(field):
+    return property(lambda self: self._get(field))
+
+for _field in GPSData._fields:
+    setattr(GPSPoint, _field, _make_property(_field))
+
+
+class TrackStore(object):
+    """GPSData of many points as struct of arrays
+
+    Each GPSData field is one contiguous NumPy column (see
+    TRACK_STORE_DTYPES): numbers are float64 (so values read back are the
+    same as the ones stored), datetime is int64 microseconds since epoch and
+    map is object array. Missing values are NaN. Indexing with an int returns
+    GPSPoint row view, indexing with a slice returns TrackStore whose columns
+    are views of this one.
+
+    Pickling a TrackStore only pickles its column buffers, so it is cheap to
+    send to worker processes.
+
+    Parameters
+    ---------
+    columns : dict
+        Column for each field in GPSData._fields
+    """
+
+    def __init__(self, columns):
+        self.columns = {field: np.asarray(columns[field],
+            dtype=TRACK_STORE_DTYPES[field]) for field in GPSData._fields}
+
+    @classmethod
+    def from_records(cls, records):
+        """Makes TrackStore from list of GPSData (None values become NaN)"""
+        records = list(records)
+        columns = {}
+        for field, values in zip(GPSData._fields, zip(*records) if records
+                else [()]*len(GPSData._fields)):
+            if field == 'datetime':
+                columns[field] = times_to_microseconds(values) if values \
+                        else np.empty(0, dtype=np.int64)
+            elif field == 'map':
+                columns[field] = np.array(values, dtype=object)
+            else:
+                columns[field] = np.array([np.nan if value is None else value
+                    for value in values], dtype=TRACK_STORE_DTYPES[field])
+        return cls(columns)
+
+    @property
+    def times(self):
+        """Times in microseconds since epoch"""
+        return self.columns['datetime']
+
+    def __len__(self):
+        return len(self.columns['datetime'])
+
+    def __iter__(self):
+        return (GPSPoint(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TrackStore({field: column[index] for field, column in
+                self.columns.items()})
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("TrackStore index out of range")
+        return GPSPoint(self, index)
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == b for a, b in
+                zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def window(self, start, end):
+        """Points with start <= time < end as TrackStore of column views
+
+        start and end are datetimes or microseconds since epoch. Points
+        need to be sorted by time.
+        """
+        start, end = times_to_microseconds([start, end])
+        first, last = np.searchsorted(self.times, [start, end], side='left')
+        return self[first:last]
+
+    def append(self, record):
+        """Adds GPSData at the end
+
+        All columns are copied, so building a store from many records should
+        be done with from_records.
+        """
+        new = TrackStore.from_records([record])
+        self.columns = {field: np.concatenate((column, new.columns[field]))
+                for field, column in self.columns.items()}
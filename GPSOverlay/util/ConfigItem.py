@@ -28,7 +28,18 @@ class ConfigItem(object):
         - heart : float - Heart rate in BPM (if exists in input file) [S/G/C]
         - slope : float - Slope between current points in % [S/G/C]
         - datetime : datetime - Time and date of GPX point (timezone?) [S] FIXME
+        - distance : float - Distance from start of GPX track in meters [S/G]
+        - ascent : float - Total climb from start of GPX track in meters [S/G]
+        - descent : float - Total descent from start of GPX track in meters
+          [S/G]
+        - grade : float - Smoothed slope of GPX track in % [S/G]
+        - moving_time : float - Seconds of moving from start of GPX track [S]
+        - average_speed : float - Average speed in m/s in last 30 seconds
+          [S/G]
         - map - Mapnik generated map of current point
+        - Any extension channel of GPX track by its name (cad, atemp, power
+          ...) : float - None when point doesn't have it [S/G/C] (see
+          DefaultConfig.make_channel_config)
 
     Parameters
     ---------
@@ -45,6 +56,12 @@ class ConfigItem(object):
     sample_value 
         Sample input value that func can create valid Clip (Used for testing
         clip locations)
+    memo_key : function or str
+        Makes quantized key from input value (arguments dict for overlays
+        with _run_func in config). Frames with the same key reuse the same
+        rendered clip (see memo_key method). If None input itself is the key.
+        If it is a str it is the name of the method of object made from
+        config (like in _run_func) which is called with _run_func arguments.
 
     See Also
     -------
@@ -53,8 +70,9 @@ class ConfigItem(object):
 
     """
     def __init__(self, func=None, position=None, config=None,
-            sample_value=None, position_break_func=None):
+            sample_value=None, position_break_func=None, memo_key=None):
         self.func = func
+        self.memo_func = memo_key
         self.position = position
         self.position_break_func = position_break_func
         self.config = config
@@ -78,7 +96,7 @@ class ConfigItem(object):
         return self.sample_value
 
     def get_clip(self, key, gps_info, gpx_index, W, H, break_type=BreakType.NO,
-            end_break_time=None, time_in_break=None):
+            end_break_time=None, time_in_break=None, run_args=None):
         """Fully creates clip
 
         Gets data( self.get_data), runs function (self.func) and sets position
@@ -100,6 +118,8 @@ class ConfigItem(object):
             Type of break (Start, middle, End)
         end_break_time : int
             Number of seconds
+        run_args : tuple
+            Result of run_args for the same input if it was already called
 
         Returns
         ------
@@ -108,7 +128,7 @@ class ConfigItem(object):
             couldn't be created
         """
         data = self.get_data(key, gps_info, gpx_index, break_type,
-                end_break_time, time_in_break, W, H)
+                end_break_time, time_in_break, W, H, run_args)
         if data is None:
             return None
         created_clip = self.func(data)
@@ -125,7 +145,7 @@ class ConfigItem(object):
 
 
     def get_data(self, key, gps_info, gpx_index, break_type, end_break_time,
-            time_in_break, W, H):
+            time_in_break, W, H, run_args=None):
         """Gets data for this key
 
         Parameters
@@ -145,46 +165,105 @@ class ConfigItem(object):
             it is True
         """
         if self.config is not None and "_run_func" in  self.config:
-            func_name, config = self.config["_run_func"]
-            #print (func_name, self.object)
-            func_name = getattr(self.object, func_name)
+            if run_args is None:
+                run_args = self._run_func_args(key, gps_info, gpx_index,
+                        break_type, end_break_time, time_in_break, W, H)
+            func, args = run_args
+            return func(**args)
+        return gps_info[key]
+
+    def run_args(self, key, gps_info, gpx_index, break_type=BreakType.NO,
+            end_break_time=None, time_in_break=None, W=None, H=None):
+        """Function from _run_func in config and its arguments
+
+        Returns None if config doesn't have _run_func. Result can be given to
+        memo_key and get_clip so arguments are only made once per frame.
+        """
+        if self.config is not None and "_run_func" in  self.config:
+            return self._run_func_args(key, gps_info, gpx_index, break_type,
+                    end_break_time, time_in_break, W, H)
+        return None
+
+    def _run_func_args(self, key, gps_info, gpx_index, break_type,
+            end_break_time, time_in_break, W, H):
+        """Function from _run_func in config and its arguments as dict"""
+        func_name, config = self.config["_run_func"]
+        #print (func_name, self.object)
+        func_name = getattr(self.object, func_name)
 #TODO: This should be done at init
 #FIXME: make this better
-            gps_info["angle"] = gps_info["bearing"]
-            object_vars = locals()
-            args = {k:self._magic_value(k, v, object_vars) \
-                    for k,v in config.items() if self._is_argument(k) }
-            #FIXME: This is ugly as hell
+        gps_info["angle"] = gps_info["bearing"]
+        object_vars = locals()
+        args = {k:self._magic_value(k, v, object_vars) \
+                for k,v in config.items() if self._is_argument(k) }
+        #FIXME: This is ugly as hell
 #If there is a break currently and this config supports breaks
-            if break_type != BreakType.NO and self.config.get("_support_breaks", False):
+        if break_type != BreakType.NO and self.config.get("_support_breaks", False):
 #We get break function
-                width_f, height_f = self.config["_break_func"](
-                        (self.config["map_w"], self.config["map_h"]),
-                        (W, H),
-                        break_type, end_break_time)
+            width_f, height_f = self.config["_break_func"](
+                    (self.config["map_w"], self.config["map_h"]),
+                    (W, H),
+                    break_type, end_break_time)
 #And add the arguments
-                args["img_width"] = int(round(width_f(time_in_break)))
-                args["img_height"] = int(round(height_f(time_in_break)))
-                #print ("WxH: {}x{}".format(args["img_width"], args["img_height"]))
-
-            if "_DICT" in config:
-                our_dict = object_vars[config["_DICT"]]
-                #print (func_name, config, args)
-                s = inspect.signature(func_name)
+            args["img_width"] = int(round(width_f(time_in_break)))
+            args["img_height"] = int(round(height_f(time_in_break)))
+            #print ("WxH: {}x{}".format(args["img_width"], args["img_height"]))
+
+        if "_DICT" in config:
+            our_dict = object_vars[config["_DICT"]]
+            #print (func_name, config, args)
+            s = inspect.signature(func_name)
 #Gets parameters from wanted function
-                func_params = set(s.parameters.keys())
-                both = func_params.intersection(our_dict.keys())
-                #print ("BOTH:", both)
-                pos_args = []
-                for param_name, param in s.parameters.items():
-                    if param_name in both:
-                        pos_args.append(our_dict[param_name])
-                #print ("POS ARGS:", pos_args)
-                return func_name(*pos_args, **args)
+            func_params = set(s.parameters.keys())
+            both = func_params.intersection(our_dict.keys())
+            #print ("BOTH:", both)
+            for param_name in s.parameters:
+                if param_name in both:
+                    args[param_name] = our_dict[param_name]
+            #print ("POS ARGS:", args)
+        #print ("Calling {} with {}".format(func_name, args))
+        return func_name, args
+
+    def memo_key(self, key, gps_info, gpx_index, break_type=BreakType.NO,
+            end_break_time=None, time_in_break=None, W=None, H=None,
+            run_args=None):
+        """Quantized input of this overlay
+
+        It is memo_key function applied to gps_info[key] or to arguments of
+        _run_func. Frames with the same key would get the same clip, so it
+        can be rendered only once. run_args is result of run_args if it was
+        already called.
+
+        Returns
+        ------
+        Hashable key or None if clip can't be reused (overlay moves in a
+        break, input is missing or isn't hashable)
+        """
+        if break_type != BreakType.NO and self.config is not None \
+            and self.config.get("_support_breaks", False):
+            return None
+        if self.config is not None and "_run_func" in  self.config:
+            if run_args is None:
+                run_args = self._run_func_args(key, gps_info, gpx_index,
+                        break_type, end_break_time, time_in_break, W, H)
+            _, args = run_args
+            if isinstance(self.memo_func, str):
+                value = getattr(self.object, self.memo_func)(**args)
+            elif self.memo_func is not None:
+                value = self.memo_func(args)
             else:
-                #print ("Calling {} with {}".format(func_name, args))
-                return func_name(**args)
-        return gps_info[key]
+                value = tuple(sorted(args.items()))
+        else:
+            value = gps_info[key]
+            if value is None:
+                return None
+            if self.memo_func is not None:
+                value = self.memo_func(value)
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        return value
 
     @staticmethod
     def _is_argument(argument):
@@ -324,8 +403,9 @@ class ChartConfigItem(ConfigItem):
         clip locations)
     """
     def __init__(self, func=None, position=None,
-            config=None, sample_value=None):
-        super().__init__(func, position, config, sample_value)
+            config=None, sample_value=None, memo_key=None):
+        super().__init__(func, position, config, sample_value,
+                memo_key=memo_key)
 
     @property
     def config_type(self):
@@ -350,8 +430,9 @@ class GaugeConfigItem(ConfigItem):
         clip locations)
     """
     def __init__(self, func=None, position=None,
-            config=None, sample_value=None):
-        super().__init__(func, position, config, sample_value)
+            config=None, sample_value=None, memo_key=None):
+        super().__init__(func, position, config, sample_value,
+                memo_key=memo_key)
 
     @property
     def config_type(self):
@@ -0,0 +1,41 @@
+from GPSOverlay.util import BreakType
+from GPSOverlay.util.ConfigItem import ConfigItem
+
+
+class Renderer(object):
+    """Renders "maps" of position rounded to 0.01 degree"""
+    def __init__(self):
+        self.renders = 0
+
+    def map_key(self, lat, lon, angle=None, angle_offset=0):
+        return round(lat, 2), round(lon, 2), (angle+angle_offset) % 360
+
+    def render(self, lat, lon, angle=None, angle_offset=0):
+        self.renders += 1
+        return self.map_key(lat, lon, angle, angle_offset)
+
+
+def make_item():
+    item = ConfigItem(func=lambda value: value,
+            position=lambda clip, W, H: clip,
+            config={"_run_func": ("render", {"_DICT": "gps_info",
+                "angle_offset": -10})},
+            memo_key="map_key")
+    item.object = Renderer()
+    return item
+
+
+def test_memo_key_from_object_method():
+    item = make_item()
+    gps_info = {'lat': 46.5012, 'lon': 15.6049, 'bearing': 5.0}
+    run_args = item.run_args("map", gps_info, 0)
+    key = item.memo_key("map", gps_info, 0, run_args=run_args)
+    assert key == (46.5, 15.6, 355.0)
+    assert item.get_clip("map", gps_info, 0, 100, 100,
+            run_args=run_args) == key
+    #Frames that get the same map have the same key
+    close = {'lat': 46.4998, 'lon': 15.5951, 'bearing': 365.0}
+    assert item.memo_key("map", close, 1) == key
+    assert item.memo_key("map", dict(close, lat=46.51), 1) != key
+    assert item.memo_key("map", close, 1, BreakType.START) == key
+    assert item.object.renders == 1
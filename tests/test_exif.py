@@ -0,0 +1,54 @@
+import exifread
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+from GPSOverlay.lib.exif import read_exif_tags, FAST_EXIF_TAGS, FAST_GPS_TAGS
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+
+
+def make_jpeg(path, i):
+    exif = Image.Exif()
+    exif[0x010F] = "Camera"
+    exif[0x0112] = 1 + i % 2
+    exif[0x0132] = "2020:05:31 10:00:{:02d}".format(i)
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    exif_ifd[0x9003] = "2020:05:31 10:00:{:02d}".format(i)
+    exif_ifd[0x9291] = "{:02d}".format(i*7 % 100)
+    gps = exif.get_ifd(GPS_IFD)
+    gps[0x0001] = "N"
+    gps[0x0002] = (IFDRational(46), IFDRational(30),
+            IFDRational(12345+i, 1000))
+    gps[0x0003] = "E" if i % 3 else "W"
+    gps[0x0004] = (IFDRational(15), IFDRational(36),
+            IFDRational(54321-i, 1000))
+    gps[0x0005] = b"\x00"
+    gps[0x0006] = IFDRational(30000+i, 100)
+    gps[0x0010] = "T"
+    gps[0x0011] = IFDRational(1000*i+17, 100)
+    Image.new("RGB", (16, 8), (10*i, 50, 20)).save(path, exif=exif.tobytes())
+
+
+def test_read_exif_tags_same_as_exifread(tmp_path):
+    names = set(["Image " + name for name in FAST_EXIF_TAGS.values()] +
+            ["EXIF " + name for name in FAST_EXIF_TAGS.values()] +
+            ["GPS " + name for name in FAST_GPS_TAGS.values()])
+    for i in range(10):
+        path = str(tmp_path / "{}.jpg".format(i))
+        make_jpeg(path, i)
+        fast = read_exif_tags(path)
+        with open(path, "rb") as f:
+            expected = exifread.process_file(f, details=False)
+        assert fast is not None
+        assert set(fast) == set(expected) & names
+        for key, tag in fast.items():
+            assert tag.values == expected[key].values, key
+            if isinstance(tag.values, str):
+                assert str(tag) == str(expected[key]), key
+
+
+def test_read_exif_tags_without_exif(tmp_path):
+    path = str(tmp_path / "plain.jpg")
+    Image.new("RGB", (16, 8)).save(path)
+    assert read_exif_tags(path) is None
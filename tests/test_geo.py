@@ -0,0 +1,58 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from GPSOverlay.lib.geo import TrackIndex, interpolate_lat_lon, \
+        interpolate_many, EPOCH
+
+
+def make_track(n=500, seed=1):
+    rng = np.random.RandomState(seed)
+    times = np.cumsum(rng.randint(1, 5*10**6, n)).astype(np.int64) + \
+            1590969000*10**6
+    elevation = (300+np.cumsum(rng.normal(0, 1, n))).astype(np.float32)
+    hr = (120+rng.randint(0, 40, n)).astype(np.float32)
+    hr[:20] = 0
+    return {
+            'time': times,
+            'lat': 46.5+np.cumsum(rng.normal(0, 1e-4, n)),
+            'lon': 15.6+np.cumsum(rng.normal(0, 1e-4, n)),
+            'elevation': elevation,
+            'speed': rng.uniform(0, 10, n).astype(np.float32),
+            'hr': hr,
+            }
+
+
+@pytest.mark.parametrize("missing_elevation", [False, True])
+def test_interpolate_many_same_as_interpolate_lat_lon(missing_elevation):
+    track = make_track()
+    if missing_elevation:
+        #Points without <ele>, also next to each other and at the ends
+        track['elevation'][[0, 3, 4, 50, 77, 78, 79, 300, -1]] = np.nan
+    rng = np.random.RandomState(2)
+    times = np.sort(rng.randint(track['time'][1], track['time'][-2], 300))
+    #Times exactly at points (not at the first one, see interpolate_many)
+    times = np.concatenate((times, track['time'][5:8], track['time'][-1:]))
+    many = interpolate_many(track, times)
+    index = TrackIndex(track)
+    for i, t in enumerate(times.tolist()):
+        lat, lon, bearing, ele, speed, hr, idx = interpolate_lat_lon(index,
+                EPOCH+datetime.timedelta(microseconds=t))
+        assert many['lat'][i] == lat
+        assert many['lon'][i] == lon
+        assert many['index'][i] == idx
+        np.testing.assert_allclose(many['bearing'][i], bearing, rtol=1e-12)
+        if ele is None:
+            assert np.isnan(many['elevation'][i])
+        else:
+            np.testing.assert_allclose(many['elevation'][i], ele, rtol=1e-6)
+        np.testing.assert_allclose(many['speed'][i], speed, rtol=1e-6)
+        np.testing.assert_allclose(many['hr'][i], hr, rtol=1e-6)
+
+
+def test_interpolate_lat_lon_needs_track_index():
+    track = make_track(10)
+    with pytest.raises(TypeError):
+        interpolate_lat_lon(track, EPOCH+datetime.timedelta(
+            microseconds=int(track['time'][3])))
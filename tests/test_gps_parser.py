@@ -0,0 +1,81 @@
+import datetime
+
+import numpy as np
+import gpxpy
+
+from GPSOverlay.lib.gps_parser import get_track_columns_from_gpx
+from GPSOverlay.lib.geo import datetime_to_microseconds
+
+
+def make_gpx(path, n=300, seed=0):
+    """Writes GPX with two segments, waypoints and some missing elevations"""
+    rng = np.random.RandomState(seed)
+    start = datetime.datetime(2020, 5, 31, 10, 0, 0)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+            '<gpx version="1.1" creator="test" '
+            'xmlns="http://www.topografix.com/GPX/1/1" '
+            'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/'
+            'TrackPointExtension/v1">',
+            '<wpt lat="46.5005" lon="15.6005"><ele>300.5</ele>'
+            '<time>2020-05-31T10:00:30Z</time></wpt>',
+            '<trk><trkseg>']
+    lat, lon = 46.5, 15.6
+    for i in range(n):
+        if i == n//2:
+            lines.append('</trkseg><trkseg>')
+        lat += rng.normal(0, 1e-4)
+        lon += rng.normal(0, 1e-4)
+        time = start+datetime.timedelta(seconds=i,
+                microseconds=int(rng.randint(0, 1000))*1000)
+        ele = "" if i % 17 == 0 else "<ele>{:.1f}</ele>".format(
+                300+rng.normal(0, 5))
+        lines.append('<trkpt lat="{:.7f}" lon="{:.7f}">{}<time>{}Z</time>'
+                '<extensions><gpxtpx:TrackPointExtension><gpxtpx:hr>{}'
+                '</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions>'
+                '</trkpt>'.format(lat, lon, ele,
+                    time.isoformat(timespec='milliseconds'),
+                    120+i % 30))
+    lines.append('</trkseg></trk></gpx>')
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def gpxpy_points(gpx_file):
+    """(time, lat, lon, elevation) of track points and waypoints in UTC"""
+    with open(gpx_file) as f:
+        gpx = gpxpy.parse(f)
+    points = []
+    for point in [p for track in gpx.tracks for segment in track.segments
+            for p in segment.points]+gpx.waypoints:
+        time = point.time.replace(tzinfo=None)-point.time.utcoffset()
+        points.append((datetime_to_microseconds(time), point.latitude,
+            point.longitude, point.elevation))
+    points.sort(key=lambda p: p[:3])
+    return points
+
+
+def test_gpx_columns_same_as_gpxpy(tmp_path):
+    gpx_file = str(tmp_path / "track.gpx")
+    make_gpx(gpx_file)
+    columns = get_track_columns_from_gpx(gpx_file, local_time=False)
+    points = gpxpy_points(gpx_file)
+    assert len(columns['time']) == len(points)
+    assert columns['time'].tolist() == [p[0] for p in points]
+    assert columns['lat'].tolist() == [p[1] for p in points]
+    assert columns['lon'].tolist() == [p[2] for p in points]
+    elevation = np.array([np.nan if p[3] is None else p[3] for p in points],
+            dtype=np.float32)
+    np.testing.assert_array_equal(columns['elevation'], elevation)
+
+
+def test_gpx_segments_and_waypoints(tmp_path):
+    gpx_file = str(tmp_path / "track.gpx")
+    make_gpx(gpx_file, n=100)
+    columns, segments = get_track_columns_from_gpx(gpx_file, local_time=False,
+            segments=True)
+    assert np.bincount(segments[segments >= 0]).tolist() == [50, 50]
+    assert np.count_nonzero(segments == -1) == 1
+    track_only = get_track_columns_from_gpx(gpx_file, local_time=False,
+            waypoints=False)
+    assert len(track_only['time']) == 100
+    assert track_only['hr'][:3].tolist() == [120, 121, 122]
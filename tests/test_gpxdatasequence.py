@@ -0,0 +1,184 @@
+import datetime
+import os
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+import GPSOverlay
+from GPSOverlay.lib.geo import utc_offset_microseconds
+from GPSOverlay.util import BreakType
+
+EFFECT_LENGTH = 1
+START = datetime.datetime(2020, 5, 31, 10, 0, 0)
+
+
+def dms(value):
+    degrees = int(value)
+    minutes = int((value-degrees)*60)
+    seconds = round(((value-degrees)*60-minutes)*60*10**6)
+    return (IFDRational(degrees), IFDRational(minutes),
+            IFDRational(seconds, 10**6))
+
+
+def make_gpx(path, n, seed=7):
+    """Writes GPX with one point per second, returns lat, lon, elevation"""
+    rng = np.random.RandomState(seed)
+    lat = 46.5+np.cumsum(rng.uniform(0, 2e-4, n))
+    lon = 15.6+np.cumsum(rng.uniform(0, 2e-4, n))
+    ele = 300+np.cumsum(rng.normal(0, 1, n))
+    #GPX is in UTC and images are in local time
+    utc = datetime.timedelta(microseconds=utc_offset_microseconds())
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+            '<gpx version="1.1" creator="test" '
+            'xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>']
+    for i in range(n):
+        time = START+datetime.timedelta(seconds=i)+utc
+        lines.append('<trkpt lat="{:.7f}" lon="{:.7f}"><ele>{:.1f}</ele>'
+                '<time>{}Z</time></trkpt>'.format(lat[i], lon[i], ele[i],
+                    time.isoformat()))
+    lines.append('</trkseg></trk></gpx>')
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+    return lat, lon, ele
+
+
+def make_image(directory, second, lat, lon, ele):
+    """Writes JPEG taken second seconds after START at track position"""
+    time = START+datetime.timedelta(seconds=second)
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0x9003] = time.strftime("%Y:%m:%d %H:%M:%S")
+    gps = exif.get_ifd(0x8825)
+    gps[0x0001] = "N"
+    gps[0x0002] = dms(lat[second])
+    gps[0x0003] = "E"
+    gps[0x0004] = dms(lon[second])
+    gps[0x0005] = b"\x00"
+    gps[0x0006] = IFDRational(int(ele[second]*100), 100)
+    gps[0x0010] = "T"
+    gps[0x0011] = IFDRational(90)
+    path = os.path.join(directory, time.strftime("%Y%m%d_%H%M%S.JPG"))
+    Image.new("RGB", (16, 8)).save(path, exif=exif.tobytes())
+    return path
+
+
+@pytest.fixture(scope="module")
+def sequence(tmp_path_factory):
+    """GPXDataSequence of 120 images 3 seconds apart with recording breaks
+    after the first, the 61st and the second to last image"""
+    from GPSOverlay.GPXDataSequence import GPXDataSequence
+    tmp_path = tmp_path_factory.mktemp("sequence")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(GPSOverlay, "cachedir", str(tmp_path / "cache"))
+        gpx_file = str(tmp_path / "track.gpx")
+        lat, lon, ele = make_gpx(gpx_file, 3000)
+        gaps = [3]*119
+        gaps[0] = gaps[60] = gaps[-1] = 300
+        seconds = np.concatenate(([5], 5+np.cumsum(gaps))).tolist()
+        images = tmp_path / "images"
+        images.mkdir()
+        files = [make_image(str(images), second, lat, lon, ele) for second
+                in seconds]
+        config = types.SimpleNamespace(effect_length=EFFECT_LENGTH,
+                config_items=lambda need_config=False: [],
+                make_items=lambda: [])
+        yield GPXDataSequence.from_sequence_with_breaks(files,
+                gpx_file=gpx_file, config=config, timeline_fps=24,
+                exif_workers=1)
+
+
+def frame_state(sequence, t):
+    """State of frame at t the way make_frame finds it without timeline"""
+    index = sequence.find_image_index(t)
+    break_video, end_break_time = sequence.find_break(index, t,
+            EFFECT_LENGTH)
+    gps_info, gpx_index = sequence.make_gpx(t, index)
+    gps_info = gps_info._asdict()
+    gps_info.update(sequence.gpx_data.metrics_at(gpx_index,
+        gps_info['datetime']))
+    gps_info.update(sequence.gpx_data.channels_at(gpx_index,
+        gps_info['datetime']))
+    return index, break_video, end_break_time, gps_info, gpx_index
+
+
+def test_timeline_same_as_frame_by_frame(sequence):
+    rows = len(sequence.timeline['image_index'])
+    assert rows == int(np.ceil(sequence.duration*sequence.timeline_fps))
+    for row in range(rows):
+        t = row/sequence.timeline_fps
+        assert sequence._timeline_row(t) == row
+        index, break_video, end_break_time, gps_info, gpx_index = \
+                sequence._frame_state_from_timeline(row)
+        expected = frame_state(sequence, t)
+        assert (index, break_video, end_break_time, gpx_index) == \
+                (expected[0], expected[1], expected[2], expected[4]), t
+        assert set(gps_info) == set(expected[3])
+        for key, value in expected[3].items():
+            if value is None or isinstance(value, datetime.datetime):
+                assert gps_info[key] == value, (t, key)
+            else:
+                np.testing.assert_allclose(gps_info[key], value, rtol=1e-6,
+                        atol=1e-9, err_msg="{} {}".format(t, key))
+    break_types = set(sequence.timeline['break_type'].tolist())
+    assert len(break_types) == 4
+
+
+def find_break_loop(sequence, index, t):
+    """find_break the way it was before break_table, with is_break for
+    each image"""
+    starts = sequence.images_starts
+    speedup = sequence.speedup_factor
+    break_video = BreakType.NO
+    if len(starts) > index+1 and sequence.gpx_data.is_break(index,
+            starts[index]*speedup, starts[index+1]*speedup, EFFECT_LENGTH,
+            speedup):
+        if t-starts[index] <= EFFECT_LENGTH:
+            break_video = BreakType.START
+        elif starts[index+1]-t <= EFFECT_LENGTH:
+            break_video = BreakType.END
+        else:
+            break_video = BreakType.MIDDLE
+    return break_video, sequence.durations[index]
+
+
+def test_break_table_same_as_is_break(sequence):
+    starts = sequence.images_starts
+    speedup = sequence.speedup_factor
+    expected = [sequence.gpx_data.is_break(i, starts[i]*speedup,
+        starts[i+1]*speedup, EFFECT_LENGTH, speedup) for i in
+        range(len(starts)-1)] + [False]
+    assert sequence.break_table['is_break'].tolist() == expected
+    #Breaks after the first image and before the last one, last image is
+    #never a break
+    assert np.flatnonzero(expected).tolist() == [0, 60, 118]
+
+
+def test_find_break_same_as_loop(sequence):
+    starts = np.asarray(sequence.images_starts)
+    rng = np.random.RandomState(8)
+    times = np.concatenate((starts, starts[1:]-EFFECT_LENGTH,
+        starts+EFFECT_LENGTH, rng.uniform(0, sequence.duration, 300)))
+    times = times[times < sequence.duration]
+    for t in times.tolist():
+        index = int(np.searchsorted(starts, t, side='right'))-1
+        expected = find_break_loop(sequence, index, t)
+        assert sequence.find_break(index, t, EFFECT_LENGTH) == expected, t
+        #Without index image is found in break_table
+        assert sequence.find_break(None, t, EFFECT_LENGTH) == expected, t
+
+
+def test_find_image_index_same_as_linear_scan(sequence):
+    starts = sequence.images_starts
+    rng = np.random.RandomState(9)
+    forward = np.concatenate((starts, np.nextafter(starts, -np.inf)[1:],
+        rng.uniform(0, sequence.duration, 200)))
+    forward = np.sort(forward[forward < sequence.duration])
+    #Growing times, seeks back to the start and random jumps both ways
+    times = np.concatenate((forward, forward[::-1], rng.permutation(forward)))
+    for t in times.tolist():
+        expected = max([i for i in range(len(starts)) if starts[i] <= t])
+        assert sequence.find_image_index(t) == expected, t
+    with pytest.raises(ValueError):
+        sequence.find_image_index(-1)
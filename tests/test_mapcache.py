@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from GPSOverlay.mapcache import MapStore, MemoryMapCache, make_map_store, \
+        MAP_ENCODINGS
+
+MAP_BYTES = 30*40*4
+
+
+def make_map(value):
+    return np.full((30, 40, 4), value, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("encoding", MAP_ENCODINGS)
+def test_map_store_round_trip(tmp_path, encoding):
+    store = MapStore(str(tmp_path / "maps.sqlite"), encoding=encoding)
+    array = np.random.RandomState(5).randint(0, 256, (30, 40, 4)) \
+            .astype(np.uint8)
+    store.put("a", array)
+    store.put("rgb", array[:, :, :3])
+    np.testing.assert_array_equal(store.get("a"), array)
+    np.testing.assert_array_equal(store.get("rgb"), array[:, :, :3])
+    assert store.get("missing") is None
+    assert (store.hits, store.misses) == (2, 1)
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_map_store_evicts_least_recently_used(tmp_path):
+    store = MapStore(str(tmp_path / "maps.sqlite"), max_bytes=3*MAP_BYTES,
+            encoding='raw')
+    for i in range(4):
+        store.put(str(i), make_map(i))
+    assert store.evictions == 1
+    assert store.get("0") is None
+    #Read map is used again so the next oldest one is evicted
+    assert store.get("1") is not None
+    store.put("4", make_map(4))
+    assert sorted(store.preload(str(i) for i in range(5))) == ["1", "3", "4"]
+    assert store.total_bytes == 3*MAP_BYTES
+
+
+def test_map_store_shared_between_stores(tmp_path):
+    path = str(tmp_path / "maps.sqlite")
+    first = MapStore(path, max_bytes=2*MAP_BYTES, encoding='raw')
+    second = MapStore(path, max_bytes=2*MAP_BYTES, encoding='raw')
+    first.put("a", make_map(1))
+    second.put("b", make_map(2))
+    first.put("c", make_map(3))
+    assert first.total_bytes == second.total_bytes == 2*MAP_BYTES
+    assert second.get("a") is None
+
+
+def test_map_store_keeps_running_total(tmp_path):
+    store = MapStore(str(tmp_path / "maps.sqlite"), max_bytes=5*MAP_BYTES,
+            encoding='raw')
+    statements = []
+    store._connect().set_trace_callback(statements.append)
+    for i in range(20):
+        store.put(str(i % 8), make_map(i))
+    store.delete("7")
+    store.delete("missing")
+    #Size is summed in SQL only once, not for each put
+    assert sum("SUM(size)" in s for s in statements) == 1
+    assert store.total_bytes == 4*MAP_BYTES
+    assert store._connect().execute("SELECT SUM(size) FROM maps") \
+            .fetchone()[0] == 4*MAP_BYTES
+
+
+def test_map_store_skips_maps_over_budget(tmp_path):
+    store = MapStore(str(tmp_path / "maps.sqlite"), max_bytes=MAP_BYTES,
+            encoding='raw')
+    store.put("a", make_map(1))
+    store.put("big", np.zeros((100, 100, 4), dtype=np.uint8))
+    assert store.get("big") is None
+    assert store.get("a") is not None
+    assert store.evictions == 0
+
+
+def test_directory_map_store(tmp_path):
+    store = make_map_store(str(tmp_path))
+    store.put("a", make_map(7))
+    np.testing.assert_array_equal(store.get("a"), make_map(7))
+    assert list(store.preload(["a", "b"])) == ["a"]
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_memory_map_cache_evicts_by_bytes():
+    cache = MemoryMapCache(3*MAP_BYTES)
+    for i in range(3):
+        cache.put(i, make_map(i))
+    assert cache.get(0) is not None
+    cache.put(3, make_map(3))
+    assert 1 not in cache and 0 in cache
+    assert cache.total_bytes == 3*MAP_BYTES
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 0, 1)
+    assert cache.get(1) is None
+    cache.put("big", np.zeros(4*MAP_BYTES, dtype=np.uint8))
+    assert "big" not in cache and len(cache) == 3
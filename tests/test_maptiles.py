@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+from GPSOverlay.maptiles import world_pixel, world_pixel_to_lat_lon, \
+        quantize_position, quantize_angle, map_name, metatile_window, \
+        metatile_bounds, rotate_map, MERCATOR_HALF_WORLD
+
+
+def test_world_pixel():
+    assert world_pixel(0, 0, 0) == pytest.approx((128, 128))
+    assert world_pixel(0, -180, 3) == pytest.approx((0, 1024))
+    x, y = world_pixel(85.0511287798, 180, 1)
+    assert (x, y) == pytest.approx((512, 0), abs=1e-6)
+    #Pixels grow to the east and to the south
+    x, y = world_pixel(46.5, 15.6, 17.5)
+    assert world_pixel(46.5, 15.6001, 17.5)[0] > x
+    assert world_pixel(46.4999, 15.6, 17.5)[1] > y
+
+
+@pytest.mark.parametrize("width,height", [(20, 10), (31, 17)])
+def test_metatile_window_crop_same_as_world(width, height):
+    size = 64
+    #Each pixel of world is its own x, y
+    yy, xx = np.mgrid[-size:512+size, -size:512+size]
+    world = np.dstack((xx, yy))
+    def world_crop(left, top, w, h):
+        return world[top+size:top+size+h, left+size:left+size+w]
+    step = (size-width, size-height)
+    #Centers around metatile edges (and exactly on them) and world edges
+    edges = [k*s+d for s in step for k in range(0, 8) for d in
+            (-1, -0.5, 0, 0.49, 0.5, 1)]
+    centers = [(x+width/2, y+height/2) for x in edges for y in edges[::7]]
+    centers += [(0, 0), (0.3, 511.7), (511.9, 3)]
+    for x, y in centers:
+        step_x, step_y, col, row, left, top, tile_left, tile_top = \
+                metatile_window(x, y, width, height, size)
+        assert (step_x, step_y) == step
+        assert (left, top) == (int(round(x-width/2)), int(round(y-height/2)))
+        assert 0 <= tile_left and tile_left+width <= size
+        assert 0 <= tile_top and tile_top+height <= size
+        tile = world_crop(col*step_x, row*step_y, size, size)
+        np.testing.assert_array_equal(
+                tile[tile_top:tile_top+height, tile_left:tile_left+width],
+                world_crop(left, top, width, height))
+
+
+def test_metatile_bounds():
+    zoom = 4
+    meters = 2*MERCATOR_HALF_WORLD/(256*2**zoom)
+    minx, miny, maxx, maxy = metatile_bounds(zoom, 100, 90, 3, 2, 128)
+    assert (minx+MERCATOR_HALF_WORLD)/meters == pytest.approx(300)
+    assert (MERCATOR_HALF_WORLD-maxy)/meters == pytest.approx(180)
+    assert (maxx-minx)/meters == pytest.approx(128)
+    assert (maxy-miny)/meters == pytest.approx(128)
+
+
+def marker_map(size, x, y):
+    """Transparent RGBA map with opaque 3x3 marker around pixel x, y"""
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[y-1:y+2, x-1:x+2] = 255
+    return rgba
+
+
+def marker_position(rgba):
+    """Center of marker (pixel centers are at +0.5 as for map centers)"""
+    ys, xs = np.nonzero(rgba[:, :, 3] > 128)
+    return xs.mean()+0.5, ys.mean()+0.5
+
+
+def test_rotate_map_heading_points_up():
+    width, height = 40, 30
+    size = int(np.ceil(np.hypot(width, height)))+2
+    #Map center is in the middle of pixel 26, 27, marker is 10 pixels east
+    center_x, center_y = 26.5, 27.5
+    rgba = marker_map(size, 36, 27)
+    north_up, (cx, cy) = rotate_map(rgba, 0, center_x, center_y, width,
+            height)
+    assert north_up.shape == (height, width, 4)
+    left, top = int(center_x-cx), int(center_y-cy)
+    np.testing.assert_array_equal(north_up,
+            rgba[top:top+height, left:left+width])
+    assert marker_position(north_up) == pytest.approx((cx+10, cy))
+    #Heading east, marker is above center
+    heading_east, center_east = rotate_map(rgba, 90, center_x, center_y,
+            width, height)
+    assert center_east == (cx, cy)
+    assert marker_position(heading_east) == pytest.approx((cx, cy-10))
+    #Heading south-west, east is down to the left
+    heading_sw, _ = rotate_map(rgba, 225, center_x, center_y, width, height)
+    assert marker_position(heading_sw) == pytest.approx(
+            (cx-10/2**0.5, cy+10/2**0.5), abs=0.5)
+
+
+def test_rotate_map_keeps_sub_pixel_center():
+    rgba = marker_map(60, 30, 20)
+    data, (cx, cy) = rotate_map(rgba, 0, 30.3, 29.6, 20, 20)
+    assert (cx, cy) == pytest.approx((10.3, 9.6))
+    assert data.shape == (20, 20, 4)
+
+
+def test_world_pixel_round_trip():
+    rng = np.random.RandomState(10)
+    for zoom in (0, 5, 12.5, 18):
+        for lat, lon in zip(rng.uniform(-85, 85, 50), rng.uniform(-180, 180,
+            50)):
+            x, y = world_pixel(lat, lon, zoom)
+            assert world_pixel_to_lat_lon(x, y, zoom) == pytest.approx(
+                    (lat, lon), abs=1e-9)
+            assert world_pixel(*world_pixel_to_lat_lon(x, y, zoom), zoom) == \
+                    pytest.approx((x, y), abs=1e-6)
+
+
+def test_quantize_position():
+    zoom = 17
+    assert quantize_position(46.5, 15.6, zoom, None) == (46.5, 15.6)
+    lat, lon = quantize_position(46.51234567, 15.61234567, zoom, 4)
+    x, y = world_pixel(lat, lon, zoom)
+    assert (x/4, y/4) == pytest.approx((round(x/4), round(y/4)), abs=1e-6)
+    assert quantize_position(lat, lon, zoom, 4) == pytest.approx((lat, lon),
+            abs=1e-12)
+    #Centers less than half of quantum apart are the same map
+    x0, y0 = world_pixel(46.51234567, 15.61234567, zoom)
+    same = [quantize_position(*world_pixel_to_lat_lon(x0+dx, y0+dy, zoom),
+        zoom, 4) for dx, dy in ((0, 0), (0.1, -0.1), (-0.05, 0.05))]
+    assert len(set(map_name(lat, lon) for lat, lon in same)) == 1
+
+
+def test_quantize_angle_wraps_around():
+    assert quantize_angle(None, 5) is None
+    assert quantize_angle(359.9, 1) == 0
+    assert quantize_angle(359.96, 0.1) == pytest.approx(0, abs=1e-9)
+    assert quantize_angle(-0.4, 1) == 0
+    assert quantize_angle(-2, 5) == 0
+    assert quantize_angle(-3, 5) == 355
+    assert quantize_angle(721, 5) == 0
+    assert quantize_angle(372.5, None) == 12.5
+    assert quantize_angle(-90, None) == 270
+    for angle in np.linspace(-720, 720, 577):
+        for quantum in (None, 0.5, 5, 45):
+            quantized = quantize_angle(angle, quantum)
+            assert 0 <= quantized < 360
+            #Same map name as for the angle one turn later
+            assert map_name(46.5, 15.6, angle=quantized) == \
+                    map_name(46.5, 15.6, angle=quantize_angle(angle+360,
+                        quantum))
+
+
+def test_map_name_stays_the_same():
+    #Names of north-up maps as they were saved before angle was in names
+    assert map_name(46.512345, 15.612345, 400, 300) == "4651234_1561234_400_300"
+    assert map_name(46.512346, 15.612346, 400, 300, 17.5) == \
+            "4651235_1561235_400_300_Z1750000"
+    assert map_name(-0.000004, 0.000006) == "0_1"
+    assert map_name(46.5, 15.6, zoom_to_layer=True,
+            gpx_file="/some/where/long_track_name.gpx") == \
+                    "LAYER_long_track_name.gpx"
+    assert map_name(46.5, 15.6, 800, 600, zoom_to_layer=True,
+            gpx_file="/a/b/track.gpx") == "LAYER_abtrack.gpx_800_600"
+    #Rotated maps only get angle in 1/100 of degree at the end
+    assert map_name(46.5, 15.6, 400, 300, 17.5, angle=12.345) == \
+            "4650000_1560000_400_300_Z1750000_A1234"
+    assert map_name(46.5, 15.6, 400, 300, angle=0) == \
+            "4650000_1560000_400_300_A0"
@@ -0,0 +1,47 @@
+import numpy as np
+
+from GPSOverlay.metrics import climb_steps, TrackMetrics
+
+
+def make_track(elevation):
+    n = len(elevation)
+    return {
+            'time': np.arange(n, dtype=np.int64)*10**6,
+            'lat': 46.5+np.arange(n)*1e-5,
+            'lon': np.full(n, 15.6),
+            'elevation': np.asarray(elevation, dtype=np.float64),
+            'speed': np.full(n, 1.1),
+            'hr': np.zeros(n),
+            }
+
+
+def test_noisy_flat_elevation_has_no_climb():
+    rng = np.random.RandomState(11)
+    elevation = 300+rng.normal(0, 0.5, 10000)
+    elevation[::13] = np.nan
+    raw = np.nansum(np.clip(np.diff(elevation[np.isfinite(elevation)]), 0,
+        None))
+    metrics = TrackMetrics(make_track(elevation))
+    assert raw > 1000
+    assert metrics.columns['ascent'][-1] < 5
+    assert metrics.columns['descent'][-1] < 5
+
+
+def test_noisy_climb_is_counted_once():
+    rng = np.random.RandomState(12)
+    #Up 100 m, down 40 m
+    elevation = np.concatenate((np.linspace(300, 400, 2000),
+        np.linspace(400, 360, 1000)))+rng.normal(0, 0.3, 3000)
+    up, down = climb_steps(elevation, 2)
+    assert abs(up.sum()-100) < 4
+    assert abs(down.sum()-40) < 4
+    np.testing.assert_allclose(up.sum()-down.sum(),
+            elevation[np.flatnonzero(up+down)[-1]]-elevation[0])
+
+
+def test_climb_steps_missing_elevation():
+    up, down = climb_steps([np.nan, 10, np.nan, 11, 13, 12.5, 10, np.nan], 2)
+    assert up.tolist() == [0, 0, 0, 0, 3, 0, 0, 0]
+    assert down.tolist() == [0, 0, 0, 0, 0, 0, 3, 0]
+    up, down = climb_steps([np.nan, np.nan], 2)
+    assert not up.any() and not down.any()
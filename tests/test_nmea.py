@@ -0,0 +1,69 @@
+import datetime
+from functools import reduce
+
+import numpy as np
+import pynmea2
+
+from GPSOverlay.lib.gps_parser import iter_nmea_fixes
+from GPSOverlay.lib.geo import datetime_to_microseconds
+
+
+def nmea_sentence(body):
+    return "${}*{:02X}".format(body, reduce(lambda a, c: a ^ ord(c), body,
+        0))
+
+
+def make_nmea(n=200, talkers=("GP",)):
+    lines = ["garbage"]
+    start = datetime.datetime(2020, 5, 31, 23, 59, 0)
+    for i in range(n):
+        time = start+datetime.timedelta(seconds=i, microseconds=i % 7*10**5)
+        hhmmss = time.strftime("%H%M%S") + (".{:02d}".format(
+            time.microsecond//10**4) if i % 3 else "")
+        lat = "46{:07.4f}".format(30+i*0.0006)
+        lon = "015{:07.4f}".format(36-i*0.0006)
+        alt = "" if i % 11 == 0 else "{:.1f}".format(300+i % 9)
+        if i % 5 == 0:
+            lines.append(nmea_sentence("GPRMC,{},A,{},N,{},E,022.4,084.4,"
+                "{},003.1,W".format(hhmmss, lat, lon,
+                    time.strftime("%d%m%y"))))
+        for talker in talkers:
+            lines.append(nmea_sentence("{}GGA,{},{},N,{},E,1,08,0.9,{},M,"
+                "46.9,M,,".format(talker, hhmmss, lat, lon, alt)))
+    return lines
+
+
+def pynmea2_fixes(lines):
+    """GGA fixes parsed with pynmea2 the way the first parser did it"""
+    date = None
+    for line in lines:
+        if "GPRMC" in line:
+            date = pynmea2.parse(line).datetime.date()
+            break
+    fixes = []
+    for line in lines:
+        if "GPRMC" in line:
+            date = pynmea2.parse(line).datetime.date()
+        if "$GPGGA" in line:
+            data = pynmea2.parse(line)
+            timestamp = datetime.datetime.combine(date,
+                    data.timestamp.replace(tzinfo=None))
+            fixes.append((datetime_to_microseconds(timestamp), data.latitude,
+                data.longitude, data.altitude))
+    return fixes
+
+
+def test_nmea_fixes_same_as_pynmea2():
+    lines = make_nmea()
+    fixes = list(iter_nmea_fixes(lines))
+    expected = pynmea2_fixes(lines)
+    assert [f[0] for f in fixes] == [f[0] for f in expected]
+    np.testing.assert_allclose([f[1:3] for f in fixes],
+            [f[1:3] for f in expected], rtol=0, atol=1e-9)
+    assert [f[3] for f in fixes] == [f[3] for f in expected]
+
+
+def test_nmea_other_talkers_are_not_duplicated():
+    single = list(iter_nmea_fixes(make_nmea()))
+    multi = list(iter_nmea_fixes(make_nmea(talkers=("GN", "GP", "GL"))))
+    assert multi == single
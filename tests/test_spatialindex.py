@@ -0,0 +1,26 @@
+import numpy as np
+
+from GPSOverlay.spatialindex import TrackSpatialIndex
+
+
+def test_nearest_segments_same_as_brute_force():
+    rng = np.random.RandomState(6)
+    n = 2000
+    lat = 46.5+np.cumsum(rng.normal(0, 1e-4, n))
+    lon = 15.6+np.cumsum(rng.normal(0, 1e-4, n))
+    #GPS jump of about 50 km
+    lat[n//2:] += 0.4
+    lon[n//2:] += 0.3
+    index = TrackSpatialIndex({'time': np.arange(n, dtype=np.int64)*10**6,
+        'lat': lat, 'lon': lon})
+    #Jump adds cells along the line, not its whole bounding box
+    assert len(index.segment_ids) < 20*n
+    points = rng.randint(0, n, 200)
+    query_lat = np.append(lat[points]+rng.normal(0, 3e-4, 200), 46.7)
+    query_lon = np.append(lon[points]+rng.normal(0, 3e-4, 200), 15.75)
+    found = index.nearest_segments(query_lat, query_lon)
+    px, py = index.project(query_lat, query_lon)
+    for i in range(len(px)):
+        distances, _ = index._distances(np.arange(n-1), px[i], py[i])
+        np.testing.assert_allclose(found['distance'][i], distances.min(),
+                rtol=1e-9)
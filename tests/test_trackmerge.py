@@ -0,0 +1,56 @@
+import numpy as np
+
+from GPSOverlay.trackmerge import merge_sorted, align_channel
+
+
+def test_merge_sorted_same_as_stable_sort():
+    rng = np.random.RandomState(3)
+    arrays = [np.sort(rng.randint(0, 1000, size)) for size in
+            (0, 1, 57, 300, 300, 12)]
+    merged, sources = merge_sorted(arrays)
+    values = np.concatenate(arrays)
+    array_ids = np.concatenate([np.full(len(a), i) for i, a in
+        enumerate(arrays)])
+    order = np.argsort(values, kind='stable')
+    assert merged.tolist() == values[order].tolist()
+    assert sources.tolist() == array_ids[order].tolist()
+
+
+def test_merge_sorted_empty():
+    merged, sources = merge_sorted([])
+    assert len(merged) == 0 and len(sources) == 0
+
+
+def align_channel_loop(times, source_times, values, max_gap):
+    """align_channel for one time at a time"""
+    result = []
+    for t in times:
+        after = min(np.searchsorted(source_times, t), len(source_times)-1)
+        before = max(after-1, 0)
+        gap_before = abs(t-source_times[before])
+        gap_after = abs(source_times[after]-t)
+        if gap_before <= max_gap and gap_after <= max_gap:
+            result.append(np.interp(t, source_times, values))
+        elif min(gap_before, gap_after) <= max_gap:
+            result.append(values[before] if gap_before <= gap_after else
+                    values[after])
+        else:
+            result.append(np.nan)
+    return np.array(result)
+
+
+def test_align_channel_same_as_loop():
+    rng = np.random.RandomState(4)
+    source_times = np.cumsum(rng.randint(1, 30, 200)).astype(np.int64)
+    values = rng.normal(0, 10, 200)
+    times = np.sort(rng.randint(-50, source_times[-1]+50, 500))
+    for max_gap in (0, 5, 20):
+        np.testing.assert_array_equal(
+                align_channel(times, source_times, values, max_gap),
+                align_channel_loop(times, source_times, values, max_gap))
+
+
+def test_align_channel_without_source():
+    result = align_channel(np.arange(3), np.empty(0, dtype=np.int64),
+            np.empty(0), 10)
+    assert np.isnan(result).all()